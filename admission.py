@@ -0,0 +1,171 @@
+"""
+Admission control and load shedding for the webhook pipeline.
+Each kind of expensive work (LLM extraction, browser booking) gets its own
+budget: a concurrency limit plus a bounded FIFO wait queue with a deadline.
+Work beyond that is shed with a Retry-After hint instead of piling up.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+
+from metrics import LatencyStats
+
+ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "16"))
+ADMISSION_LLM_QUEUE = int(os.getenv("ADMISSION_LLM_QUEUE", "200"))
+ADMISSION_LLM_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_LLM_QUEUE_TIMEOUT", "10"))
+ADMISSION_BOOKING_CONCURRENCY = int(os.getenv("ADMISSION_BOOKING_CONCURRENCY", "4"))
+ADMISSION_BOOKING_QUEUE = int(os.getenv("ADMISSION_BOOKING_QUEUE", "20"))
+ADMISSION_BOOKING_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_BOOKING_QUEUE_TIMEOUT", "30"))
+# Buckets being collected at once; new users beyond this are turned away
+MAX_ACTIVE_BUCKETS = int(os.getenv("MAX_ACTIVE_BUCKETS", "10000"))
+
+_MAX_RETRY_AFTER = 60
+
+
+class Overloaded(Exception):
+    """Raised when a budget cannot admit more work."""
+
+    def __init__(self, budget: str, retry_after: int, reason: str = "queue full"):
+        super().__init__(f"{budget} budget overloaded ({reason})")
+        self.budget = budget
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Budget:
+    """Concurrency limit with a bounded, deadline-limited FIFO wait queue."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.service_time = LatencyStats()
+        self.queue_time = LatencyStats()
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def saturated(self) -> bool:
+        """Whether a new request would be shed right now."""
+        return self.in_flight >= self.limit and self.waiting >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait, from queue depth and service time."""
+        typical = self.service_time.percentile(50) or 1.0
+        estimate = typical * (self.waiting + 1) / max(1, self.limit)
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    def reject(self, reason: str = "queue full") -> Overloaded:
+        """Count a shed request and build the matching error."""
+        self.shed += 1
+        return Overloaded(self.name, self.retry_after(), reason)
+
+    async def _acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            raise self.reject()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise self.reject("queue deadline exceeded")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        self.queue_time.record(time.perf_counter() - queued_at)
+
+    def _abandon(self, waiter: asyncio.Future):
+        """Leave the queue; pass on a slot that was handed over in the meantime."""
+        if waiter.done() and not waiter.cancelled():
+            self._release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self):
+        # Hand the slot straight to the next live waiter, else free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one unit of this budget; raises Overloaded if it cannot be had."""
+        await self._acquire()
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.service_time.record(time.perf_counter() - started)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "retry_after": self.retry_after(),
+            "queue_time": self.queue_time.snapshot(),
+            "service_time": self.service_time.snapshot(),
+        }
+
+
+class AdmissionController:
+    """Named budgets for the pipeline's expensive stages."""
+
+    def __init__(self):
+        self.llm = Budget("llm", ADMISSION_LLM_CONCURRENCY, ADMISSION_LLM_QUEUE, ADMISSION_LLM_QUEUE_TIMEOUT)
+        self.booking = Budget(
+            "booking", ADMISSION_BOOKING_CONCURRENCY, ADMISSION_BOOKING_QUEUE, ADMISSION_BOOKING_QUEUE_TIMEOUT
+        )
+        self.max_active_buckets = MAX_ACTIVE_BUCKETS
+        self.buckets_shed = 0
+
+    def check_new_bucket(self, active_buckets: int):
+        """Refuse a new conversation bucket when the pipeline is already full."""
+        if active_buckets >= self.max_active_buckets:
+            self.buckets_shed += 1
+            raise Overloaded("buckets", self.llm.retry_after(), "too many active buckets")
+        if self.llm.saturated():
+            raise self.llm.reject()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "llm": self.llm.stats(),
+            "booking": self.booking.stats(),
+            "buckets": {"max_active": self.max_active_buckets, "shed": self.buckets_shed},
+        }
+
+
+# Global admission controller
+admission = AdmissionController()
@@ -1,6 +1,7 @@
 import asyncio
 from typing import Optional, Dict, Any
 from playwright.async_api import async_playwright, Page, Browser
+from browser_pool import browser_pool
 from simple_storage import (
     load_session,
     save_session,
@@ -86,6 +87,8 @@ class AuthManager:
                     session_data = await page.context.storage_state()
                     save_session(uid, session_data)
                     update_user_status(uid, "completed", authenticated=True)
+                    # Open a booking page with the new session before the first ride request
+                    browser_pool.keep_warm(uid, new_session=True)
                     await self._cleanup_browser(uid)
                     return "completed"
 
@@ -190,6 +193,7 @@ class AuthManager:
                 session_data = await page.context.storage_state()
                 save_session(uid, session_data)
                 update_user_status(uid, "completed", authenticated=True)
+                browser_pool.keep_warm(uid, new_session=True)
                 await self._cleanup_browser(uid)
                 return "completed"
 
@@ -0,0 +1,168 @@
+"""
+Incremental parsing for batched webhook payloads.
+Accepts either NDJSON (one record per line) or a single JSON array of records
+and yields each record as soon as it is complete in the byte stream.
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class BatchRecordError(ValueError):
+    """A single record in the batch could not be parsed."""
+
+
+async def iter_batch_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    Yield parsed records from a streamed request body.
+    Malformed records are yielded as BatchRecordError instances so one bad
+    line does not abort the rest of the batch.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    mode: Optional[str] = None
+
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        if mode is None:
+            stripped = buffer.lstrip(_WHITESPACE)
+            if not stripped:
+                continue
+            if stripped[0] == "[":
+                mode = "array"
+                buffer = stripped[1:]
+            else:
+                mode = "ndjson"
+
+        if mode == "ndjson":
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        else:
+            records, buffer, done = _drain_array(buffer)
+            for record in records:
+                yield record
+            if done:
+                return
+
+    buffer += utf8.decode(b"", final=True)
+    if mode == "ndjson" and buffer.strip():
+        yield _parse_line(buffer)
+    elif mode == "array":
+        records, buffer, done = _drain_array(buffer)
+        for record in records:
+            yield record
+        if not done:
+            yield BatchRecordError("Unterminated JSON array")
+
+
+def _parse_line(line: str) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return BatchRecordError(f"Invalid NDJSON line: {e}")
+
+
+def _drain_array(buffer: str) -> Tuple[list, str, bool]:
+    """Decode every complete array element in buffer; return (records, rest, closed)."""
+    records = []
+    pos = 0
+    length = len(buffer)
+    while True:
+        while pos < length and (buffer[pos] in _WHITESPACE or buffer[pos] == ","):
+            pos += 1
+        if pos >= length:
+            return records, "", False
+        if buffer[pos] == "]":
+            return records, "", True
+        try:
+            record, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            end = _element_end(buffer, pos)
+            if end is None:
+                # Element not complete yet, wait for more bytes
+                return records, buffer[pos:], False
+            # Complete but malformed: report it and resync at the next element
+            records.append(BatchRecordError(f"Invalid array element: {e}"))
+            pos = end
+            continue
+        records.append(record)
+        pos = end
+
+
+def _element_end(buffer: str, pos: int) -> Optional[int]:
+    """Index of the top-level ',' or ']' that ends the element at pos, or None if not buffered yet."""
+    depth = 0
+    in_string = escaped = False
+    for i in range(pos, len(buffer)):
+        ch = buffer[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            if depth == 0:
+                return i
+            depth -= 1
+        elif ch == "," and depth == 0:
+            return i
+    return None
+
+
+def parse_batch_record(record: Any) -> Tuple[Optional[str], list, Optional[float], Optional[float]]:
+    """
+    Normalize one batch record to (uid, segments, gps_lat, gps_lon).
+    GPS may be given as "gps": {"lat", "lon"} or as flat gps_lat/gps_lon.
+    """
+    if not isinstance(record, dict):
+        raise BatchRecordError("Record is not a JSON object")
+
+    segments = record.get("segments") or []
+    if not isinstance(segments, list):
+        raise BatchRecordError("segments must be a list")
+    segments = [
+        {"text": _string_field(s, "text"), "speaker": _string_field(s, "speaker")}
+        for s in segments
+        if isinstance(s, dict)
+    ]
+
+    uid = record.get("uid")
+    if uid is not None and not isinstance(uid, str):
+        raise BatchRecordError("uid must be a string")
+
+    gps: Dict[str, Any] = record.get("gps") or {}
+    gps_lat = gps.get("lat", record.get("gps_lat")) if isinstance(gps, dict) else record.get("gps_lat")
+    gps_lon = gps.get("lon", record.get("gps_lon")) if isinstance(gps, dict) else record.get("gps_lon")
+    return uid, segments, _coordinate(gps_lat), _coordinate(gps_lon)
+
+
+def _string_field(segment: Dict[str, Any], key: str) -> str:
+    value = segment.get(key)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise BatchRecordError(f"segment {key} must be a string")
+    return value
+
+
+def _coordinate(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise BatchRecordError("GPS coordinates must be numbers")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BatchRecordError("GPS coordinates must be numbers")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Booking log append and query latency.
+Appends --bookings bookings for --users users and compares the append with
+what record_booking did before: a read-modify-write of the user's JSON file
+to overwrite last_booking. Then times "last 10 bookings for a uid", a one-hour
+range for one uid and for everyone, reopening the log (index rebuilt from
+segment sidecars), and compaction down to 20 bookings per user.
+
+Usage: python benchmarks/bench_booking_log.py [--bookings 200000] [--users 5000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from booking_log import BookingLog
+from metrics import LatencyStats
+from simple_storage import FileBackend, _new_user
+
+
+def booking(rng: random.Random, i: int) -> dict:
+    return {
+        "destination": f"{rng.randrange(1, 999)} Main St → Stop {i}",
+        "driver_name": rng.choice(["Alex", "Sam", "Priya", "Jordan"]),
+        "eta": f"{rng.randrange(2, 15)} min",
+        "timestamp": "2026-10-17T12:00:00",
+    }
+
+
+def measure(op, count: int) -> LatencyStats:
+    stats = LatencyStats(window=count)
+    for i in range(count):
+        started = time.perf_counter()
+        op(i)
+        stats.record(time.perf_counter() - started)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--fsync", action="store_true", help="fsync every append (the app default)")
+    args = parser.parse_args()
+
+    rng = random.Random(23)
+    uids = [f"user{i}" for i in range(args.users)]
+    bookings = [(rng.choice(uids), booking(rng, i)) for i in range(args.bookings)]
+    workdir = Path(tempfile.mkdtemp())
+    rows = []
+    try:
+        files = FileBackend(workdir / "users", workdir / "sessions")
+        files.write_users({uid: _new_user(uid) for uid in uids})
+
+        def overwrite(i):
+            uid, data = bookings[i]
+            record = files.read_user(uid)
+            record["last_booking"] = data
+            files.write_users({uid: record})
+
+        rows.append(("last_booking rmw", measure(overwrite, min(args.queries, args.bookings))))
+
+        log = BookingLog(str(workdir / "bookings"), fsync=args.fsync)
+        rows.append(("append", measure(lambda i: log.append(*bookings[i]), args.bookings)))
+        first = log.between(0, float("inf"))[0]["ts"]
+        last = log.last(bookings[-1][0])[0]["ts"]
+        span = max(last - first, 1e-6)
+        starts = [first + rng.random() * span for _ in range(args.queries)]
+        hour = span / 24  # the run stands in for a day of bookings
+        rows.append(("last 10", measure(lambda i: log.last(rng.choice(uids), 10), args.queries)))
+        rows.append(("range uid", measure(lambda i: log.between(starts[i], starts[i] + hour, rng.choice(uids)), args.queries)))
+        rows.append(("range all", measure(lambda i: log.between(starts[i], starts[i] + hour), max(1, args.queries // 20))))
+        stats = log.stats()
+        log.close()
+
+        started = time.perf_counter()
+        log = BookingLog(str(workdir / "bookings"), fsync=args.fsync)
+        reopen = time.perf_counter() - started
+        started = time.perf_counter()
+        removed = log.compact(keep_per_user=20)
+        compaction = time.perf_counter() - started
+        after = log.stats()
+        log.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{stats['bookings']:,} bookings, {stats['users']:,} users, {stats['segments']} segments, {stats['bytes'] / 1e6:.1f} MB")
+    print(f"reopen (index from sidecars): {reopen * 1000:.0f} ms")
+    print(f"compaction to 20 per user: {compaction:.2f}s, {removed:,} removed, {after['segments']} segments left\n")
+    print(f"{'operation':<18} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, latency in rows:
+        print(f"{name:<18} {latency.count:>7} {latency.percentile(50) * 1000:>8.3f} {latency.percentile(99) * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
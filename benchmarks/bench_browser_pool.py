@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Browser memory per active user and context acquisition latency.
+Opens a page for --users users two ways: one Chromium process per user (the
+previous BrowserPool design) and the shared pool (BROWSER_POOL_SIZE browsers
+with users as BrowserContexts). It reports the proportional set size (PSS)
+of all browser processes divided by the number of users, so pages shared
+between Chromium processes are not counted twice, and the first (cold) and
+repeat (warm) acquisition latency. It then times acquire() for a booking
+against a local stand-in for the booking form: a cold page (navigate, wait
+for the form, plus the fixed 2 s settle book_ride used to sleep) versus a
+warm page parked on the form. Needs Chromium: `playwright install chromium`.
+
+Usage: python benchmarks/bench_browser_pool.py [--users 20] [--browsers 2] [--contexts 16] [--url about:blank]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from playwright.async_api import async_playwright
+
+from browser_pool import BROWSER_ARGS, BrowserPool
+from metrics import LatencyStats
+
+
+def _descendants(pid: int) -> list:
+    parents = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        parents.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    found, todo = [], [pid]
+    while todo:
+        children = parents.get(todo.pop(), [])
+        found.extend(children)
+        todo.extend(children)
+    return found
+
+
+def memory_mb() -> float:
+    """PSS (RSS where unavailable) of every process started below this one, in MB."""
+    total = 0
+    for pid in _descendants(os.getpid()):
+        for name, key in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+            try:
+                lines = Path(f"/proc/{pid}/{name}").read_text().splitlines()
+            except OSError:
+                continue
+            values = [int(line.split()[1]) for line in lines if line.startswith(key)]
+            if values:
+                total += values[0]
+                break
+    return total / 1024
+
+
+async def per_user_browsers(users: int, url: str):
+    """The previous design: chromium.launch for every uid."""
+    playwright = await async_playwright().start()
+    cold, warm = LatencyStats(window=users), LatencyStats(window=users)
+    browsers, pages = [], []
+    baseline = memory_mb()
+    try:
+        for _ in range(users):
+            started = time.perf_counter()
+            browser = await playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+            context = await browser.new_context()
+            page = await context.new_page()
+            await page.goto(url)
+            cold.record(time.perf_counter() - started)
+            browsers.append(browser)
+            pages.append(page)
+        for page in pages:
+            started = time.perf_counter()
+            page.is_closed()
+            warm.record(time.perf_counter() - started)
+        used = memory_mb() - baseline
+    finally:
+        for browser in browsers:
+            await browser.close()
+        await playwright.stop()
+    return used, cold, warm
+
+
+async def shared_pool(users: int, url: str, browsers: int, contexts: int):
+    pool = BrowserPool(size=browsers, contexts_per_browser=contexts)
+    cold, warm = LatencyStats(window=users), LatencyStats(window=users)
+    await pool.initialize()
+    baseline = memory_mb()
+    try:
+        for i in range(users):
+            started = time.perf_counter()
+            page = await pool.get_or_create_browser(f"user{i}", {"cookies": [], "origins": []})
+            await page.goto(url)
+            cold.record(time.perf_counter() - started)
+        for i in range(users):
+            started = time.perf_counter()
+            await pool.get_or_create_browser(f"user{i}", {})
+            warm.record(time.perf_counter() - started)
+        used = memory_mb() - baseline
+        stats = pool.stats()
+    finally:
+        await pool.shutdown()
+    return used, cold, warm, stats
+
+
+class _BookingForm(BaseHTTPRequestHandler):
+    """Serves a page whose pickup input appears after a short script delay, like a real SPA."""
+
+    def do_GET(self):
+        body = (b"<html><body><script>setTimeout(() => document.body.innerHTML ="
+                b" '<input placeholder=\"Where from?\">', 300)</script></body></html>")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def warm_vs_cold(users: int, url: str):
+    """acquire() latency for bookings on cold pages (with the old fixed settle) and on warm ones."""
+    pool = BrowserPool(size=1, contexts_per_browser=users, warm_contexts=users, url=url)
+    cold, warm = LatencyStats(window=users), LatencyStats(window=users)
+    try:
+        for i in range(users):
+            started = time.perf_counter()
+            _, was_warm = await pool.acquire(f"user{i}", {"cookies": [], "origins": []})
+            await asyncio.sleep(2)  # book_ride's former fixed wait after navigating
+            cold.record(time.perf_counter() - started)
+            assert not was_warm
+            await pool.release(f"user{i}")
+        for i in range(users):
+            started = time.perf_counter()
+            _, was_warm = await pool.acquire(f"user{i}", {})
+            warm.record(time.perf_counter() - started)
+            assert was_warm
+            pool.release(f"user{i}")
+        await asyncio.gather(*pool._park_tasks)
+        stats = pool.stats()["warm"]
+    finally:
+        await pool.shutdown()
+    return cold, warm, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--browsers", type=int, default=2)
+    parser.add_argument("--contexts", type=int, default=16)
+    parser.add_argument("--url", default="about:blank")
+    args = parser.parse_args()
+
+    try:
+        old = asyncio.run(per_user_browsers(args.users, args.url))
+        new = asyncio.run(shared_pool(args.users, args.url, args.browsers, args.contexts))
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _BookingForm)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        form_url = f"http://127.0.0.1:{server.server_address[1]}/"
+        booking = asyncio.run(warm_vs_cold(min(args.users, 8), form_url))
+        server.shutdown()
+    except Exception as e:
+        if "Executable doesn't exist" in str(e):
+            sys.exit("Chromium is not installed; run `playwright install chromium` first")
+        raise
+
+    print(f"{args.users} users; shared pool ran {new[3]['browsers']} browsers, load {new[3]['load']}\n")
+    print(f"{'design':<18} {'MB/user':>8} {'cold p50 ms':>12} {'cold p99 ms':>12} {'warm p50 ms':>12}")
+    for name, (used, cold, warm, *_) in (("browser per user", old), ("shared contexts", new)):
+        print(f"{name:<18} {used / args.users:>8.1f} {cold.percentile(50) * 1000:>12.1f} "
+              f"{cold.percentile(99) * 1000:>12.1f} {warm.percentile(50) * 1000:>12.3f}")
+
+    cold, warm, stats = booking
+    print(f"\nbooking page acquire ({stats['hits']} warm hits, {stats['misses']} cold misses)")
+    print(f"{'page':<18} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, latency in (("cold + 2 s settle", cold), ("warm (parked)", warm)):
+        print(f"{name:<18} {latency.percentile(50) * 1000:>8.1f} {latency.percentile(99) * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
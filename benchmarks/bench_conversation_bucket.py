@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for per-user conversation buckets.
+Compares the old segment_buckets dict (segment list plus f"{uid}_..." side
+keys) with ConversationBucket for many simulated users, both while buckets
+are live and after every bucket has been flushed.
+
+Usage: python benchmarks/bench_conversation_bucket.py [--users 100000]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_bucket import ConversationBucket
+from silence_scheduler import SilenceTimer
+
+SEGMENTS_PER_USER = 3
+
+
+def _segments(i: int):
+    return [{"text": f"segment {j} from user {i}", "speaker": "SPEAKER_0"} for j in range(SEGMENTS_PER_USER)]
+
+
+def _measure(build, flush, users: int):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    state = build(users)
+    live = tracemalloc.get_traced_memory()[0] - base
+
+    start = time.perf_counter()
+    flush(state, users)
+    flush_time = time.perf_counter() - start
+    gc.collect()
+    leaked = tracemalloc.get_traced_memory()[0] - base
+
+    tracemalloc.stop()
+    return live, leaked, flush_time
+
+
+def _build_dict(users: int):
+    segment_buckets, segment_last_arrival, bucket_timers = {}, {}, {}
+    now = time.time()
+    for i in range(users):
+        uid = f"user_{i}"
+        segment_buckets[uid] = []
+        segment_buckets[f"{uid}_phone_ip"] = "10.0.0.1"
+        segment_buckets[f"{uid}_gps_lat"] = 37.7749
+        segment_buckets[f"{uid}_gps_lon"] = -122.4194
+        segment_buckets[uid].extend(_segments(i))
+        segment_last_arrival[uid] = now
+        bucket_timers[uid] = SilenceTimer(uid, now)
+    return segment_buckets, segment_last_arrival, bucket_timers
+
+
+def _flush_dict(state, users: int):
+    segment_buckets, segment_last_arrival, bucket_timers = state
+    for i in range(users):
+        uid = f"user_{i}"
+        del segment_buckets[uid]
+        del segment_last_arrival[uid]
+        del bucket_timers[uid]
+
+
+def _build_buckets(users: int):
+    segment_buckets = {}
+    now = time.time()
+    for i in range(users):
+        uid = f"user_{i}"
+        bucket = segment_buckets[uid] = ConversationBucket(uid)
+        bucket.update_location("10.0.0.1", 37.7749, -122.4194)
+        bucket.add(_segments(i), now)
+        bucket.timer = SilenceTimer(uid, now)
+    return segment_buckets
+
+
+def _flush_buckets(segment_buckets, users: int):
+    for i in range(users):
+        segment_buckets.pop(f"user_{i}").clear()
+
+
+def main(users: int):
+    print(f"{users:,} users x {SEGMENTS_PER_USER} segments")
+    print(f"{'layout':<22} {'live MB':>9} {'after flush MB':>15} {'flush ms':>9}")
+    for name, build, flush in (
+        ("dict + side keys", _build_dict, _flush_dict),
+        ("ConversationBucket", _build_buckets, _flush_buckets),
+    ):
+        live, leaked, flush_time = _measure(build, flush, users)
+        print(f"{name:<22} {live / 1e6:>9.1f} {leaked / 1e6:>15.2f} {flush_time * 1e3:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000, help="simulated concurrent users")
+    args = parser.parse_args()
+    main(args.users)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+detect_trigger_and_destinations throughput per extraction backend, fully offline.
+Starts llm_standin_server.py on a local port (latency and error injection
+from the flags below), then drives the same mixed utterance stream through
+the rule-based backend and through the chat-completions client pointed at
+the stand-in. Reports req/s, p50/p95 latency and failed extractions.
+
+Usage: python benchmarks/bench_extraction_backends.py [--utterances 500] [--latency-ms 200] [--error-rate 0.02]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ride_detector
+from extraction_backends import RuleBasedBackend, StandInBackend, set_backend
+from intent_cache import IntentCache
+from metrics import LatencyStats
+
+_UTTERANCES = [
+    "can you book me an uber from SJSU to the airport",
+    "get me a ride to the Palace of Fine Arts",
+    "take me to union square please",
+    "I need a ride home from work",
+    "what did you have for lunch today",
+    "the weather is nice this weekend",
+    "remind me to call mom later",
+    "did you watch the game last night",
+]
+
+
+def _start_standin(port: int, args) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "llm_standin_server.py"), "--port", str(port),
+         "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+         "--token-ms", str(args.token_ms), "--error-rate", str(args.error_rate), "--seed", "13"],
+        cwd=ROOT,
+        start_new_session=True,
+    )
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    os.killpg(proc.pid, signal.SIGTERM)
+    raise RuntimeError("stand-in server did not start")
+
+
+async def _run(backend, texts, concurrency: int):
+    set_backend(backend)
+    ride_detector.intent_cache = IntentCache(max_entries=0, path="")
+    latency = LatencyStats(window=len(texts))
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(text: str):
+        async with limit:
+            start = time.perf_counter()
+            await ride_detector.detect_trigger_and_destinations([{"text": text}])
+            latency.record(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(text) for text in texts))
+    finally:
+        await backend.close()
+    return time.perf_counter() - start, latency.snapshot(), backend.stats()["failures"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--utterances", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64, help="utterances in flight at once")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    # Injected errors should show up as failures, not be retried away
+    ride_detector.LLM_MAX_RETRIES = 0
+    texts = [f"{_UTTERANCES[i % len(_UTTERANCES)]} #{i}" for i in range(args.utterances)]
+    proc = _start_standin(args.port, args)
+    try:
+        # ride_detector logs every extraction with print()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rules = asyncio.run(_run(RuleBasedBackend(), texts, args.concurrency))
+            standin = asyncio.run(_run(StandInBackend(f"http://127.0.0.1:{args.port}/v1"), texts, args.concurrency))
+    finally:
+        set_backend(None)
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+    print(f"{args.utterances} utterances, {args.concurrency} in flight; stand-in {args.latency_ms:.0f}"
+          f"±{args.jitter_ms:.0f} ms + {args.token_ms:.0f} ms/token, {args.error_rate:.0%} injected errors\n")
+    print(f"{'backend':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'failures':>9}")
+    for name, (elapsed, lat, failures) in (("rules", rules), ("standin", standin)):
+        print(f"{name:<10} {args.utterances / elapsed:>8.0f} {lat['p50_ms']:>8.1f} {lat['p95_ms']:>8.1f} {failures:>9}")
+
+
+if __name__ == "__main__":
+    main()
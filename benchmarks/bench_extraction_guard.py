@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tail latency and dropped extractions with and without the extraction guard.
+Both runs call the LLM backend against the in-process chat-completions
+stand-in, with a share of requests stuck behind a slow replica and a share
+failing outright. The raw backend waits out every slow answer and drops every
+failure; the guarded one hedges after the observed p95, retries with jitter
+and, once its latency budget is spent, answers with the local parser.
+
+Usage: python benchmarks/bench_extraction_guard.py [--utterances 400] [--slow-rate 0.05] [--error-rate 0.05]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ride_detector
+from extraction_backends import GuardedBackend, LLMBackend
+from llm_standin_server import create_standin_app
+from metrics import LatencyStats
+
+
+async def _run(guarded: bool, args):
+    standin = create_standin_app(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_ms=0,
+        error_rate=args.error_rate, slow_rate=args.slow_rate, slow_ms=args.slow_ms, seed=14,
+    )
+    ride_detector.set_llm_client(AsyncOpenAI(
+        api_key="bench", base_url="http://standin/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=standin)),
+    ))
+    ride_detector.LLM_BATCHING = False
+    backend = GuardedBackend(LLMBackend(), budget=args.budget_ms / 1000) if guarded else LLMBackend()
+    latency = LatencyStats(window=args.utterances)
+    outcome = {"dropped": 0, "fallback": 0}
+
+    async def one(i: int):
+        await asyncio.sleep(i / args.rate)
+        text = f"get me a ride to pier {i}" if i % 3 == 0 else f"chatting about dinner plans {i}"
+        start = time.perf_counter()
+        try:
+            await backend.extract(text)
+        except Exception:
+            outcome["fallback" if guarded else "dropped"] += 1
+            if guarded:
+                ride_detector.parse_ride_request(text)
+        latency.record(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(one(i) for i in range(args.utterances)))
+    finally:
+        await backend.close()
+    return latency, outcome, backend.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--utterances", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=100, help="utterances per second")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=4000)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    # ride_detector logs every extraction with print()
+    with contextlib.redirect_stdout(io.StringIO()):
+        raw = asyncio.run(_run(False, args))
+        guarded = asyncio.run(_run(True, args))
+
+    print(f"{args.utterances} utterances at {args.rate:.0f}/s; stand-in {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+          f"{args.slow_rate:.0%} slow ({args.slow_ms:.0f} ms), {args.error_rate:.0%} errors\n")
+    print(f"{'backend':<9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'dropped':>8} {'fallback':>9}")
+    for name, (latency, outcome, _) in (("raw", raw), ("guarded", guarded)):
+        snap = latency.snapshot()
+        print(f"{name:<9} {snap['p50_ms']:>8.0f} {snap['p95_ms']:>8.0f} {latency.percentile(99) * 1000:>8.0f} "
+              f"{snap['max_ms']:>8.0f} {outcome['dropped']:>8} {outcome['fallback']:>9}")
+    guard = guarded[2]["guard"]
+    print(f"\nhedged {guard['hedged']} (won {guard['hedge_wins']}), retried {guard['retried']}, "
+          f"budget exhausted {guard['budget_exhausted']}, breaker {guard['breaker']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Gazetteer build time, lookup latency and correction accuracy at scale.
+Indexes data/places.tsv plus --places synthetic street addresses, then looks
+up transcribed variants of known entries (city left out, "N" for "North",
+one word with a dropped, swapped or doubled letter or soundalike vowels)
+and checks that each resolves to the address it came from.
+
+Usage: python benchmarks/bench_gazetteer.py [--places 1000000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gazetteer import GAZETTEER_PATH, Gazetteer, load_places
+from metrics import LatencyStats
+
+_SYLLABLES = ["al", "ma", "den", "san", "ta", "ro", "sa", "ver", "mont", "gom", "lin", "coln", "ber", "ry",
+              "es", "sex", "wood", "ha", "ven", "cas", "tro", "mi", "ra", "lo", "fair", "oaks", "pine", "dale"]
+_TYPES = ["Ave", "St", "Blvd", "Rd", "Dr", "Way", "Ln", "Ct"]
+_DIRECTIONS = ["", "", "N ", "S ", "E ", "W "]
+_CITIES = ["San Jose", "Santa Clara", "Sunnyvale", "Mountain View", "Palo Alto", "Cupertino", "Milpitas",
+           "Campbell", "Fremont", "Oakland", "San Francisco", "Redwood City", "San Mateo", "Berkeley"]
+_SPELLED_OUT = {"N": "North", "S": "South", "E": "East", "W": "West", "Ave": "Avenue", "St": "Street",
+                "Blvd": "Boulevard", "Rd": "Road", "Dr": "Drive", "Ln": "Lane", "Ct": "Court"}
+
+
+def synthetic_places(n: int, rng: random.Random):
+    streets = sorted({"".join(rng.sample(_SYLLABLES, rng.randint(2, 3))).capitalize() for _ in range(20000)})
+    seen = set()
+    while len(seen) < n:
+        address = (f"{rng.randint(1, 9999)} {rng.choice(_DIRECTIONS)}{rng.choice(streets)} "
+                   f"{rng.choice(_TYPES)}, {rng.choice(_CITIES)}")
+        if address not in seen:
+            seen.add(address)
+            yield address, []
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4 or word.isdigit():
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:]  # dropped letter
+    if kind == 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]  # swapped letters
+    if kind == 2:
+        return word[:i] + word[i] + word[i:]  # doubled letter
+    vowels = "aeiou"
+    return "".join(rng.choice(vowels) if c in vowels and rng.random() < 0.5 else c for c in word)  # soundalike
+
+
+def spoken_variant(address: str, rng: random.Random) -> str:
+    """How a transcript might render the address: no city, one misspelled word, lower case, abbreviations toggled."""
+    words = address.split(",")[0].split()
+    words = [_SPELLED_OUT.get(w, w) if rng.random() < 0.5 else w for w in words]
+    i = max(range(len(words)), key=lambda j: len(words[j]) if not words[j].isdigit() else 0)
+    words[i] = _typo(words[i], rng)
+    return " ".join(words).lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--places", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(15)
+
+    places = load_places(GAZETTEER_PATH) + list(synthetic_places(args.places, rng))
+    start = time.perf_counter()
+    gazetteer = Gazetteer().build(places)
+    build = time.perf_counter() - start
+    index_mb = (gazetteer._postings.nbytes + gazetteer._offsets.nbytes + gazetteer._doc_place.nbytes) / 2**20
+
+    latency = LatencyStats(window=args.queries)
+    correct = wrong = unmatched = 0
+    for _ in range(args.queries):
+        address = rng.choice(places)[0] if rng.random() < 0.9 else rng.choice(places[:50])[0]
+        query = spoken_variant(address, rng)
+        start = time.perf_counter()
+        found = gazetteer.match(query)
+        latency.record(time.perf_counter() - start)
+        if found is None:
+            unmatched += 1
+        elif found[0] == address:
+            correct += 1
+        else:
+            wrong += 1
+
+    snap = latency.snapshot()
+    print(f"{len(places):,} places ({gazetteer.stats()['features']:,} features), built in {build:.1f}s, "
+          f"postings {index_mb:.0f} MB\n")
+    print(f"{args.queries} misspelled lookups: p50 {snap['p50_ms']:.3f} ms, p95 {snap['p95_ms']:.3f} ms, "
+          f"max {snap['max_ms']:.3f} ms")
+    print(f"corrected to the right place {correct / args.queries:.1%}, wrong place {wrong / args.queries:.1%}, "
+          f"left unchanged {unmatched / args.queries:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Ride-intent cache: per-utterance extraction latency with and without the cache.
+Replays a skewed stream of utterances (a few phrasings make up most traffic,
+with casing, punctuation and filler variations) through
+validate_and_extract_ride_request against a mock LLM with fixed latency.
+
+Usage: python benchmarks/bench_intent_cache.py [--utterances 2000] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ride_detector
+from intent_cache import IntentCache
+from metrics import LatencyStats
+from mock_llm import mock_client
+
+_PHRASES = [
+    "book an uber home",
+    "get me a ride to the office",
+    "book an uber to SJSU",
+    "call an uber to the airport",
+    "what time is the meeting",
+    "did you see the game last night",
+    "let's grab lunch later",
+]
+_DECORATIONS = ["{}", "Um, {}", "{} please", "{}.", "Hey Omi, {}!", "{}?", "uh {}"]
+
+
+def _utterances(count: int, rng: random.Random):
+    weights = [1 / (rank + 1) for rank in range(len(_PHRASES))]
+    for _ in range(count):
+        if rng.random() < 0.15:
+            # Long tail of one-off chatter
+            yield f"random chatter number {rng.randrange(10**9)}"
+        else:
+            phrase = rng.choices(_PHRASES, weights)[0]
+            yield rng.choice(_DECORATIONS).format(phrase)
+
+
+async def _replay(utterances, cache: IntentCache, latency: float) -> LatencyStats:
+    ride_detector.intent_cache = cache
+    ride_detector.set_llm_client(mock_client(
+        lambda prompt: "YES|NOT_FOUND|SJSU" if "uber" in prompt.split('User text: "', 1)[-1].lower() else "NO|NOT_FOUND|NOT_FOUND", latency=latency
+    ))
+    stats = LatencyStats(window=len(utterances))
+    try:
+        for text in utterances:
+            start = time.perf_counter()
+            await ride_detector.validate_and_extract_ride_request(text)
+            stats.record(time.perf_counter() - start)
+    finally:
+        await ride_detector.close_llm_client()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--utterances", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated LLM round-trip in seconds")
+    args = parser.parse_args()
+
+    utterances = list(_utterances(args.utterances, random.Random(7)))
+    db = os.path.join(tempfile.mkdtemp(prefix="bench_intent_"), "intents.db")
+    # ride_detector logs every extraction with print()
+    with contextlib.redirect_stdout(io.StringIO()):
+        uncached = asyncio.run(_replay(utterances[:200], IntentCache(max_entries=0, path=""), args.latency))
+        cache = IntentCache(path=db)
+        cached = asyncio.run(_replay(utterances, cache, args.latency))
+        cache_stats = cache.stats()
+        cache.close()
+        # A restarted process reads the same file
+        restarted = IntentCache(path=db)
+        warm = asyncio.run(_replay(utterances[:200], restarted, args.latency))
+
+    print(f"{args.utterances} utterances, {args.latency * 1000:.0f} ms simulated LLM latency\n")
+    print(f"{'run':<22} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, stats in (("no cache (200)", uncached), ("cache", cached), ("after restart (200)", warm)):
+        snap = stats.snapshot()
+        print(f"{name:<22} {snap['mean_ms']:>9.3f} {snap['p50_ms']:>9.3f} {snap['p95_ms']:>9.3f}")
+    print(f"\ncache stats: {cache_stats}")
+    print(f"after restart: {restarted.stats()}")
+    restarted.close()
+
+
+if __name__ == "__main__":
+    main()
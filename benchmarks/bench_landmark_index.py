@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Nearest-landmark lookups on the grid index versus a full haversine scan.
+Generates --landmarks points clustered around Bay Area cities, builds and
+saves the index, reopens it memory-mapped (the startup path), then times
+lookups for random pickup points and checks every answer against the scan.
+
+Usage: python benchmarks/bench_landmark_index.py [--landmarks 500000] [--queries 2000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from landmark_index import EARTH_RADIUS_KM, LANDMARK_MAX_DISTANCE_KM, LandmarkIndex
+from metrics import LatencyStats
+
+# (lat, lon, spread in degrees)
+_CITIES = [(37.7749, -122.4194, 0.05), (37.3382, -121.8863, 0.08), (37.8044, -122.2712, 0.05),
+           (37.4419, -122.1430, 0.04), (37.3688, -122.0363, 0.04), (37.5485, -121.9886, 0.05)]
+
+
+def synthetic_landmarks(n: int, rng: np.random.Generator):
+    city = rng.integers(len(_CITIES), size=n)
+    centers = np.array(_CITIES)[city]
+    lat = centers[:, 0] + rng.normal(0, 1, n) * centers[:, 2]
+    lon = centers[:, 1] + rng.normal(0, 1, n) * centers[:, 2]
+    return [(f"Landmark {i}", float(lat[i]), float(lon[i])) for i in range(n)]
+
+
+def brute_force(coords: np.ndarray, lat: float, lon: float):
+    p = np.radians(coords)
+    a = (np.sin((p[:, 0] - np.radians(lat)) / 2) ** 2
+         + np.cos(np.radians(lat)) * np.cos(p[:, 0]) * np.sin((p[:, 1] - np.radians(lon)) / 2) ** 2)
+    km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    i = int(np.argmin(km))
+    return i, float(km[i])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--landmarks", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(16)
+
+    landmarks = synthetic_landmarks(args.landmarks, rng)
+    directory = os.path.join(tempfile.mkdtemp(), "landmarks.idx")
+    try:
+        start = time.perf_counter()
+        LandmarkIndex.build(landmarks).save(directory)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        index = LandmarkIndex.open(directory)
+        opened = time.perf_counter() - start
+
+        coords = np.array([(lat, lon) for _, lat, lon in landmarks])
+        queries = np.column_stack((rng.uniform(37.2, 37.9, args.queries), rng.uniform(-122.6, -121.7, args.queries)))
+        grid, scan = LatencyStats(window=args.queries), LatencyStats(window=args.queries)
+        mismatches = 0
+        for lat, lon in queries:
+            start = time.perf_counter()
+            found = index.nearest(lat, lon)
+            grid.record(time.perf_counter() - start)
+            start = time.perf_counter()
+            i, km = brute_force(coords, lat, lon)
+            scan.record(time.perf_counter() - start)
+            expected = landmarks[i][0] if km <= LANDMARK_MAX_DISTANCE_KM else None
+            if (found[0] if found else None) != expected and not (found and abs(found[1] - km) < 1e-9):
+                mismatches += 1
+    finally:
+        shutil.rmtree(os.path.dirname(directory), ignore_errors=True)
+
+    print(f"{args.landmarks:,} landmarks in {index.stats()['cells']:,} cells: built + saved in {build:.1f}s, "
+          f"opened memory-mapped in {opened * 1000:.1f} ms\n")
+    print(f"{'lookup':<10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, stats in (("grid", grid), ("scan", scan)):
+        snap = stats.snapshot()
+        print(f"{name:<10} {snap['p50_ms']:>8.3f} {snap['p95_ms']:>8.3f} {snap['max_ms']:>8.3f}")
+    print(f"\nanswers differing from the full scan: {mismatches} of {args.queries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Cross-user micro-batching of ride extraction versus one LLM request per utterance.
+Utterances arrive spread over --spread seconds and go through
+validate_and_extract_ride_request against a mock chat-completions endpoint
+whose latency grows with the number of answers it generates. The number of
+concurrent LLM requests is capped (LLM_MAX_CONCURRENCY), as an API rate limit would.
+
+Usage: python benchmarks/bench_llm_batching.py [--utterances 400] [--spread 1.0] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--utterances", type=int, default=400)
+parser.add_argument("--spread", type=float, default=1.0, help="seconds over which utterances arrive")
+parser.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight at once")
+parser.add_argument("--base-latency", type=float, default=0.15, help="per-request LLM latency in seconds")
+parser.add_argument("--item-latency", type=float, default=0.01, help="extra latency per answer generated")
+args = parser.parse_args()
+os.environ["LLM_MAX_CONCURRENCY"] = str(args.concurrency)
+
+import ride_detector
+from intent_cache import IntentCache
+from metrics import LatencyStats
+from mock_llm import mock_client
+
+_NUMBERED = re.compile(r'^(\d+)\. "(.*)"$', re.MULTILINE)
+
+
+def _verdict(text: str) -> str:
+    return "YES|NOT_FOUND|SJSU" if "uber" in text else "NO|NOT_FOUND|NOT_FOUND"
+
+
+def _answer(prompt: str) -> str:
+    items = _NUMBERED.findall(prompt)
+    if items:
+        return "\n".join(f"{i}|{_verdict(text)}" for i, text in items)
+    return _verdict(prompt.split('User text: "', 1)[1])
+
+
+def _latency(prompt: str, answer: str) -> float:
+    return args.base_latency + args.item_latency * (answer.count("\n") + 1)
+
+
+async def _run(batching: bool):
+    ride_detector.LLM_BATCHING = batching
+    ride_detector.intent_cache = IntentCache(max_entries=0, path="")
+    tokens = {}
+    ride_detector.set_llm_client(mock_client(_answer, latency=_latency, stats=tokens))
+    rng = random.Random(3)
+    latency = LatencyStats(window=args.utterances)
+
+    async def one(i: int):
+        await asyncio.sleep(rng.random() * args.spread)
+        text = f"book an uber to stop {i}" if i % 4 == 0 else f"chatter line {i} about the weekend"
+        start = time.perf_counter()
+        await ride_detector.validate_and_extract_ride_request(text)
+        latency.record(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.utterances)))
+    elapsed = time.perf_counter() - start
+    await ride_detector.close_llm_client()
+    return elapsed, latency.snapshot(), (tokens["prompt_tokens"] + tokens["completion_tokens"]) / args.utterances
+
+
+def main():
+    # ride_detector logs every extraction with print()
+    with contextlib.redirect_stdout(io.StringIO()):
+        unbatched = asyncio.run(_run(False))
+        calls_before = ride_detector.llm_calls
+        batched = asyncio.run(_run(True))
+        batched_calls = ride_detector.llm_calls - calls_before
+
+    print(f"{args.utterances} utterances over {args.spread}s, {args.concurrency} concurrent LLM requests, "
+          f"{args.base_latency * 1000:.0f} ms + {args.item_latency * 1000:.0f} ms/answer\n")
+    print(f"{'path':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'tokens/utt':>11}")
+    for name, (elapsed, lat, tokens) in (("single", unbatched), ("batched", batched)):
+        print(f"{name:<10} {args.utterances / elapsed:>8.0f} {lat['p50_ms']:>8.0f} {lat['p95_ms']:>8.0f} {tokens:>11.1f}")
+    print(f"\nbatched LLM requests: {batched_calls}, batcher: {ride_detector.extraction_batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Event-loop responsiveness while 50 ride extractions are in flight.
+Compares the old blocking pattern (sync OpenAI client called inside a
+coroutine) against the pooled AsyncOpenAI path in ride_detector. The LLM is
+simulated with an httpx MockTransport that answers after --latency seconds,
+so no network access or API key is needed.
+
+Usage: python benchmarks/bench_llm_client.py [--concurrency 50] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+from openai import OpenAI
+
+import ride_detector
+from metrics import LatencyStats
+from mock_llm import mock_client
+
+_COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-3.5-turbo",
+    "choices": [
+        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "YES|NOT_FOUND|SJSU"}}
+    ],
+}
+
+
+def _sync_client(latency: float) -> OpenAI:
+    def handler(request: httpx.Request) -> httpx.Response:
+        time.sleep(latency)
+        return httpx.Response(200, json=_COMPLETION)
+
+    return OpenAI(api_key="bench", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+
+async def _blocking_extract(client: OpenAI, text: str):
+    # The pre-change shape of validate_and_extract_ride_request
+    response = client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": text}], temperature=0.3, max_tokens=100
+    )
+    return response.choices[0].message.content
+
+
+async def _probe(lag: LatencyStats, stop: asyncio.Event, interval: float = 0.01):
+    """Measure how late a 10 ms timer fires while extractions run."""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lag.record(max(0.0, time.perf_counter() - expected))
+
+
+async def _run(extract, concurrency: int):
+    lag = LatencyStats()
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lag, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*(extract(f"book an uber to SJSU #{i}") for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    return elapsed, lag.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated LLM round-trip in seconds")
+    args = parser.parse_args()
+
+    sync_client = _sync_client(args.latency)
+    blocking = asyncio.run(_run(lambda text: _blocking_extract(sync_client, text), args.concurrency))
+
+    # ride_detector logs every extraction with print()
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    async def run_async():
+        ride_detector.set_llm_client(mock_client("YES|NOT_FOUND|SJSU", latency=args.latency))
+        try:
+            return await _run(ride_detector.validate_and_extract_ride_request, args.concurrency)
+        finally:
+            await ride_detector.close_llm_client()
+
+    with quiet:
+        pooled = asyncio.run(run_async())
+
+    print(f"{args.concurrency} concurrent extractions, {args.latency * 1000:.0f} ms simulated LLM latency\n")
+    print(f"{'client':<10} {'wall s':>8} {'loop lag p50 ms':>16} {'p95 ms':>8} {'max ms':>8}")
+    for name, (elapsed, lag) in (("blocking", blocking), ("async", pooled)):
+        print(f"{name:<10} {elapsed:>8.2f} {lag['p50_ms'] or 0:>16.1f} {lag['p95_ms'] or 0:>8.1f} {lag['max_ms'] or 0:>8.1f}")
+    print("\n" + json.dumps({"llm": ride_detector.llm_stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Streamed extraction with early cancel versus waiting for the full completion.
+Most traffic is not a ride request, so a streamed NO verdict can stop the
+answer after its first token. Reports time-to-decision and the completion
+tokens the mock model actually generated. Requests share the
+LLM_MAX_CONCURRENCY limit, so early cancels also shorten the queue.
+
+Usage: python benchmarks/bench_llm_streaming.py [--utterances 200] [--ride-share 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ride_detector
+from intent_cache import IntentCache
+from metrics import LatencyStats
+from mock_llm import mock_client
+
+
+async def _run(streaming: bool, texts, ttft: float, token_delay: float):
+    ride_detector.LLM_STREAMING = streaming
+    ride_detector.LLM_BATCHING = False
+    ride_detector.intent_cache = IntentCache(max_entries=0, path="")
+    ride_detector.llm_decision_latency = LatencyStats(window=len(texts))
+    stats = {}
+    ride_detector.set_llm_client(mock_client(
+        # A chatty model pads NO answers as much as YES answers
+        lambda prompt: ("YES|Palace of Fine Arts|San Jose State University" if "uber" in prompt.split('User text: "', 1)[1]
+                        else "NO|NOT_FOUND|NOT_FOUND"),
+        latency=ttft,
+        token_delay=token_delay,
+        stats=stats,
+    ))
+    try:
+        await asyncio.gather(*(ride_detector.validate_and_extract_ride_request(text) for text in texts))
+    finally:
+        await ride_detector.close_llm_client()
+    return ride_detector.llm_decision_latency.snapshot(), stats["completion_tokens"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--utterances", type=int, default=200)
+    parser.add_argument("--ride-share", type=float, default=0.2)
+    parser.add_argument("--ttft", type=float, default=0.15, help="time to first token in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="seconds per generated token")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    texts = [
+        f"book an uber to sjsu #{i}" if rng.random() < args.ride_share else f"small talk about lunch #{i}"
+        for i in range(args.utterances)
+    ]
+    # ride_detector logs every extraction with print()
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = asyncio.run(_run(False, texts, args.ttft, args.token_delay))
+        streamed = asyncio.run(_run(True, texts, args.ttft, args.token_delay))
+
+    print(f"{args.utterances} utterances ({args.ride_share:.0%} ride requests), "
+          f"{args.ttft * 1000:.0f} ms to first token, {args.token_delay * 1000:.0f} ms/token\n")
+    print(f"{'mode':<10} {'decision p50 ms':>16} {'p95 ms':>8} {'completion tokens':>18}")
+    for name, (decision, tokens) in (("full", full), ("streamed", streamed)):
+        print(f"{name:<10} {decision['p50_ms']:>16.0f} {decision['p95_ms']:>8.0f} {tokens:>18}")
+    print(f"\nearly cancels: {ride_detector.llm_early_cancels}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Browser session size on disk and load time per booking.
+Builds --sessions synthetic Playwright storage states shaped like a logged-in
+Uber session (Uber cookies and localStorage plus the analytics and ad
+third parties a real page picks up) and stores them two ways: the old
+pretty-printed JSON file, and the compact format (Uber domains only,
+minified, zlib). A booking loads the user's session once, so load time is
+measured per booking, cold (first load after a restart) and warm (the file
+is unchanged and the parsed session is reused). Re-saving an unchanged
+session, which every successful login does, is timed too.
+
+Usage: python benchmarks/bench_session_storage.py [--sessions 500] [--bookings 5000]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import LatencyStats
+from simple_storage import FileBackend
+
+THIRD_PARTIES = ["google-analytics.com", "doubleclick.net", "facebook.com", "branch.io", "segment.io", "hotjar.com"]
+
+
+def token(rng: random.Random, n: int) -> str:
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=n))
+
+
+def storage_state(rng: random.Random) -> dict:
+    cookies = [
+        {"name": f"uber_{i}", "value": token(rng, rng.randint(20, 400)), "domain": rng.choice([".uber.com", "m.uber.com", "auth.uber.com"]),
+         "path": "/", "expires": 1_900_000_000 + i, "httpOnly": True, "secure": True, "sameSite": "Lax"}
+        for i in range(12)
+    ]
+    cookies += [
+        {"name": f"_t{i}", "value": token(rng, rng.randint(20, 200)), "domain": f".{rng.choice(THIRD_PARTIES)}",
+         "path": "/", "expires": 1_900_000_000, "httpOnly": False, "secure": True, "sameSite": "None"}
+        for i in range(40)
+    ]
+    origins = [{"origin": "https://m.uber.com", "localStorage": [
+        {"name": f"uber_key_{i}", "value": json.dumps({"v": token(rng, 120), "ts": i})} for i in range(30)]}]
+    origins += [{"origin": f"https://www.{domain}", "localStorage": [
+        {"name": f"cache_{i}", "value": token(rng, 2000)} for i in range(10)]} for domain in THIRD_PARTIES]
+    return {"cookies": cookies, "origins": origins}
+
+
+def save_legacy(directory: Path, uid: str, state: dict):
+    """How sessions were stored before: one pretty-printed JSON file."""
+    with open(directory / f"{uid}_uber_session.json", "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_legacy(directory: Path, uid: str) -> dict:
+    with open(directory / f"{uid}_uber_session.json", "r") as f:
+        return json.load(f)
+
+
+def measure(op, count: int) -> LatencyStats:
+    stats = LatencyStats(window=count)
+    for i in range(count):
+        started = time.perf_counter()
+        op(i)
+        stats.record(time.perf_counter() - started)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--bookings", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(22)
+    states = {f"user{i}": storage_state(rng) for i in range(args.sessions)}
+    uids = list(states)
+    bookings = [rng.choice(uids) for _ in range(args.bookings)]
+    workdir = Path(tempfile.mkdtemp())
+    legacy_dir = workdir / "legacy"
+    legacy_dir.mkdir()
+    try:
+        for uid, state in states.items():
+            save_legacy(legacy_dir, uid, state)
+        backend = FileBackend(workdir / "users", workdir / "sessions")
+        for uid, state in states.items():
+            backend.save_session(uid, state)
+        legacy_bytes = sum(p.stat().st_size for p in legacy_dir.iterdir())
+        compact_bytes = sum(p.stat().st_size for p in (workdir / "sessions").iterdir())
+
+        rows = [
+            ("legacy json", "load", measure(lambda i: load_legacy(legacy_dir, bookings[i]), args.bookings)),
+            ("compact", "load cold", measure(
+                lambda i: FileBackend(workdir / "users", workdir / "sessions").load_session(bookings[i]), args.bookings)),
+            ("compact", "load warm", measure(lambda i: backend.load_session(bookings[i]), args.bookings)),
+            ("legacy json", "save", measure(lambda i: save_legacy(legacy_dir, bookings[i], states[bookings[i]]), args.sessions)),
+            ("compact", "save same", measure(lambda i: backend.save_session(bookings[i], states[bookings[i]]), args.sessions)),
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'format':<12} {'bytes/session':>14} {'total MB':>10}")
+    for name, total in (("legacy json", legacy_bytes), ("compact", compact_bytes)):
+        print(f"{name:<12} {total / args.sessions:>14,.0f} {total / 1e6:>10.2f}")
+    print(f"\n{'format':<12} {'operation':<10} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, op, stats in rows:
+        print(f"{name:<12} {op:<10} {stats.percentile(50) * 1000:>8.3f} {stats.percentile(99) * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
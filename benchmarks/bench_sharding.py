@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Throughput scaling of the uid-sharded stack.
+Starts shard_router's dispatcher plus N worker processes for each N, then
+drives /webhook with many concurrent uids and reports requests/sec and the
+speedup over a single worker. Expect close to linear scaling only up to
+the number of physical cores.
+
+Usage: python benchmarks/bench_sharding.py [--workers 1 2 4] [--requests 4000]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_PORT = 18500
+
+
+def _start_stack(workers: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark-no-network"),
+        "PYTHONPATH": ROOT,
+        # Measure ingestion only: keep buckets from flushing into the LLM mid-run
+        "BUCKET_WAIT_TIME": "3600",
+    }
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "shard_router.py"), "--workers", str(workers),
+         "--dispatchers", str(workers), "--port", str(BASE_PORT)],
+        cwd=tempfile.mkdtemp(prefix="bench_shards_"),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, workers: int):
+    for _ in range(100):
+        try:
+            shards = (await client.get("/shards")).json()["workers"]
+            if len(shards) == workers and all(s["healthy"] for s in shards):
+                return
+        except (httpx.HTTPError, KeyError, ValueError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("sharded stack did not come up")
+
+
+async def _drive(workers: int, requests: int, concurrency: int) -> float:
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{BASE_PORT}",
+        limits=httpx.Limits(max_connections=concurrency),
+        timeout=30.0,
+    ) as client:
+        await _wait_ready(client, workers)
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+
+        async def user():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await client.post(
+                    f"/webhook?uid=user_{i % 2000}",
+                    json={"segments": [{"text": f"segment {i}", "speaker": "SPEAKER_0"}]},
+                )
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def main(worker_counts, requests: int, concurrency: int):
+    print(f"{requests:,} /webhook requests, {concurrency} concurrent clients, {os.cpu_count()} CPU(s)")
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts:
+        stack = _start_stack(workers)
+        try:
+            elapsed = asyncio.run(_drive(workers, requests, concurrency))
+        finally:
+            # Stop the launcher together with every worker and dispatcher it started
+            os.killpg(stack.pid, signal.SIGTERM)
+            stack.wait()
+            time.sleep(1)
+        rate = requests / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>10,.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    main(args.workers, args.requests, args.concurrency)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark event-loop CPU for idle conversation buckets.
+Compares the old design (one task per uid polling every 500ms) with the
+central SilenceScheduler, for growing numbers of buckets whose silence
+windows never close during the measurement.
+
+Usage: python benchmarks/bench_silence_scheduler.py [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from silence_scheduler import SilenceScheduler
+
+WAIT_TIME = 3600  # Never closes while measuring
+
+
+async def _polling_buckets(count: int, seconds: float) -> float:
+    """Old design: every bucket owns a task that wakes every 500ms."""
+    last_arrival = {f"user_{i}": time.time() for i in range(count)}
+
+    async def monitor(uid: str):
+        while True:
+            await asyncio.sleep(0.5)
+            if time.time() - last_arrival[uid] >= WAIT_TIME:
+                return
+
+    tasks = [asyncio.create_task(monitor(uid)) for uid in last_arrival]
+    await asyncio.sleep(0.6)  # Let every task reach its steady state
+
+    start = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - start
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cpu
+
+
+async def _scheduled_buckets(count: int, seconds: float) -> float:
+    """New design: one deadline heap, one armed loop timer."""
+    async def flush(uid: str):
+        pass
+
+    scheduler = SilenceScheduler(flush, WAIT_TIME)
+    for i in range(count):
+        scheduler.touch(f"user_{i}")
+    await asyncio.sleep(0.6)
+
+    start = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - start
+
+    scheduler.close()
+    return cpu
+
+
+async def _touch_cost(count: int) -> float:
+    """Average cost of extending an existing window (a new segment arriving)."""
+    async def flush(uid: str):
+        pass
+
+    scheduler = SilenceScheduler(flush, WAIT_TIME)
+    keys = [f"user_{i}" for i in range(count)]
+    for key in keys:
+        scheduler.touch(key)
+
+    start = time.perf_counter()
+    for key in keys:
+        scheduler.touch(key)
+    elapsed = time.perf_counter() - start
+    scheduler.close()
+    return elapsed / count
+
+
+async def main(seconds: float):
+    print(f"Idle buckets, {seconds:.0f}s window, CPU seconds burned by the event loop")
+    print(f"{'buckets':>8} {'polling':>10} {'scheduler':>10} {'CPU %':>12}")
+    for count in (100, 1_000, 5_000, 10_000):
+        polling = await _polling_buckets(count, seconds)
+        scheduled = await _scheduled_buckets(count, seconds)
+        print(
+            f"{count:>8} {polling:>9.3f}s {scheduled:>9.3f}s "
+            f"{polling / seconds * 100:>5.1f}→{scheduled / seconds * 100:.1f}"
+        )
+
+    per_touch = await _touch_cost(10_000)
+    print(f"\nReschedule on new segment: {per_touch * 1e6:.2f}µs per touch (10k buckets)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0, help="measurement window per run")
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+User storage throughput and tail latency: JSON files versus SQLite (WAL).
+Seeds --users user records into each backend, then times the operations
+the app performs against the backend itself (the write-behind cache in
+front of it is bypassed): single-record reads, single-record writes (the
+write-through path), 100-record flushes (the write-behind path), and
+listing the users in one auth_status, by scanning every record and through
+the auth index.
+
+Usage: python benchmarks/bench_storage_backends.py [--users 100000] [--ops 5000]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import LatencyStats
+from simple_storage import FileBackend, _new_user
+from sqlite_storage import SQLiteBackend
+
+STATUSES = ["completed"] * 8 + ["failed", "waiting_2fa"]
+
+
+def record(uid: str, rng: random.Random) -> dict:
+    data = _new_user(uid)
+    data.update(auth_status=rng.choice(STATUSES), uber_authenticated=True, updated_at=data["created_at"])
+    return data
+
+
+def seed(backend, users: int, rng: random.Random):
+    if isinstance(backend, FileBackend):
+        # Plain writes: seeding speed is not what is measured
+        directory = backend.users_dir
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(users):
+            with open(directory / f"user{i}.json", "w") as f:
+                json.dump(record(f"user{i}", rng), f)
+    else:
+        for start in range(0, users, 5000):
+            backend.write_users({f"user{i}": record(f"user{i}", rng) for i in range(start, min(users, start + 5000))})
+
+
+def scan_status(backend, status: str) -> list:
+    """What a sweep cost before the auth index: parse every record."""
+    return [uid for uid, data in backend.iter_users() if data.get("auth_status") == status]
+
+
+def measure(op, count: int) -> LatencyStats:
+    stats = LatencyStats(window=count)
+    for i in range(count):
+        started = time.perf_counter()
+        op(i)
+        stats.record(time.perf_counter() - started)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=5000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp())
+    backends = {
+        "files": FileBackend(workdir / "users", workdir / "sessions"),
+        "sqlite": SQLiteBackend(str(workdir / "store.db")),
+    }
+    rows = []
+    try:
+        for name, backend in backends.items():
+            rng = random.Random(20)
+            started = time.perf_counter()
+            seed(backend, args.users, rng)
+            print(f"seeded {args.users:,} users into {name} in {time.perf_counter() - started:.1f}s")
+            if isinstance(backend, FileBackend):
+                started = time.perf_counter()
+                backend.auth_index()
+                print(f"built the files auth index in {time.perf_counter() - started:.1f}s")
+            uids = [f"user{rng.randrange(args.users)}" for _ in range(args.ops)]
+            ops = {
+                "read": (lambda i: backend.read_user(uids[i]), args.ops),
+                "write": (lambda i: backend.write_users({uids[i]: record(uids[i], rng)}), args.ops),
+                "flush x100": (lambda i: backend.write_users(
+                    {uids[(i * 100 + j) % args.ops]: record("x", rng) for j in range(100)}), max(1, args.ops // 100)),
+                "scan status": (lambda i: scan_status(backend, "failed"), 1),
+                "find_users": (lambda i: backend.query_users("failed", True), 20),
+            }
+            for op, (fn, count) in ops.items():
+                stats = measure(fn, count)
+                rows.append((name, op, count, count / stats.total, stats.percentile(99) * 1000))
+    finally:
+        backends["sqlite"].close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'backend':<8} {'operation':<12} {'ops':>6} {'ops/sec':>10} {'p99 ms':>10}")
+    for name, op, count, rate, p99 in rows:
+        print(f"{name:<8} {op:<12} {count:>6} {rate:>10,.1f} {p99:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
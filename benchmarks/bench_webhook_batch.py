@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: one /webhook request per record versus /webhook/batch.
+Drives the FastAPI app in-process through httpx's ASGI transport, so the
+numbers are per-request framework overhead plus bucket ingestion.
+
+Usage: python benchmarks/bench_webhook_batch.py [--records 5000] [--batch-size 500]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The app creates its storage folders in the working directory
+os.chdir(tempfile.mkdtemp(prefix="bench_webhook_"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-no-network")
+
+import httpx
+
+import main
+
+
+def _records(count: int):
+    return [
+        {
+            "uid": f"device_{i % 1000}",
+            "segments": [{"text": f"segment {i} of the conversation", "speaker": "SPEAKER_0"}],
+            "gps": {"lat": 37.7749, "lon": -122.4194},
+        }
+        for i in range(count)
+    ]
+
+
+async def _single(client: httpx.AsyncClient, records) -> float:
+    start = time.perf_counter()
+    for record in records:
+        body = {"segments": record["segments"], "gps_lat": 37.7749, "gps_lon": -122.4194}
+        response = await client.post("/webhook", json=body)
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def _batched(client: httpx.AsyncClient, records, batch_size: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(records), batch_size):
+        body = "\n".join(json.dumps(r) for r in records[i : i + batch_size])
+        response = await client.post(
+            "/webhook/batch", content=body, headers={"content-type": "application/x-ndjson"}
+        )
+        response.raise_for_status()
+        assert response.json()["rejected"] == 0
+    return time.perf_counter() - start
+
+
+async def run(count: int, batch_size: int):
+    logging.disable(logging.INFO)
+    records = _records(count)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        single = await _single(client, records)
+        main.silence_scheduler.close()
+        main.segment_buckets.clear()
+        batched = await _batched(client, records, batch_size)
+        main.silence_scheduler.close()
+
+    print(f"{count:,} records")
+    print(f"{'endpoint':<28} {'seconds':>8} {'records/s':>12}")
+    print(f"{'/webhook (1 per request)':<28} {single:>8.2f} {count / single:>12,.0f}")
+    print(f"{f'/webhook/batch ({batch_size}/request)':<28} {batched:>8.2f} {count / batched:>12,.0f}")
+    print(f"speedup: {single / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.records, args.batch_size))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Evaluate the local ride pre-classifier with k-fold cross-validation.
+Reports precision/recall of the "forward to LLM" decision, the share of
+LLM calls avoided, and per-utterance scoring latency.
+
+Usage: python benchmarks/eval_ride_classifier.py [--data data/ride_intents.tsv] [--folds 5] [--threshold 0.25]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from ride_classifier import RIDE_CLASSIFIER_DATA, RIDE_CLASSIFIER_THRESHOLD, RideClassifier, load_labeled
+
+
+def _folds(labels: np.ndarray, k: int, rng: np.random.Generator):
+    """Stratified fold assignment."""
+    fold = np.empty(len(labels), dtype=int)
+    for cls in (0, 1):
+        idx = np.flatnonzero(labels == cls)
+        rng.shuffle(idx)
+        fold[idx] = np.arange(len(idx)) % k
+    return fold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default=RIDE_CLASSIFIER_DATA)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=RIDE_CLASSIFIER_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts, labels = load_labeled(args.data)
+    fold = _folds(labels, args.folds, np.random.default_rng(args.seed))
+    predicted = np.zeros(len(texts), dtype=bool)
+    scoring_time = 0.0
+
+    for k in range(args.folds):
+        train = np.flatnonzero(fold != k)
+        model = RideClassifier(threshold=args.threshold).fit([texts[i] for i in train], labels[train])
+        start = time.perf_counter()
+        for i in np.flatnonzero(fold == k):
+            predicted[i] = model.is_candidate(texts[i])
+        scoring_time += time.perf_counter() - start
+
+    actual = labels == 1
+    tp = int((predicted & actual).sum())
+    fp = int((predicted & ~actual).sum())
+    fn = int((~predicted & actual).sum())
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    print(f"{len(texts)} labeled utterances ({int(actual.sum())} ride requests), {args.folds}-fold CV, threshold {args.threshold}\n")
+    print(f"precision          {precision:.3f}")
+    print(f"recall             {recall:.3f}")
+    print(f"f1                 {f1:.3f}")
+    print(f"LLM calls avoided  {1 - predicted.mean():.1%} of all utterances, {(~predicted[~actual]).mean():.1%} of non-ride chatter")
+    print(f"scoring latency    {scoring_time / len(texts) * 1e6:.0f} us/utterance")
+    missed = [texts[i] for i in np.flatnonzero(actual & ~predicted)]
+    if missed:
+        print("\nmissed ride requests:")
+        for text in missed:
+            print(f"  {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+In-process mock of the chat-completions API shared by the LLM benchmarks.
+Answers plain and streamed (SSE) requests through an httpx MockTransport,
+with configurable time-to-first-token and per-token generation delay, and
+counts the tokens actually generated (a closed stream stops generating).
+"""
+import asyncio
+import json
+from typing import Callable, Dict, Optional, Union
+
+import httpx
+from openai import AsyncOpenAI
+
+# ~4 characters per token
+_CHARS_PER_TOKEN = 4
+
+
+def _tokens(text: str):
+    return [text[i : i + _CHARS_PER_TOKEN] for i in range(0, len(text), _CHARS_PER_TOKEN)]
+
+
+def _chunk(delta: Optional[dict], usage: Optional[dict] = None) -> bytes:
+    event = {
+        "id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "gpt-3.5-turbo",
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": None}],
+        "usage": usage,
+    }
+    return f"data: {json.dumps(event)}\n\n".encode()
+
+
+def mock_client(
+    answer: Union[str, Callable[[str], str]],
+    latency: Union[float, Callable[[str, str], float]] = 0.0,
+    token_delay: float = 0.0,
+    stats: Optional[Dict[str, int]] = None,
+) -> AsyncOpenAI:
+    """
+    AsyncOpenAI client backed by a fake model.
+    answer(prompt) gives the completion text; latency(prompt, answer) the
+    delay before the first token; token_delay the delay between tokens.
+    stats (if given) accumulates "requests", "prompt_tokens" and "completion_tokens".
+    """
+    stats = stats if stats is not None else {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        prompt = body["messages"][0]["content"]
+        content = answer(prompt) if callable(answer) else answer
+        delay = latency(prompt, content) if callable(latency) else latency
+        prompt_tokens = len(prompt) // _CHARS_PER_TOKEN
+        stats["requests"] = stats.get("requests", 0) + 1
+        stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + prompt_tokens
+        tokens = _tokens(content)
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay + token_delay * len(tokens))
+            stats["completion_tokens"] = stats.get("completion_tokens", 0) + len(tokens)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                     "total_tokens": prompt_tokens + len(tokens)}
+            return httpx.Response(200, json={
+                "id": "bench", "object": "chat.completion", "created": 0, "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+
+        async def events():
+            await asyncio.sleep(delay)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(token_delay)
+                stats["completion_tokens"] = stats.get("completion_tokens", 0) + 1
+                yield _chunk({"content": token})
+            yield _chunk(None, {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                                "total_tokens": prompt_tokens + len(tokens)})
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+
+    return AsyncOpenAI(api_key="bench", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
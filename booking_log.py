@@ -0,0 +1,460 @@
+"""
+Append-only booking history.
+Bookings are appended to numbered segment files in BOOKING_LOG_DIR, one line
+per booking: seq<TAB>epoch<TAB>uid<TAB>{json}. The active segment is rotated
+once it passes BOOKING_SEGMENT_BYTES; a sealed segment gets a sidecar .idx
+file (seq, time and offset of every record) so a restart rebuilds the index
+without parsing bookings, and is read through mmap. In memory each uid maps
+to its (time, segment, offset, length) entries in time order, so "last N
+bookings" and "bookings between" are a slice or a binary search plus one
+read per booking.
+
+One process owns a log directory: it holds an exclusive lock on its .lock
+file, and a second writer (another shard worker, or the compact command
+while the app runs) fails to open it instead of interleaving sequence
+numbers.
+
+Compaction rewrites the sealed segments without bookings older than the
+retention window or beyond the newest N per user, merging small segments.
+Sequence numbers are strictly increasing, so a record seen twice after a
+crash mid-compaction is loaded once.
+
+    python booking_log.py compact [--dir bookings] [--retention-days 365] [--keep-per-user 100]
+"""
+
+import argparse
+import bisect
+import fcntl
+import heapq
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+BOOKING_LOG_DIR = os.getenv("BOOKING_LOG_DIR", "bookings")
+BOOKING_SEGMENT_BYTES = int(os.getenv("BOOKING_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+BOOKING_FSYNC = os.getenv("BOOKING_FSYNC", "true").lower() == "true"
+# Compaction policy applied at startup (0 keeps everything)
+BOOKING_RETENTION_DAYS = float(os.getenv("BOOKING_RETENTION_DAYS", "0"))
+BOOKING_KEEP_PER_USER = int(os.getenv("BOOKING_KEEP_PER_USER", "0"))
+
+# (epoch seconds, segment id, offset, length)
+Entry = Tuple[float, int, int, int]
+
+
+class _Segment:
+    """One segment file and the seq / time / offset of each record in it."""
+
+    def __init__(self, segment_id: int, path: Path):
+        self.id = segment_id
+        self.path = path
+        self.seqs = array("q")
+        self.times = array("d")
+        self.offsets = array("q")
+        self.uids: List[str] = []
+        self.size = 0
+        self._map: Optional[mmap.mmap] = None
+
+    def length(self, i: int) -> int:
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.size
+        return end - self.offsets[i]
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset : offset + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def _encode(seq: int, ts: float, uid: str, booking: Dict[str, Any]) -> bytes:
+    if "\t" in uid or "\n" in uid:
+        raise ValueError(f"Invalid uid for the booking log: {uid!r}")
+    return f"{seq}\t{ts:.6f}\t{uid}\t{json.dumps(booking, separators=(',', ':'))}\n".encode("utf-8")
+
+
+def _decode(line: bytes) -> Dict[str, Any]:
+    _, ts, uid, body = line.rstrip(b"\n").split(b"\t", 3)
+    return {**json.loads(body), "uid": uid.decode("utf-8"), "ts": float(ts)}
+
+
+def _sync(fd: int, fsync: bool):
+    if fsync:
+        os.fsync(fd)
+
+
+class BookingLog:
+    """Segmented append-only booking log with a per-uid index."""
+
+    def __init__(self, directory: str = BOOKING_LOG_DIR, segment_bytes: int = BOOKING_SEGMENT_BYTES,
+                 fsync: bool = BOOKING_FSYNC):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._segments: Dict[int, _Segment] = {}
+        self._by_uid: Dict[str, List[Entry]] = {}
+        self._active: Optional[_Segment] = None
+        self._fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self._seq = 0
+        self._last_ts = 0.0
+        self.append_latency = LatencyStats()
+        self.read_latency = LatencyStats()
+        self.appends = 0
+        self.rotations = 0
+        self.compactions = 0
+        self.compacted_away = 0
+        self._acquire()
+        self._load()
+
+    def _acquire(self):
+        """Take the directory's writer lock, or fail if another process holds it."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(self.directory / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            raise RuntimeError(f"Booking log {self.directory} is open in another process") from None
+
+    # ------------------------------------------------------------------ load
+
+    def _segment_path(self, segment_id: int, suffix: str = ".log") -> Path:
+        return self.directory / f"{segment_id:08d}{suffix}"
+
+    def _load(self):
+        started = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        paths = sorted(self.directory.glob("[0-9]*.log"))
+        for n, path in enumerate(paths):
+            segment = _Segment(int(path.stem), path)
+            if not self._read_sidecar(segment):
+                self._scan(segment, last=n == len(paths) - 1)
+            if not segment.seqs and n < len(paths) - 1:
+                # Leftover of an interrupted compaction: every record lives on in an earlier segment
+                path.unlink()
+                self._segment_path(segment.id, ".idx").unlink(missing_ok=True)
+                continue
+            self._segments[segment.id] = segment
+            for i, (ts, offset) in enumerate(zip(segment.times, segment.offsets)):
+                self._by_uid.setdefault(segment.uids[i], []).append((ts, segment.id, offset, segment.length(i)))
+        if self._segments:
+            self._active = self._segments[max(self._segments)]
+            self._fd = os.open(self._active.path, os.O_RDWR | os.O_APPEND)
+        if paths:
+            logger.info(f"📒 Booking log: {self._count()} bookings in {len(self._segments)} segments "
+                        f"loaded in {time.perf_counter() - started:.2f}s")
+
+    def _keep(self, segment: _Segment, seq: int, ts: float, offset: int, uid: str) -> bool:
+        if seq <= self._seq:
+            return False
+        self._seq = seq
+        self._last_ts = max(self._last_ts, ts)
+        segment.seqs.append(seq)
+        segment.times.append(ts)
+        segment.offsets.append(offset)
+        segment.uids.append(uid)
+        return True
+
+    def _read_sidecar(self, segment: _Segment) -> bool:
+        try:
+            with open(self._segment_path(segment.id, ".idx"), "r") as f:
+                index = json.load(f)
+            size = segment.path.stat().st_size
+        except (OSError, ValueError):
+            return False
+        if index.get("size") != size:
+            return False
+        segment.size = size
+        for row in zip(index["seqs"], index["times"], index["offsets"], index["uids"]):
+            self._keep(segment, *row)
+        return True
+
+    def _scan(self, segment: _Segment, last: bool):
+        data = segment.path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # A torn final append; cut it so the next append starts on a line boundary
+            logger.warning(f"⚠️ Truncating {len(data) - end} bytes of a partial booking in {segment.path.name}")
+            os.truncate(segment.path, end)
+        segment.size = end
+        offset = 0
+        while offset < end:
+            nl = data.index(b"\n", offset)
+            seq, ts, uid, _ = data[offset:nl].split(b"\t", 3)
+            self._keep(segment, int(seq), float(ts), offset, uid.decode("utf-8"))
+            offset = nl + 1
+        if not last:
+            self._write_sidecar(segment)
+
+    def _write_sidecar(self, segment: _Segment):
+        index = {
+            "size": segment.size,
+            "seqs": segment.seqs.tolist(),
+            "times": segment.times.tolist(),
+            "offsets": segment.offsets.tolist(),
+            "uids": segment.uids,
+        }
+        path = self._segment_path(segment.id, ".idx")
+        tmp = path.with_suffix(".idx.tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+            f.flush()
+            _sync(f.fileno(), self.fsync)
+        os.replace(tmp, path)
+
+    def _count(self) -> int:
+        return sum(len(s.seqs) for s in self._segments.values())
+
+    # ---------------------------------------------------------------- append
+
+    def _rotate(self):
+        """Seal the active segment and start the next one."""
+        if self._active is not None:
+            self._write_sidecar(self._active)
+            os.close(self._fd)
+            self.rotations += 1
+        segment_id = self._active.id + 1 if self._active is not None else 1
+        segment = _Segment(segment_id, self._segment_path(segment_id))
+        self._fd = os.open(segment.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segments[segment_id] = segment
+        self._active = segment
+
+    def append(self, uid: str, booking: Dict[str, Any]) -> int:
+        """Append one booking; returns its sequence number."""
+        started = time.perf_counter()
+        with self._lock:
+            if self._active is None or self._active.size >= self.segment_bytes:
+                self._rotate()
+            segment = self._active
+            # Times never go backwards, so every index stays sorted by time; rounded as stored
+            ts = round(max(time.time(), self._last_ts), 6)
+            line = _encode(self._seq + 1, ts, uid, booking)
+            os.write(self._fd, line)
+            _sync(self._fd, self.fsync)
+            self._seq += 1
+            self._last_ts = ts
+            segment.seqs.append(self._seq)
+            segment.times.append(ts)
+            segment.offsets.append(segment.size)
+            segment.uids.append(uid)
+            self._by_uid.setdefault(uid, []).append((ts, segment.id, segment.size, len(line)))
+            segment.size += len(line)
+            self.appends += 1
+        self.append_latency.record(time.perf_counter() - started)
+        return self._seq
+
+    # ----------------------------------------------------------------- reads
+
+    def _read(self, segment_id: int, offset: int, length: int) -> Dict[str, Any]:
+        if segment_id == self._active.id:
+            # The active segment grows, so it is read with pread rather than a mapping
+            return _decode(os.pread(self._fd, length, offset))
+        return _decode(self._segments[segment_id].read(offset, length))
+
+    def last(self, uid: str, n: int = 1) -> List[Dict[str, Any]]:
+        """The uid's n most recent bookings, newest first."""
+        started = time.perf_counter()
+        with self._lock:
+            entries = self._by_uid.get(uid, [])[-n:] if n > 0 else []
+            result = [self._read(seg, off, length) for _, seg, off, length in reversed(entries)]
+        self.read_latency.record(time.perf_counter() - started)
+        return result
+
+    def between(self, start: float, end: float, uid: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Bookings with start <= time < end (epoch seconds), oldest first; one uid's or everyone's."""
+        started = time.perf_counter()
+        with self._lock:
+            if uid is not None:
+                entries = self._by_uid.get(uid, [])
+                lo, hi = bisect.bisect_left(entries, (start,)), bisect.bisect_left(entries, (end,))
+                result = [self._read(seg, off, length) for _, seg, off, length in entries[lo:hi]]
+            else:
+                result = []
+                for segment_id in sorted(self._segments):
+                    segment = self._segments[segment_id]
+                    if not segment.times or segment.times[0] >= end or segment.times[-1] < start:
+                        continue
+                    lo, hi = bisect.bisect_left(segment.times, start), bisect.bisect_left(segment.times, end)
+                    result.extend(self._read(segment_id, segment.offsets[i], segment.length(i)) for i in range(lo, hi))
+        self.read_latency.record(time.perf_counter() - started)
+        return result
+
+    def recent_uids(self, n: int) -> List[str]:
+        """The n users who booked most recently, most recent first."""
+        with self._lock:
+            return heapq.nlargest(n, self._by_uid, key=lambda uid: self._by_uid[uid][-1][0])
+
+    def count(self, uid: Optional[str] = None) -> int:
+        with self._lock:
+            return len(self._by_uid.get(uid, [])) if uid is not None else self._count()
+
+    # ------------------------------------------------------------ compaction
+
+    def _records(self, segment: _Segment) -> Iterator[Tuple[int, float, str, bytes]]:
+        for i in range(len(segment.offsets)):
+            yield segment.seqs[i], segment.times[i], segment.uids[i], segment.read(segment.offsets[i], segment.length(i))
+
+    def compact(self, max_age: Optional[float] = None, keep_per_user: Optional[int] = None) -> int:
+        """
+        Rewrite sealed segments without bookings older than max_age seconds or
+        beyond each user's newest keep_per_user, packing survivors into as few
+        segments as the size limit allows. Returns the bookings removed.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            sealed = [self._segments[i] for i in sorted(self._segments) if i != self._active.id] if self._active else []
+            if not sealed:
+                return 0
+            cutoff = time.time() - max_age if max_age else None
+            newest = None
+            if keep_per_user:
+                newest = {(seg, off) for entries in self._by_uid.values() for _, seg, off, _ in entries[-keep_per_user:]}
+
+            removed = 0
+            outputs: List[Tuple[_Segment, bytearray]] = []
+            for segment in sealed:
+                for i, (seq, ts, uid, line) in enumerate(self._records(segment)):
+                    if (cutoff is not None and ts < cutoff) or (newest is not None and (segment.id, segment.offsets[i]) not in newest):
+                        removed += 1
+                        continue
+                    # An output takes the id of the first input it holds records from, so order is kept
+                    if not outputs or (len(outputs[-1][1]) >= self.segment_bytes and outputs[-1][0].id != segment.id):
+                        outputs.append((_Segment(segment.id, self._segment_path(segment.id)), bytearray()))
+                    out, data = outputs[-1]
+                    out.seqs.append(seq)
+                    out.times.append(ts)
+                    out.offsets.append(len(data))
+                    out.uids.append(uid)
+                    data += line
+            if removed == 0 and len(outputs) == len(sealed):
+                return 0
+
+            for segment in sealed:
+                segment.close()
+            for out, data in outputs:
+                tmp = out.path.with_suffix(".log.tmp")
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    _sync(f.fileno(), self.fsync)
+                out.size = len(data)
+                # Without a sidecar a segment is rescanned, so a crash here never pairs old and new
+                self._segment_path(out.id, ".idx").unlink(missing_ok=True)
+                os.replace(tmp, out.path)
+                self._write_sidecar(out)
+            kept = {out.id for out, _ in outputs}
+            for segment in sealed:
+                if segment.id not in kept:
+                    segment.path.unlink(missing_ok=True)
+                    self._segment_path(segment.id, ".idx").unlink(missing_ok=True)
+
+            os.close(self._fd)
+            self._segments, self._by_uid, self._active, self._fd, self._seq = {}, {}, None, None, 0
+            self._load()
+            self.compactions += 1
+            self.compacted_away += removed
+        logger.info(f"📒 Compacted booking log: {removed} bookings removed, {len(sealed)} -> {len(outputs)} "
+                    f"sealed segments in {time.perf_counter() - started:.2f}s")
+        return removed
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bookings": self._count(),
+                "users": len(self._by_uid),
+                "segments": len(self._segments),
+                "bytes": sum(s.size for s in self._segments.values()),
+                "appends": self.appends,
+                "rotations": self.rotations,
+                "compactions": self.compactions,
+                "compacted_away": self.compacted_away,
+                "append_latency": self.append_latency.snapshot(),
+                "read_latency": self.read_latency.snapshot(),
+            }
+
+
+_log: Optional[BookingLog] = None
+_log_lock = threading.Lock()
+
+
+def get_booking_log() -> BookingLog:
+    """Shared booking log, loaded on first use."""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = BookingLog()
+    return _log
+
+
+def open_booking_log():
+    """Load the log and apply the configured retention (blocking; run at startup)."""
+    log = get_booking_log()
+    if BOOKING_RETENTION_DAYS or BOOKING_KEEP_PER_USER:
+        log.compact(BOOKING_RETENTION_DAYS * 86400 or None, BOOKING_KEEP_PER_USER or None)
+
+
+def close_booking_log():
+    global _log
+    with _log_lock:
+        if _log is not None:
+            _log.close()
+            _log = None
+
+
+def booking_log_stats() -> Dict[str, Any]:
+    if _log is None:
+        return {"loaded": False}
+    return {"loaded": True, **_log.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking log tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact_cmd = commands.add_parser("compact", help="Drop old bookings and merge sealed segments")
+    compact_cmd.add_argument("--dir", default=BOOKING_LOG_DIR)
+    compact_cmd.add_argument("--retention-days", type=float, default=BOOKING_RETENTION_DAYS)
+    compact_cmd.add_argument("--keep-per-user", type=int, default=BOOKING_KEEP_PER_USER)
+    args = parser.parse_args()
+
+    try:
+        log = BookingLog(args.dir)
+    except RuntimeError as e:
+        parser.exit(1, f"❌ {e}; stop the app first\n")
+    before = log.stats()
+    removed = log.compact(args.retention_days * 86400 or None, args.keep_per_user or None)
+    after = log.stats()
+    log.close()
+    print(f"📒 Removed {removed} of {before['bookings']} bookings; "
+          f"{before['segments']} -> {after['segments']} segments, {before['bytes']:,} -> {after['bytes']:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
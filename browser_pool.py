@@ -1,87 +1,474 @@
 """
 Persistent browser pool to maintain Uber sessions across requests.
-Keeps browsers alive to avoid session expiration.
+A few shared Chromium processes host every user as an isolated
+BrowserContext (own cookies, storage and cache), instead of one browser
+process per user. New users go to the least-loaded browser; another browser
+is launched once all are holding BROWSER_CONTEXTS_PER_BROWSER contexts, up to
+BROWSER_POOL_SIZE. Beyond that the least recently used idle context is
+closed to make room, and when every context is in use the request waits
+for one to be released. If a browser crashes only the users it hosted lose their
+context, and they get a new one in a live browser on their next request.
+
+Up to BROWSER_WARM_CONTEXTS recently active users are kept warm: their page
+is parked on the booking form between bookings and reloaded in the
+background before it is BROWSER_WARM_MAX_AGE seconds old, so acquire()
+hands it out without navigating. Anyone else gets a cold page that is
+navigated on acquire.
 """
 
 import asyncio
-from typing import Optional, Dict, Any
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 
+from metrics import LatencyStats
+from simple_storage import load_session
+
+logger = logging.getLogger(__name__)
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_CONTEXTS_PER_BROWSER = int(os.getenv("BROWSER_CONTEXTS_PER_BROWSER", "16"))
+# Contexts idle longer than this are closed by the reaper every BROWSER_REAP_INTERVAL seconds
+# Contexts older than this are closed by the reaper every BROWSER_REAP_INTERVAL seconds
+BROWSER_CONTEXT_MAX_AGE = float(os.getenv("BROWSER_CONTEXT_MAX_AGE", "3600"))
+BROWSER_REAP_INTERVAL = float(os.getenv("BROWSER_REAP_INTERVAL", "300"))
+# Chromium's /dev/shm default is too small in containers
+BROWSER_ARGS = ["--disable-dev-shm-usage"]
+BROWSER_WARM_CONTEXTS = int(os.getenv("BROWSER_WARM_CONTEXTS", "4"))
+# Parked pages are reloaded in the background before they reach this age
+BROWSER_WARM_MAX_AGE = float(os.getenv("BROWSER_WARM_MAX_AGE", "600"))
+BROWSER_WARM_URL = os.getenv("BROWSER_WARM_URL", "https://www.uber.com")
+# Present once the booking form can take input
+BOOKING_FORM_SELECTOR = 'input[placeholder*="Where"]'
+# A cold acquire waits no longer for the form than the fixed 2 s settle it replaced;
+# background parking has nobody waiting on it and allows longer
+COLD_FORM_TIMEOUT_MS = 2000
+PARK_FORM_TIMEOUT_MS = 10000
+
+
+class _SharedBrowser:
+    """One Chromium process and the users whose contexts it hosts."""
+
+    def __init__(self, browser: Browser, number: int):
+        self.browser = browser
+        self.number = number
+        self.uids: set = set()
+        self.alive = True
+
+
 class BrowserPool:
-    """Manages persistent browser contexts for each user."""
-    
-    def __init__(self):
-        self.browsers: Dict[str, Dict[str, Any]] = {}
+    """Manages persistent browser contexts for each user in shared browsers."""
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, contexts_per_browser: int = BROWSER_CONTEXTS_PER_BROWSER,
+                 launch: Optional[Callable[[], Awaitable[Browser]]] = None, warm_contexts: int = BROWSER_WARM_CONTEXTS,
+                 warm_max_age: float = BROWSER_WARM_MAX_AGE, url: str = BROWSER_WARM_URL):
+        self.size = max(1, size)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.warm_contexts = warm_contexts
+        self.warm_max_age = warm_max_age
+        self.url = url
+        self.contexts: Dict[str, Dict[str, Any]] = {}
         self.playwright = None
-    
+        self._launch_fn = launch
+        self._shared: List[_SharedBrowser] = []
+        self._launch_lock = asyncio.Lock()
+        self._uid_locks: Dict[str, asyncio.Lock] = {}
+        # Set whenever a context is closed or released, for requests waiting on a full pool
+        self._slot_freed = asyncio.Event()
+        self._reaper: Optional[asyncio.Task] = None
+        self.acquire_latency = LatencyStats()
+        self.launch_latency = LatencyStats()
+        self.launches = 0
+        self.crashes = 0
+        self.reused = 0
+        self.created = 0
+        self.capacity_evictions = 0
+        self.capacity_waits = 0
+        self.reaped = 0
+        self._launched = 0
+        # Warm users, least recently used first
+        self._warm: "OrderedDict[str, None]" = OrderedDict()
+        self._warmer: Optional[asyncio.Task] = None
+        self._park_tasks: set = set()
+        self.park_latency = LatencyStats()
+        self.warm_hits = 0
+        self.cold_misses = 0
+        self.parks = 0
+        self.park_failures = 0
+        self.refreshes = 0
+        self.warm_evictions = 0
+
     async def initialize(self):
         """Initialize Playwright."""
-        if not self.playwright:
+        if not self.playwright and self._launch_fn is None:
             self.playwright = await async_playwright().start()
-    
-    async def get_or_create_browser(self, uid: str, session_data: Dict[str, Any]) -> Page:
-        """Get existing browser or create new one for user."""
-        await self.initialize()
-        
-        # If browser exists and is still alive, reuse it
-        if uid in self.browsers:
-            browser_info = self.browsers[uid]
-            try:
-                # Test if browser is still alive
-                if browser_info["page"] and not browser_info["page"].is_closed():
-                    print(f"Reusing existing browser for {uid}")
-                    return browser_info["page"]
-            except:
-                pass
-        
-        # Create new browser
-        print(f"Creating new browser for {uid}")
-        browser = await self.playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=session_data)
-        page = await context.new_page()
-        
-        # Store browser info
-        self.browsers[uid] = {
-            "browser": browser,
+
+    async def _launch(self) -> _SharedBrowser:
+        started = time.perf_counter()
+        if self._launch_fn is not None:
+            browser = await self._launch_fn()
+        else:
+            browser = await self.playwright.chromium.launch(headless=BROWSER_HEADLESS, args=BROWSER_ARGS)
+        self.launch_latency.record(time.perf_counter() - started)
+        self.launches += 1
+        self._launched += 1
+        shared = _SharedBrowser(browser, self._launched)
+        browser.on("disconnected", lambda _: self._on_disconnected(shared))
+        self._shared.append(shared)
+        logger.info(f"🌐 Launched shared browser #{shared.number} ({len(self._shared)}/{self.size})")
+        return shared
+
+    def _on_disconnected(self, shared: _SharedBrowser):
+        """Forget a browser that exited; its users' contexts went with it."""
+        if not shared.alive:
+            return
+        shared.alive = False
+        if shared in self._shared:
+            self._shared.remove(shared)
+        lost = [uid for uid in shared.uids if self.contexts.get(uid, {}).get("shared") is shared]
+        for uid in lost:
+            del self.contexts[uid]
+        self.crashes += 1
+        if lost:
+            logger.warning(f"⚠️ Shared browser #{shared.number} disconnected; {len(lost)} user contexts will be recreated")
+
+    async def _pick_browser(self, uid: str) -> _SharedBrowser:
+        """
+        Least-loaded live browser with room, launching another when all are
+        full. At BROWSER_POOL_SIZE the least recently used idle context is
+        closed to make room, or the caller waits for a context to be freed.
+        The slot is reserved for uid before the launch lock is released.
+        """
+        while True:
+            async with self._launch_lock:
+                live = [s for s in self._shared if s.alive and s.browser.is_connected()]
+                for shared in self._shared:
+                    if shared not in live:
+                        self._on_disconnected(shared)
+                roomy = [s for s in live if len(s.uids) < self.contexts_per_browser]
+                if roomy:
+                    shared = min(roomy, key=lambda s: len(s.uids))
+                elif len(live) < self.size:
+                    shared = await self._launch()
+                else:
+                    idle = [other for other, info in self.contexts.items() if not info["in_use"]
+                            and not (other in self._uid_locks and self._uid_locks[other].locked())]
+                    if not idle:
+                        # Every context is in a booking: wait for one to be released
+                        self.capacity_waits += 1
+                        self._slot_freed.clear()
+                        shared = None
+                    else:
+                        victim = min(idle, key=lambda other: self.contexts[other]["last_used"])
+                        shared = self.contexts[victim]["shared"]
+                        logger.info(f"♻️ Browser pool full; closing the idle context of {victim}")
+                        self.capacity_evictions += 1
+                        self._warm.pop(victim, None)
+                        await self._close_context(victim)
+                if shared is not None:
+                    shared.uids.add(uid)
+                    return shared
+            await self._slot_freed.wait()
+
+    def _usable(self, info: Dict[str, Any]) -> bool:
+        try:
+            return info["shared"].alive and info["page"] is not None and not info["page"].is_closed()
+        except Exception:
+            return False
+
+    async def _get_or_create(self, uid: str, session_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """The user's context entry, opening one if needed; call with the uid lock held."""
+        info = self.contexts.get(uid)
+        if info is not None and self._usable(info):
+            info["last_used"] = time.monotonic()
+            self.reused += 1
+            return info
+        if info is not None:
+            await self._close_context(uid)
+
+        shared = await self._pick_browser(uid)
+        logger.info(f"Creating browser context for {uid} in shared browser #{shared.number}")
+        try:
+            context: BrowserContext = await shared.browser.new_context(storage_state=session_data)
+        except Exception:
+            self._free_slot(shared, uid)
+            raise
+        try:
+            page = await context.new_page()
+        except Exception:
+            self._free_slot(shared, uid)
+            await context.close()
+            raise
+        now = time.monotonic()
+        self.contexts[uid] = info = {
+            "shared": shared,
             "context": context,
             "page": page,
-            "created_at": asyncio.get_event_loop().time(),
+            "created_at": now,
+            "last_used": now,
+            "parked_at": None,
+            "in_use": False,
         }
-        
+        self.created += 1
+        return info
+
+    def _lock(self, uid: str) -> asyncio.Lock:
+        # Never removed: a holder or waiter of a dropped lock would no longer exclude a new one
+        return self._uid_locks.setdefault(uid, asyncio.Lock())
+
+    async def get_or_create_browser(self, uid: str, session_data: Dict[str, Any]) -> Page:
+        """Get the user's existing page or open a context for them in a shared browser."""
+        started = time.perf_counter()
+        await self.initialize()
+        async with self._lock(uid):
+            page = (await self._get_or_create(uid, session_data))["page"]
+        self.acquire_latency.record(time.perf_counter() - started)
         return page
-    
-    async def close_browser(self, uid: str):
-        """Close browser for user."""
-        if uid in self.browsers:
-            browser_info = self.browsers[uid]
+
+    async def _load_booking_form(self, page: Page, form_timeout: int = PARK_FORM_TIMEOUT_MS) -> bool:
+        """Open the booking page; True once its form is ready for input within form_timeout ms."""
+        try:
+            await page.goto(self.url, wait_until="domcontentloaded", timeout=30000)
+        except Exception as e:
+            logger.warning(f"Navigation error: {e}, trying reload...")
             try:
-                await browser_info["context"].close()
-                await browser_info["browser"].close()
-            except:
+                await page.reload(wait_until="domcontentloaded")
+            except Exception:
                 pass
-            del self.browsers[uid]
-    
-    async def cleanup_old_browsers(self, max_age_seconds: int = 3600):
-        """Close browsers older than max_age_seconds."""
-        current_time = asyncio.get_event_loop().time()
-        uids_to_close = []
-        
-        for uid, browser_info in self.browsers.items():
-            age = current_time - browser_info["created_at"]
-            if age > max_age_seconds:
-                uids_to_close.append(uid)
-        
-        for uid in uids_to_close:
-            print(f"Closing old browser for {uid}")
+        try:
+            await page.wait_for_selector(BOOKING_FORM_SELECTOR, timeout=form_timeout)
+            return True
+        except Exception:
+            return False
+
+    def _is_warm(self, info: Dict[str, Any]) -> bool:
+        parked_at = info.get("parked_at")
+        return parked_at is not None and time.monotonic() - parked_at < self.warm_max_age and self._usable(info)
+
+    async def acquire(self, uid: str, session_data: Dict[str, Any]) -> Tuple[Page, bool]:
+        """
+        The user's page on the booking form, reserved until release(uid), and
+        whether it was warm. A warm page is returned as parked; a cold one is
+        navigated first.
+        """
+        started = time.perf_counter()
+        await self.initialize()
+        async with self._lock(uid):
+            info = await self._get_or_create(uid, session_data)
+            warm = self._is_warm(info)
+            info["in_use"] = True
+            info["parked_at"] = None
+        if warm:
+            self.warm_hits += 1
+        else:
+            self.cold_misses += 1
+            await self._load_booking_form(info["page"], COLD_FORM_TIMEOUT_MS)
+        self.acquire_latency.record(time.perf_counter() - started)
+        return info["page"], warm
+
+    def release(self, uid: str) -> Optional[asyncio.Task]:
+        """Return an acquired page; the user is kept warm and the page parked again in the background."""
+        info = self.contexts.get(uid)
+        if info is None or not info["in_use"]:
+            return None
+        info["in_use"] = False
+        info["last_used"] = time.monotonic()
+        self._slot_freed.set()
+        return self.keep_warm(uid)
+
+    def keep_warm(self, uid: str, new_session: bool = False) -> Optional[asyncio.Task]:
+        """
+        Keep uid's page parked on the booking form (e.g. after login or a
+        booking), evicting the least recently active warm user beyond the
+        limit. new_session reopens the context with the freshly saved session.
+        """
+        if self.warm_contexts <= 0:
+            return None
+        self._warm[uid] = None
+        self._warm.move_to_end(uid)
+        while len(self._warm) > self.warm_contexts:
+            evicted, _ = self._warm.popitem(last=False)
+            self.warm_evictions += 1
+            info = self.contexts.get(evicted)
+            if info is not None and not info["in_use"]:
+                self._spawn(self.close_browser(evicted))
+        return self._spawn(self._park(uid, new_session))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._park_tasks.add(task)
+        task.add_done_callback(self._park_tasks.discard)
+        return task
+
+    async def _park(self, uid: str, new_session: bool = False):
+        """Load the booking form in uid's page so the next acquire is warm."""
+        await self.initialize()
+        async with self._lock(uid):
+            if uid not in self._warm:
+                return
+            info = self.contexts.get(uid)
+            if info is not None and info["in_use"]:
+                return
+            if info is not None and new_session:
+                await self._close_context(uid)
+            started = time.perf_counter()
+            try:
+                session_data = None
+                if uid not in self.contexts:
+                    session_data = load_session(uid)
+                    if not session_data:
+                        self._warm.pop(uid, None)
+                        return
+                info = await self._get_or_create(uid, session_data)
+                ready = await self._load_booking_form(info["page"])
+            except Exception as e:
+                logger.warning(f"⚠️ Could not warm a browser context for {uid}: {e}")
+                ready = False
+            self.park_latency.record(time.perf_counter() - started)
+            if ready and uid in self.contexts:
+                self.contexts[uid]["parked_at"] = time.monotonic()
+                self.parks += 1
+            else:
+                self.park_failures += 1
+
+    async def refresh_warm(self):
+        """Re-park warm pages that are unparked or will go stale before the next pass."""
+        horizon = time.monotonic() - self.warm_max_age * 0.75
+        for uid in list(self._warm):
+            info = self.contexts.get(uid)
+            if info is not None and info["in_use"]:
+                continue
+            if info is None or info["parked_at"] is None or info["parked_at"] < horizon:
+                self.refreshes += 1
+                await self._park(uid)
+
+    async def _warm_loop(self):
+        interval = max(5.0, self.warm_max_age / 4)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_warm()
+            except Exception as e:
+                logger.warning(f"⚠️ Warm context refresh failed: {e}")
+
+    def start_warmer(self, uids: List[str] = ()) -> Optional[asyncio.Task]:
+        """Warm uids (most recent first) and start the background refresher."""
+        if self.warm_contexts <= 0:
+            return None
+        for uid in reversed(list(uids)[: self.warm_contexts]):
+            self.keep_warm(uid)
+        if self._warmer is None or self._warmer.done():
+            self._warmer = asyncio.create_task(self._warm_loop())
+        return self._warmer
+
+    def _free_slot(self, shared: _SharedBrowser, uid: str):
+        shared.uids.discard(uid)
+        self._slot_freed.set()
+
+    async def _close_context(self, uid: str):
+        info = self.contexts.pop(uid, None)
+        if info is None:
+            return
+        self._free_slot(info["shared"], uid)
+        try:
+            await info["context"].close()
+        except Exception:
+            pass
+
+    async def close_browser(self, uid: str):
+        """Close the user's context; the shared browser keeps running for others."""
+        await self._close_context(uid)
+        self._warm.pop(uid, None)
+
+    async def cleanup_old_browsers(self, max_age_seconds: float = BROWSER_CONTEXT_MAX_AGE):
+        """Close contexts idle for max_age_seconds (warm users excepted), then browsers left with no users (one is kept)."""
+        current_time = time.monotonic()
+        idle = [uid for uid, info in self.contexts.items()
+                if current_time - info["last_used"] > max_age_seconds
+                and not info["in_use"] and uid not in self._warm]
+        for uid in idle:
+            logger.info(f"🧹 Closing idle browser context for {uid}")
             await self.close_browser(uid)
-    
+            self.reaped += 1
+        async with self._launch_lock:
+            for shared in [s for s in self._shared if not s.uids][: max(0, len(self._shared) - 1)]:
+                await self._close_shared(shared)
+
+    async def _reap_loop(self, interval: float, max_age: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.cleanup_old_browsers(max_age)
+            except Exception as e:
+                logger.warning(f"⚠️ Browser context cleanup failed: {e}")
+
+    def start_reaper(self, interval: float = BROWSER_REAP_INTERVAL,
+                     max_age: float = BROWSER_CONTEXT_MAX_AGE) -> asyncio.Task:
+        """Run cleanup_old_browsers every interval seconds until shutdown."""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop(interval, max_age))
+        return self._reaper
+
+    async def _close_shared(self, shared: _SharedBrowser):
+        shared.alive = False
+        if shared in self._shared:
+            self._shared.remove(shared)
+        try:
+            await shared.browser.close()
+        except Exception:
+            pass
+
     async def shutdown(self):
-        """Close all browsers and Playwright."""
-        for uid in list(self.browsers.keys()):
+        """Close all contexts, browsers and Playwright."""
+        for task in (self._warmer, self._reaper):
+            if task is not None:
+                task.cancel()
+        self._warmer = self._reaper = None
+        for task in list(self._park_tasks):
+            task.cancel()
+        for uid in list(self.contexts.keys()):
             await self.close_browser(uid)
-        
+        for shared in list(self._shared):
+            await self._close_shared(shared)
         if self.playwright:
             await self.playwright.stop()
+            self.playwright = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.warm_hits + self.cold_misses
+        return {
+            "browsers": len(self._shared),
+            "max_browsers": self.size,
+            "contexts_per_browser": self.contexts_per_browser,
+            "contexts": len(self.contexts),
+            "load": [len(s.uids) for s in self._shared],
+            "launches": self.launches,
+            "crashes": self.crashes,
+            "contexts_created": self.created,
+            "contexts_reused": self.reused,
+            "capacity_evictions": self.capacity_evictions,
+            "capacity_waits": self.capacity_waits,
+            "reaped": self.reaped,
+            "acquire": self.acquire_latency.snapshot(),
+            "launch": self.launch_latency.snapshot(),
+            "warm": {
+                "users": len(self._warm),
+                "limit": self.warm_contexts,
+                "parked": sum(1 for uid in self._warm if uid in self.contexts and self._is_warm(self.contexts[uid])),
+                "hits": self.warm_hits,
+                "misses": self.cold_misses,
+                "hit_ratio": round(self.warm_hits / lookups, 3) if lookups else None,
+                "parks": self.parks,
+                "park_failures": self.park_failures,
+                "refreshes": self.refreshes,
+                "evictions": self.warm_evictions,
+                "park": self.park_latency.snapshot(),
+            },
+        }
 
 # Global browser pool
 browser_pool = BrowserPool()
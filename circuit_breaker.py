@@ -0,0 +1,72 @@
+"""
+Circuit breaker for calls to a flaky dependency (the extraction LLM).
+After enough consecutive failures the circuit opens and calls are refused
+outright, so callers go straight to their fallback instead of waiting on a
+dependency that is down. After a cool-down one probe call is let through;
+its outcome closes the circuit again or re-opens it.
+"""
+
+import os
+import time
+from typing import Any, Dict, Optional
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_S):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """Whether a call may go through right now."""
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_after:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_at = None
+        if self.state == HALF_OPEN:
+            # One probe at a time; a probe that never reported back expires
+            if self._probe_at is not None and now - self._probe_at < self.reset_after:
+                self.rejected += 1
+                return False
+            self._probe_at = now
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_at = None
+
+    def record_failure(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = now
+            self._probe_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,134 @@
+"""
+Typed, bounded per-user conversation bucket.
+Holds everything the webhook collects for one uid between silence flushes,
+replacing the segment_buckets dict and its f"{uid}_..." side-channel keys.
+"""
+
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Per-user caps: oldest segments are dropped once either limit is reached
+BUCKET_MAX_SEGMENTS = int(os.getenv("BUCKET_MAX_SEGMENTS", "64"))
+BUCKET_MAX_BYTES = int(os.getenv("BUCKET_MAX_BYTES", "16384"))
+
+
+def _segment_fields(seg) -> Tuple[str, str]:
+    """(text, speaker) of a dict or Pydantic segment."""
+    if isinstance(seg, dict):
+        return seg.get("text", ""), seg.get("speaker", "")
+    return seg.text, seg.speaker
+
+
+def _text_size(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+class ConversationBucket:
+    """
+    Ring buffer of voice segments plus the metadata needed to book a ride.
+    Segments are kept as (text, speaker) tuples and handed back as dicts.
+    """
+
+    __slots__ = (
+        "uid",
+        "segments",
+        "text_bytes",
+        "max_segments",
+        "max_bytes",
+        "gps_lat",
+        "gps_lon",
+        "phone_ip",
+        "first_arrival",
+        "last_arrival",
+        "timer",
+        "dropped",
+    )
+
+    def __init__(self, uid: str, max_segments: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.uid = uid
+        self.segments: List[Tuple[str, str]] = []
+        self.text_bytes = 0
+        self.max_segments = BUCKET_MAX_SEGMENTS if max_segments is None else max_segments
+        self.max_bytes = BUCKET_MAX_BYTES if max_bytes is None else max_bytes
+        self.gps_lat: Optional[float] = None
+        self.gps_lon: Optional[float] = None
+        self.phone_ip: Optional[str] = None
+        self.first_arrival: Optional[float] = None
+        self.last_arrival: Optional[float] = None
+        self.timer = None
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def add(self, segments: Iterable[Any], now: Optional[float] = None) -> int:
+        """
+        Append segments, evicting the oldest ones to stay within the caps.
+        Returns the number of segments appended.
+        """
+        now = time.time() if now is None else now
+        if self.first_arrival is None:
+            self.first_arrival = now
+        self.last_arrival = now
+
+        added = 0
+        buffer = self.segments
+        for seg in segments:
+            text, speaker = _segment_fields(seg)
+            size = _text_size(text)
+            if size > self.max_bytes:
+                self.dropped += 1
+                continue
+            buffer.append((text, speaker))
+            self.text_bytes += size
+            added += 1
+
+        # Evict oldest first; caps are small so shifting the list is cheap
+        evict = 0
+        while len(buffer) - evict > self.max_segments or self.text_bytes > self.max_bytes:
+            self.text_bytes -= _text_size(buffer[evict][0])
+            evict += 1
+        if evict:
+            del buffer[:evict]
+            self.dropped += evict
+        return added
+
+    def update_location(self, phone_ip: Optional[str] = None, gps_lat: Optional[float] = None, gps_lon: Optional[float] = None):
+        """Keep the most recent IP and GPS fix reported by the device."""
+        if phone_ip:
+            self.phone_ip = phone_ip
+        if gps_lat is not None and gps_lon is not None:
+            self.gps_lat = gps_lat
+            self.gps_lon = gps_lon
+
+    def text(self) -> str:
+        """All buffered segment texts joined with spaces."""
+        return " ".join(text for text, _ in self.segments)
+
+    def snapshot(self) -> List[Dict[str, str]]:
+        """Buffered segments as webhook-style dicts, oldest first."""
+        return [{"text": text, "speaker": speaker} for text, speaker in self.segments]
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and timing counters for this bucket."""
+        return {
+            "segments": len(self.segments),
+            "bytes": self.text_bytes,
+            "dropped": self.dropped,
+            "first_arrival": self.first_arrival,
+            "last_arrival": self.last_arrival,
+        }
+
+    def clear(self):
+        """Cancel the pending timer and drop every reference the bucket holds."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.segments.clear()
+        self.text_bytes = 0
+        self.gps_lat = None
+        self.gps_lon = None
+        self.phone_ip = None
+        self.first_arrival = None
+        self.last_arrival = None
@@ -0,0 +1,298 @@
+"""
+Pluggable backends for ride-intent extraction.
+validate_and_extract_ride_request asks the configured backend for a
+(is_ride_request, start_location, end_location) verdict:
+
+    openai   hosted chat-completions model (LLM_BASE_URL / OPENAI_API_KEY)
+    standin  the same client pointed at llm_standin_server.py, for offline load tests
+    rules    deterministic local parser, no network at all
+
+Network backends are wrapped in a GuardedBackend: a per-request latency
+budget, a hedged duplicate request once an attempt runs past the observed
+p95, jittered retries and a circuit breaker. When it gives up it raises
+ExtractionUnavailable and the caller falls back to the local parser.
+"""
+
+import abc
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import ride_detector
+from circuit_breaker import CircuitBreaker
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "openai")
+LLM_STANDIN_URL = os.getenv("LLM_STANDIN_URL", "http://127.0.0.1:8900/v1")
+EXTRACTION_GUARD = os.getenv("EXTRACTION_GUARD", "true").lower() == "true"
+# Longest a user waits for an extraction before the local parser answers
+EXTRACTION_BUDGET_MS = float(os.getenv("EXTRACTION_BUDGET_MS", "3000"))
+EXTRACTION_HEDGE = os.getenv("EXTRACTION_HEDGE", "true").lower() == "true"
+# Hedge after the p95 attempt latency, never sooner than EXTRACTION_HEDGE_MIN_MS;
+# EXTRACTION_HEDGE_INITIAL_MS until there are enough samples
+EXTRACTION_HEDGE_MIN_MS = float(os.getenv("EXTRACTION_HEDGE_MIN_MS", "200"))
+EXTRACTION_HEDGE_INITIAL_MS = float(os.getenv("EXTRACTION_HEDGE_INITIAL_MS", "1000"))
+EXTRACTION_RETRIES = int(os.getenv("EXTRACTION_RETRIES", "2"))
+EXTRACTION_RETRY_BASE_MS = float(os.getenv("EXTRACTION_RETRY_BASE_MS", "100"))
+
+_HEDGE_MIN_SAMPLES = 20
+
+Intent = Tuple[bool, Optional[str], Optional[str]]
+OnField = Optional[Callable[[str, Any], None]]
+
+
+class ExtractionBackend(abc.ABC):
+    """Turns an utterance into a ride verdict; None when no verdict could be read."""
+
+    name = "base"
+
+    def __init__(self):
+        self.latency = LatencyStats()
+        self.calls = 0
+        self.failures = 0
+
+    async def extract(self, text: str, on_field: OnField = None) -> Optional[Intent]:
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            return await self._extract(text, on_field)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.latency.record(time.perf_counter() - started)
+
+    @abc.abstractmethod
+    async def _extract(self, text: str, on_field: OnField) -> Optional[Intent]:
+        """Backend-specific verdict for text; extract() adds the bookkeeping."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class LLMBackend(ExtractionBackend):
+    """Chat-completions model behind ride_detector's pooled, batched, streaming client."""
+
+    name = "openai"
+
+    async def _extract(self, text: str, on_field: OnField) -> Optional[Intent]:
+        return await ride_detector.extract_with_llm(text, on_field)
+
+    async def close(self):
+        await ride_detector.close_llm_client()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "llm": ride_detector.llm_stats()}
+
+
+class StandInBackend(LLMBackend):
+    """LLMBackend talking to a local stand-in server instead of the hosted API."""
+
+    name = "standin"
+
+    def __init__(self, base_url: str = LLM_STANDIN_URL):
+        super().__init__()
+        self.base_url = base_url
+        ride_detector.set_llm_client(ride_detector.build_llm_client(base_url, api_key="standin"))
+
+
+class RuleBasedBackend(ExtractionBackend):
+    """Regex trigger plus "to X" / "from X to Y" parsing, in microseconds."""
+
+    name = "rules"
+
+    async def _extract(self, text: str, on_field: OnField) -> Optional[Intent]:
+        intent = ride_detector.parse_ride_request(text)
+        if on_field is not None:
+            for name, value in zip(("is_ride", "start", "end"), intent):
+                on_field(name, value)
+        return intent
+
+
+class ExtractionUnavailable(Exception):
+    """The guarded backend gave up (circuit open, budget spent or attempts failed)."""
+
+
+def _first_fields(on_field: OnField) -> OnField:
+    # Hedged and retried attempts race; each field is reported once
+    if on_field is None:
+        return None
+    seen = set()
+
+    def forward(name: str, value: Any):
+        if name not in seen:
+            seen.add(name)
+            on_field(name, value)
+
+    return forward
+
+
+class GuardedBackend(ExtractionBackend):
+    """Latency budget, p95 hedging, jittered retries and a circuit breaker around a network backend."""
+
+    def __init__(
+        self,
+        inner: ExtractionBackend,
+        budget: float = EXTRACTION_BUDGET_MS / 1000,
+        hedge: bool = EXTRACTION_HEDGE,
+        hedge_min: float = EXTRACTION_HEDGE_MIN_MS / 1000,
+        hedge_initial: float = EXTRACTION_HEDGE_INITIAL_MS / 1000,
+        retries: int = EXTRACTION_RETRIES,
+        retry_base: float = EXTRACTION_RETRY_BASE_MS / 1000,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__()
+        self.inner = inner
+        self.name = inner.name
+        self.budget = budget
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.hedge_initial = hedge_initial
+        self.retries = retries
+        self.retry_base = retry_base
+        self.breaker = breaker or CircuitBreaker()
+        # Successful single attempts, for the hedge threshold
+        self.attempt_latency = LatencyStats(window=512)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.retried = 0
+        self.budget_exhausted = 0
+        self.short_circuited = 0
+
+    def hedge_delay(self) -> float:
+        if self.attempt_latency.count < _HEDGE_MIN_SAMPLES:
+            return self.hedge_initial
+        return max(self.hedge_min, self.attempt_latency.percentile(95))
+
+    async def _extract(self, text: str, on_field: OnField) -> Optional[Intent]:
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise ExtractionUnavailable("circuit open")
+        try:
+            intent = await asyncio.wait_for(self._with_retries(text, _first_fields(on_field)), self.budget)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            self.budget_exhausted += 1
+            raise ExtractionUnavailable(f"latency budget of {self.budget * 1000:.0f} ms exhausted")
+        except Exception as e:
+            self.breaker.record_failure()
+            raise ExtractionUnavailable(f"all attempts failed: {e}") from e
+        self.breaker.record_success()
+        return intent
+
+    async def _with_retries(self, text: str, on_field: OnField) -> Optional[Intent]:
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(text, on_field)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                # Full jitter keeps retries from many users from arriving in step
+                await asyncio.sleep(random.uniform(0, self.retry_base * 2 ** attempt))
+
+    async def _attempt(self, text: str, on_field: OnField) -> Optional[Intent]:
+        started = time.perf_counter()
+        intent = await self.inner.extract(text, on_field)
+        self.attempt_latency.record(time.perf_counter() - started)
+        return intent
+
+    async def _hedged(self, text: str, on_field: OnField) -> Optional[Intent]:
+        tasks = [asyncio.ensure_future(self._attempt(text, on_field))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay() if self.hedge else None)
+            if not done:
+                self.hedged += 1
+                tasks.append(asyncio.ensure_future(self._attempt(text, on_field)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        await self.inner.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.inner.stats(),
+            "guard": {
+                "budget_ms": self.budget * 1000,
+                "latency": self.latency.snapshot(),
+                "hedge_after_ms": round(self.hedge_delay() * 1000, 1) if self.hedge else None,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "retried": self.retried,
+                "budget_exhausted": self.budget_exhausted,
+                "short_circuited": self.short_circuited,
+                "breaker": self.breaker.stats(),
+            },
+        }
+
+
+_BACKENDS = {
+    "openai": LLMBackend,
+    "standin": StandInBackend,
+    "rules": RuleBasedBackend,
+}
+
+_backend: Optional[ExtractionBackend] = None
+
+
+def create_backend(name: str, guard: bool = EXTRACTION_GUARD) -> ExtractionBackend:
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown extraction backend {name!r} (choose from {', '.join(_BACKENDS)})")
+    backend = _BACKENDS[name]()
+    # The rule parser is local and cannot time out
+    if guard and isinstance(backend, LLMBackend):
+        backend = GuardedBackend(backend)
+    return backend
+
+
+def get_backend() -> ExtractionBackend:
+    """The configured backend, created on first use."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(EXTRACTION_BACKEND)
+        logger.info(f"🔌 Ride extraction backend: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend: Optional[ExtractionBackend]):
+    """Swap the backend (tests, benchmarks); None goes back to EXTRACTION_BACKEND."""
+    global _backend
+    _backend = backend
+
+
+async def close_backend():
+    if _backend is not None:
+        await _backend.close()
+
+
+def backend_stats() -> Dict[str, Any]:
+    return {
+        **get_backend().stats(),
+        "local_fallbacks": ride_detector.extraction_fallbacks,
+    }
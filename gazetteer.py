@@ -0,0 +1,307 @@
+"""
+Local fuzzy gazetteer for extracted pickup / destination names.
+Transcribed or misspelled names ("77 N alamden ave", "palace of fine arts")
+are matched against a places file and replaced by their canonical form before
+they go into Uber's search box, which saves autocomplete round trips and
+wrong suggestions.
+
+Each place is indexed by the character trigrams of its normalized name plus
+a Soundex key per word, so spelling mistakes that sound right still share
+features. Postings live in flat NumPy arrays (feature id -> sorted doc ids);
+a lookup merges the postings of its rarest features, keeps the best
+candidates and re-scores them exactly.
+
+The places file is a TSV: canonical name<TAB>|-separated aliases.
+"""
+
+import logging
+import os
+import re
+import time
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "true").lower() == "true"
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "places.tsv")
+)
+# Similarity (0-1) a match needs before it replaces the spoken name
+GAZETTEER_MIN_SCORE = float(os.getenv("GAZETTEER_MIN_SCORE", "0.75"))
+
+# Postings merged into the candidate seed per lookup
+_MAX_POSTINGS = 1024
+# Seeds whose remaining features are counted, and candidates re-scored exactly
+_REFINE = 128
+_CANDIDATES = 16
+_PHONETIC_WEIGHT = 0.3
+# A different place scoring this close to the best makes the name ambiguous ("airport")
+_AMBIGUITY_MARGIN = 0.05
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ABBREVIATIONS = {
+    "n": "north", "s": "south", "e": "east", "w": "west",
+    "st": "street", "ave": "avenue", "av": "avenue", "blvd": "boulevard", "rd": "road",
+    "dr": "drive", "ln": "lane", "ct": "court", "pl": "place", "hwy": "highway", "pkwy": "parkway",
+    "sq": "square", "stn": "station", "univ": "university", "intl": "international", "mt": "mount",
+    "sf": "san francisco", "sj": "san jose",
+}
+_STOP_WORDS = {"the", "a", "an", "of", "at", "in", "and"}
+_SOUNDEX = {c: d for d, letters in enumerate(("bfpv", "cgjkqsxz", "dt", "l", "mn", "r"), 1) for c in letters}
+
+
+def normalize_place(text: str) -> str:
+    """Lowercase words with abbreviations expanded and filler words dropped."""
+    words = []
+    for word in _WORD.findall(text.lower().replace("'", "")):
+        if word in _STOP_WORDS:
+            continue
+        words.append(_ABBREVIATIONS.get(word, word))
+    return " ".join(words)
+
+
+@lru_cache(maxsize=65536)
+def soundex(word: str) -> str:
+    """Four-character Soundex code; digits are kept as they are."""
+    if word.isdigit():
+        return word
+    code, last = word[0], _SOUNDEX.get(word[0])
+    for c in word[1:]:
+        digit = _SOUNDEX.get(c)
+        if digit is not None and digit != last:
+            code += str(digit)
+            if len(code) == 4:
+                break
+        if c not in "hw":
+            last = digit
+    return code.ljust(4, "0")
+
+
+def _trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _phonetic(normalized: str) -> set:
+    return {"#" + soundex(word) for word in normalized.split()}
+
+
+def _numbers(normalized: str) -> set:
+    return {word for word in normalized.split() if word.isdigit()}
+
+
+@lru_cache(maxsize=65536)
+def _features(normalized: str) -> Tuple[set, set, set]:
+    """Trigrams, phonetic keys and numbers of a normalized name (popular places repeat across lookups)."""
+    return _trigrams(normalized), _phonetic(normalized), _numbers(normalized)
+
+
+def _dice(a: set, b: set) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def _narrows(query: List[str], candidate: List[str]) -> bool:
+    """Whether candidate only adds words to query ("palo alto" -> "palo alto caltrain station")."""
+    if len(candidate) <= len(query):
+        return False
+    if set(query) <= set(candidate):
+        return True
+    head = len(query) - 1
+    return candidate[:head] == query[:head] and candidate[head].startswith(query[head])
+
+
+class Gazetteer:
+    """Trigram + phonetic inverted index over place names and their aliases."""
+
+    def __init__(self, min_score: float = GAZETTEER_MIN_SCORE):
+        self.min_score = min_score
+        self.lookup_latency = LatencyStats()
+        self.lookups = 0
+        self.corrected = 0
+        self.misses = 0
+        self._clear()
+
+    def _clear(self):
+        self.canonical: List[str] = []
+        # One doc per name or alias; _doc_place maps it back to its canonical name
+        self._normalized: List[str] = []
+        self._doc_place = np.zeros(0, dtype=np.int32)
+        # Words before the first comma of each spelling ("77 N Almaden Ave, San Jose" -> 4), 0 if none
+        self._head_words = np.zeros(0, dtype=np.int8)
+        self._vocab: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.canonical)
+
+    def build(self, places: Iterable[Tuple[str, Sequence[str]]]) -> "Gazetteer":
+        """Index (canonical name, aliases) pairs, replacing any previous index."""
+        self._clear()
+        # 4-byte buffers: a million places produce tens of millions of postings
+        doc_place, features, docs = array("i"), array("i"), array("i")
+        head_words = array("b")
+        vocab = self._vocab
+        for name, aliases in places:
+            place = len(self.canonical)
+            self.canonical.append(name)
+            for spelling in (name, *aliases):
+                normalized = normalize_place(spelling)
+                if not normalized:
+                    continue
+                doc = len(self._normalized)
+                self._normalized.append(normalized)
+                doc_place.append(place)
+                head = normalize_place(spelling.split(",", 1)[0]) if "," in spelling else ""
+                head_words.append(min(127, len(head.split())))
+                for feature in _trigrams(normalized) | _phonetic(normalized):
+                    features.append(vocab.setdefault(feature, len(vocab)))
+                    docs.append(doc)
+
+        self._doc_place = np.frombuffer(doc_place, dtype=np.int32).copy()
+        self._head_words = np.frombuffer(head_words, dtype=np.int8).copy()
+        feature_ids = np.frombuffer(features, dtype=np.int32)
+        order = np.argsort(feature_ids, kind="stable")
+        # Stable sort keeps each posting list in doc order
+        self._postings = np.frombuffer(docs, dtype=np.int32)[order]
+        self._offsets = np.concatenate(([0], np.cumsum(np.bincount(feature_ids, minlength=len(vocab))))).astype(np.int64)
+        return self
+
+    def _candidates(self, query_features: set) -> np.ndarray:
+        spans = []
+        for feature in query_features:
+            fid = self._vocab.get(feature)
+            if fid is not None:
+                start, end = self._offsets[fid], self._offsets[fid + 1]
+                spans.append((end - start, start, end))
+        if not spans:
+            return np.zeros(0, dtype=np.int32)
+        # Seed from the rarest features: they identify a place, common ones ("ave") barely do
+        spans.sort()
+        seeds, total, used = [], 0, 0
+        for size, start, end in spans:
+            if seeds and total + size > _MAX_POSTINGS:
+                break
+            seeds.append(self._postings[start:end])
+            total += size
+            used += 1
+        docs, counts = np.unique(np.concatenate(seeds), return_counts=True)
+        if len(docs) > _REFINE:
+            keep = np.sort(np.argpartition(counts, -_REFINE)[-_REFINE:])
+            docs, counts = docs[keep], counts[keep]
+        # Then count the remaining features over the best seeds only (posting lists are sorted by doc)
+        for size, start, end in spans[used:]:
+            postings = self._postings[start:end]
+            found = np.searchsorted(postings, docs)
+            counts += postings[np.minimum(found, size - 1)] == docs
+        if len(docs) > _CANDIDATES:
+            docs = docs[np.argpartition(counts, -_CANDIDATES)[-_CANDIDATES:]]
+        return docs
+
+    def match(self, text: str) -> Optional[Tuple[str, float]]:
+        """Best (canonical name, score) for text; None below min_score or when ambiguous."""
+        started = time.perf_counter()
+        self.lookups += 1
+        result = None
+        normalized = normalize_place(text or "")
+        if normalized and self.canonical:
+            trigrams, phonetic, numbers = _features(normalized)
+            words = normalized.split()
+            query_words = len(words)
+            scores: Dict[int, float] = {}
+            for doc in self._candidates(trigrams | phonetic):
+                candidate = self._normalized[doc]
+                # Spoken addresses usually leave out what follows the first comma (the city)
+                head_words = self._head_words[doc]
+                if head_words and query_words <= head_words:
+                    candidate = " ".join(candidate.split()[:head_words])
+                candidate_trigrams, candidate_phonetic, candidate_numbers = _features(candidate)
+                # House and pier numbers must agree exactly
+                if numbers != candidate_numbers:
+                    continue
+                # A city or brand name is not a request for one particular place in it
+                if _narrows(words, candidate.split()):
+                    continue
+                score = ((1 - _PHONETIC_WEIGHT) * _dice(trigrams, candidate_trigrams)
+                         + _PHONETIC_WEIGHT * _dice(phonetic, candidate_phonetic))
+                place = int(self._doc_place[doc])
+                scores[place] = max(score, scores.get(place, 0.0))
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            if ranked and ranked[0][1] >= self.min_score:
+                if len(ranked) == 1 or ranked[1][1] < ranked[0][1] - _AMBIGUITY_MARGIN:
+                    result = (self.canonical[ranked[0][0]], round(ranked[0][1], 3))
+        if result is None:
+            self.misses += 1
+        self.lookup_latency.record(time.perf_counter() - started)
+        return result
+
+    def canonicalize(self, text: Optional[str]) -> Optional[str]:
+        """Canonical name for text, or text unchanged when nothing matches well enough."""
+        if not text:
+            return text
+        found = self.match(text)
+        if found is None:
+            return text
+        name, score = found
+        if name != text:
+            self.corrected += 1
+            logger.info(f"📖 Gazetteer: '{text}' → '{name}' ({score:.2f})")
+        return name
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "places": len(self.canonical),
+            "spellings": len(self._normalized),
+            "features": len(self._vocab),
+            "lookups": self.lookups,
+            "corrected": self.corrected,
+            "misses": self.misses,
+            "latency": self.lookup_latency.snapshot(),
+        }
+
+
+def load_places(path: str) -> List[Tuple[str, List[str]]]:
+    """(canonical name, aliases) pairs from a places TSV; # lines are comments."""
+    places = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            name, _, aliases = line.partition("\t")
+            places.append((name.strip(), [a.strip() for a in aliases.split("|") if a.strip()]))
+    return places
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Shared gazetteer, built from GAZETTEER_PATH on first use; None if disabled."""
+    global _gazetteer
+    if _gazetteer is None and GAZETTEER_ENABLED:
+        try:
+            _gazetteer = Gazetteer().build(load_places(GAZETTEER_PATH))
+            logger.info(f"📖 Gazetteer loaded {len(_gazetteer)} places")
+        except OSError as e:
+            logger.error(f"❌ Gazetteer disabled, cannot read {GAZETTEER_PATH}: {e}")
+            return None
+    return _gazetteer
+
+
+def canonicalize_location(text: Optional[str]) -> Optional[str]:
+    """Canonical place name for an extracted location (unchanged if disabled or unknown)."""
+    gazetteer = get_gazetteer()
+    return gazetteer.canonicalize(text) if gazetteer is not None else text
+
+
+def gazetteer_stats() -> Dict[str, Any]:
+    if _gazetteer is None:
+        return {"enabled": GAZETTEER_ENABLED, "loaded": False}
+    return {"enabled": True, "loaded": True, **_gazetteer.stats()}
@@ -0,0 +1,201 @@
+"""
+Cache of ride-intent extraction results keyed by normalized utterance.
+Users repeat the same few commands ("book an uber home"), so the LLM verdict
+for an utterance is remembered in an in-memory LRU with a TTL, optionally
+backed by a SQLite file so the cache survives restarts.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "4096"))
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "86400"))
+# SQLite file for the on-disk tier; empty disables it
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "")
+INTENT_CACHE_DISK_SIZE = int(os.getenv("INTENT_CACHE_DISK_SIZE", "100000"))
+
+# Spoken filler that does not change what the user asked for
+FILLER_WORDS = frozenset({
+    "um", "umm", "uh", "uhh", "er", "erm", "ah", "hmm", "mm", "hey", "omi",
+    "okay", "ok", "so", "well", "please", "just", "like",
+})
+
+# How often (in disk writes) the disk tier is trimmed back to its size limit
+_TRIM_EVERY = 256
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+# (is_ride_request, start_location, end_location)
+Intent = Tuple[bool, Optional[str], Optional[str]]
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, collapse whitespace."""
+    words = _NON_WORD.sub(" ", (text or "").lower()).split()
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+class IntentCache:
+    """LRU + TTL cache of extraction results with an optional SQLite tier."""
+
+    def __init__(
+        self,
+        max_entries: int = INTENT_CACHE_SIZE,
+        ttl: float = INTENT_CACHE_TTL,
+        path: str = INTENT_CACHE_PATH,
+        disk_max_entries: int = INTENT_CACHE_DISK_SIZE,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Intent]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        try:
+            self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS intents ("
+                "key TEXT PRIMARY KEY, is_ride INTEGER, start TEXT, end TEXT, "
+                "expires_at REAL, used_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS intents_used_at ON intents(used_at)")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Intent cache disk tier disabled ({path}): {e}")
+            self._db = None
+
+    def get(self, text: str, now: Optional[float] = None) -> Optional[Intent]:
+        """Cached intent for text, or None."""
+        key = normalize_utterance(text)
+        if not key:
+            return None
+        now = time.time() if now is None else now
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, intent = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return intent
+            del self._entries[key]
+            self.expired += 1
+
+        intent = self._disk_get(key, now)
+        if intent is not None:
+            self.disk_hits += 1
+            self._remember(key, intent, now)
+            return intent
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, intent: Intent, now: Optional[float] = None):
+        """Remember the extraction result for text."""
+        key = normalize_utterance(text)
+        if not key:
+            return
+        now = time.time() if now is None else now
+        self._remember(key, intent, now)
+        self._disk_put(key, intent, now)
+
+    def _remember(self, key: str, intent: Intent, now: float):
+        self._entries[key] = (now + self.ttl, intent)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[Intent]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT is_ride, start, end, expires_at FROM intents WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[3] <= now:
+                self._db.execute("DELETE FROM intents WHERE key = ?", (key,))
+                self.expired += 1
+                return None
+            self._db.execute("UPDATE intents SET used_at = ? WHERE key = ?", (now, key))
+            return bool(row[0]), row[1], row[2]
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Intent cache read failed: {e}")
+            return None
+
+    def _disk_put(self, key: str, intent: Intent, now: float):
+        if self._db is None:
+            return
+        is_ride, start, end = intent
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO intents (key, is_ride, start, end, expires_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, int(is_ride), start, end, now + self.ttl, now),
+            )
+            self._disk_writes += 1
+            if self._disk_writes % _TRIM_EVERY == 0:
+                self._trim_disk(now)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Intent cache write failed: {e}")
+
+    def _trim_disk(self, now: float):
+        """Drop expired rows, then the least recently used beyond the size limit."""
+        self._db.execute("DELETE FROM intents WHERE expires_at <= ?", (now,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM intents").fetchone()
+        excess = count - self.disk_max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM intents WHERE key IN (SELECT key FROM intents ORDER BY used_at LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def clear(self):
+        """Forget every cached intent, in memory and on disk."""
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM intents")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk": bool(self._db),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+# Global cache used by ride_detector
+intent_cache = IntentCache()
@@ -0,0 +1,284 @@
+"""
+Approximate location for an IP address, resolved in three layers:
+1. An offline IPv4 range database (IP_DB_PATH): CIDR blocks sorted by start
+   address, saved as .npy files and opened memory-mapped, searched with one
+   binary search.
+2. A TTL-bounded LRU of answers from the online lookup, failures included.
+3. ip-api.com, through one pooled keep-alive client, only when both miss.
+Private and reserved addresses never reach the online lookup.
+Database format: cidr<TAB>latitude<TAB>longitude<TAB>city per line, # for comments.
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+IP_DB_PATH = os.getenv("IP_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ip_ranges.tsv"))
+# Built database directory (default: next to the ranges file)
+IP_DB_INDEX_DIR = os.getenv("IP_DB_INDEX_DIR", "")
+IP_CACHE_SIZE = int(os.getenv("IP_CACHE_SIZE", "10000"))
+IP_CACHE_TTL = float(os.getenv("IP_CACHE_TTL", "3600"))
+# Failed lookups are retried sooner
+IP_NEGATIVE_TTL = float(os.getenv("IP_NEGATIVE_TTL", "300"))
+IP_LOOKUP_URL = os.getenv("IP_LOOKUP_URL", "http://ip-api.com/json/{ip}")
+IP_LOOKUP_TIMEOUT = float(os.getenv("IP_LOOKUP_TIMEOUT", "5"))
+
+# (latitude, longitude, city)
+Location = Tuple[float, float, str]
+
+_FIELDS = ("starts", "ends", "coords", "city_offsets", "cities")
+
+
+class IPRangeDB:
+    """Sorted, non-overlapping IPv4 ranges; arrays may be in memory or memory-mapped."""
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, coords: np.ndarray,
+                 city_offsets: np.ndarray, cities: np.ndarray):
+        self._starts = starts
+        self._ends = ends
+        self._coords = coords
+        self._city_offsets = city_offsets
+        self._cities = cities
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    @classmethod
+    def build(cls, ranges: Iterable[Tuple[int, int, float, float, str]]) -> "IPRangeDB":
+        """From (first, last, lat, lon, city) rows; a range overlapping an earlier one is dropped."""
+        rows, last = [], -1
+        for row in sorted(ranges, key=lambda r: (r[0], r[1])):
+            if row[0] <= last:
+                logger.warning(f"⚠️ Skipping overlapping IP range starting at {ipaddress.IPv4Address(row[0])}")
+                continue
+            rows.append(row)
+            last = row[1]
+        cities = [r[4].encode("utf-8") for r in rows]
+        lengths = np.fromiter((len(c) for c in cities), dtype=np.int64, count=len(cities))
+        return cls(
+            np.array([r[0] for r in rows], dtype=np.uint32),
+            np.array([r[1] for r in rows], dtype=np.uint32),
+            np.array([(r[2], r[3]) for r in rows], dtype=np.float64).reshape(-1, 2),
+            np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            np.frombuffer(b"".join(cities), dtype=np.uint8),
+        )
+
+    def save(self, directory: str):
+        """Write the database as .npy files, replacing directory atomically."""
+        tmp = f"{directory}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for field in _FIELDS:
+            np.save(os.path.join(tmp, f"{field}.npy"), getattr(self, f"_{field}"))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"ranges": len(self)}, f)
+        old = f"{directory}.old{os.getpid()}"
+        try:
+            if os.path.exists(directory):
+                os.replace(directory, old)
+            os.replace(tmp, directory)
+        except OSError:
+            # Another process rebuilt the same index first; keep its copy
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def open(cls, directory: str) -> "IPRangeDB":
+        """Memory-map a saved database; pages are read on first touch."""
+        return cls(**{f: np.load(os.path.join(directory, f"{f}.npy"), mmap_mode="r") for f in _FIELDS})
+
+    def lookup(self, ip: str) -> Optional[Location]:
+        """Location of the range holding an IPv4 address, or None."""
+        try:
+            address = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return None
+        i = int(np.searchsorted(self._starts, np.uint32(address), side="right")) - 1
+        if i < 0 or address > int(self._ends[i]):
+            return None
+        city = bytes(self._cities[self._city_offsets[i] : self._city_offsets[i + 1]]).decode("utf-8")
+        return float(self._coords[i, 0]), float(self._coords[i, 1]), city
+
+
+def load_ranges(path: str) -> Iterable[Tuple[int, int, float, float, str]]:
+    """(first, last, lat, lon, city) rows from a CIDR ranges TSV."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            cidr, lat, lon, city = (line.rstrip("\n").split("\t") + [""])[:4]
+            network = ipaddress.IPv4Network(cidr.strip(), strict=False)
+            yield int(network.network_address), int(network.broadcast_address), float(lat), float(lon), city.strip()
+
+
+def load_ip_db(path: str = IP_DB_PATH, index_dir: str = IP_DB_INDEX_DIR) -> IPRangeDB:
+    """Open the saved database, rebuilding it first if the ranges file changed."""
+    index_dir = index_dir or os.path.splitext(path)[0] + ".idx"
+    try:
+        fresh = os.path.getmtime(os.path.join(index_dir, "meta.json")) >= os.path.getmtime(path)
+    except OSError:
+        fresh = False
+    if not fresh:
+        started = time.perf_counter()
+        db = IPRangeDB.build(load_ranges(path))
+        db.save(index_dir)
+        logger.info(f"🌐 Built IP range database: {len(db)} ranges in {time.perf_counter() - started:.1f}s")
+    return IPRangeDB.open(index_dir)
+
+
+class IPLocator:
+    """Offline database, then cached online answers, then one online lookup."""
+
+    def __init__(self, db: Optional[IPRangeDB] = None, cache_size: int = IP_CACHE_SIZE, ttl: float = IP_CACHE_TTL,
+                 negative_ttl: float = IP_NEGATIVE_TTL, url: str = IP_LOOKUP_URL, timeout: float = IP_LOOKUP_TIMEOUT,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.db = db
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.url = url
+        self.timeout = timeout
+        self._transport = transport
+        self._cache: "OrderedDict[str, Tuple[float, Optional[Location]]]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.latency = LatencyStats()
+        self.http_latency = LatencyStats()
+        self.db_hits = 0
+        self.cache_hits = 0
+        self.http_lookups = 0
+        self.http_errors = 0
+        self.private = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        # A client's connection pool is bound to one event loop (tests run several loops)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 2.0)),
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+                transport=self._transport,
+            )
+            self._client_loop = loop
+        return self._client
+
+    def _cached(self, key: str, now: float) -> Tuple[bool, Optional[Location]]:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] <= now:
+            return False, None
+        self._cache.move_to_end(key)
+        return True, entry[1]
+
+    def _remember(self, key: str, location: Optional[Location], now: float):
+        self._cache[key] = (now + (self.ttl if location else self.negative_ttl), location)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, target: str) -> Optional[Location]:
+        self.http_lookups += 1
+        started = time.perf_counter()
+        try:
+            response = await self._http().get(self.url.format(ip=target))
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.http_errors += 1
+            print(f"❌ Error getting user location: {e}")
+            return None
+        finally:
+            self.http_latency.record(time.perf_counter() - started)
+        if data.get("status") != "success":
+            print(f"⚠️ Could not get location: {data.get('message')}")
+            return None
+        return data.get("lat"), data.get("lon"), data.get("city", "Unknown")
+
+    async def locate(self, ip: Optional[str] = None) -> Optional[Location]:
+        """Location of ip (None = the server's own public address)."""
+        started = time.perf_counter()
+        try:
+            if ip and self.db is not None:
+                found = self.db.lookup(ip)
+                if found:
+                    self.db_hits += 1
+                    return found
+            if ip:
+                try:
+                    if not ipaddress.ip_address(ip).is_global:
+                        self.private += 1
+                        return None
+                except ValueError:
+                    return None
+            key = ip or "me"
+            hit, location = self._cached(key, time.monotonic())
+            if hit:
+                self.cache_hits += 1
+                return location
+            location = await self._fetch(key)
+            self._remember(key, location, time.monotonic())
+            return location
+        finally:
+            self.latency.record(time.perf_counter() - started)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.db_hits + self.cache_hits + self.http_lookups
+        return {
+            "db_ranges": len(self.db) if self.db is not None else 0,
+            "db_hits": self.db_hits,
+            "cache_hits": self.cache_hits,
+            "cache_entries": len(self._cache),
+            "http_lookups": self.http_lookups,
+            "http_errors": self.http_errors,
+            "private": self.private,
+            "offline_ratio": round((self.db_hits + self.cache_hits) / lookups, 3) if lookups else None,
+            "latency": self.latency.snapshot(),
+            "http_latency": self.http_latency.snapshot(),
+        }
+
+
+_locator: Optional[IPLocator] = None
+
+
+def get_ip_locator() -> IPLocator:
+    """Shared locator; the offline database is opened (or built) on first use."""
+    global _locator
+    if _locator is None:
+        db = None
+        try:
+            db = load_ip_db()
+            logger.info(f"🌐 IP range database ready: {len(db)} ranges")
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ IP range database unavailable ({IP_DB_PATH}): {e}")
+        _locator = IPLocator(db)
+    return _locator
+
+
+async def close_ip_locator():
+    """Close the shared locator's connection pool."""
+    if _locator is not None:
+        await _locator.close()
+
+
+def ip_locator_stats() -> Dict[str, Any]:
+    if _locator is None:
+        return {"loaded": False}
+    return {"loaded": True, **_locator.stats()}
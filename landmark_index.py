@@ -0,0 +1,230 @@
+"""
+Nearest named landmark for a pickup coordinate.
+Landmarks are bucketed into a uniform lat/lon grid (LANDMARK_CELL_DEG cells,
+~1 km by default). A lookup scans rings of cells outward from the query's
+cell and stops once no unvisited cell can hold anything closer than the best
+haversine distance found so far, so it touches a handful of points no matter
+how many landmarks are loaded.
+
+The index is written next to the dataset as plain .npy files (points sorted
+by cell) and opened memory-mapped, so startup does not re-read or re-sort a
+large landmark file; it is rebuilt when the dataset is newer.
+Dataset format: name<TAB>latitude<TAB>longitude per line, # for comments.
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+LANDMARK_DATA = os.getenv(
+    "LANDMARK_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "landmarks.tsv")
+)
+# Built index directory (default: next to the dataset)
+LANDMARK_INDEX_DIR = os.getenv("LANDMARK_INDEX_DIR", "")
+LANDMARK_CELL_DEG = float(os.getenv("LANDMARK_CELL_DEG", "0.01"))
+# Farther than this the landmark is no use as a pickup point
+LANDMARK_MAX_DISTANCE_KM = float(os.getenv("LANDMARK_MAX_DISTANCE_KM", "5"))
+
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+# Cell row/column packed into one sortable key
+_COLUMNS = 1 << 32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in kilometres."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class LandmarkIndex:
+    """Grid index of named points; arrays may be in memory or memory-mapped."""
+
+    def __init__(self, cell_deg: float, cells: np.ndarray, starts: np.ndarray, coords: np.ndarray,
+                 name_offsets: np.ndarray, names: np.ndarray):
+        self.cell_deg = cell_deg
+        # Sorted distinct cell keys, and where each cell's points start in coords
+        self._cells = cells
+        self._starts = starts
+        self._coords = coords
+        self._name_offsets = name_offsets
+        self._names = names
+        self.lookup_latency = LatencyStats()
+        self.lookups = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    @classmethod
+    def build(cls, landmarks: Iterable[Tuple[str, float, float]], cell_deg: float = LANDMARK_CELL_DEG) -> "LandmarkIndex":
+        names, coords = [], []
+        for name, lat, lon in landmarks:
+            names.append(name.encode("utf-8"))
+            coords.append((lat, lon))
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        rows = np.floor(coords[:, 0] / cell_deg).astype(np.int64)
+        cols = np.floor(coords[:, 1] / cell_deg).astype(np.int64)
+        keys = rows * _COLUMNS + cols
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        cells, starts = np.unique(keys, return_index=True)
+        starts = np.append(starts, len(keys)).astype(np.int64)
+        names = [names[i] for i in order]
+        lengths = np.fromiter((len(n) for n in names), dtype=np.int64, count=len(names))
+        name_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        blob = np.frombuffer(b"".join(names), dtype=np.uint8)
+        return cls(cell_deg, cells, starts, coords[order], name_offsets, blob)
+
+    def save(self, directory: str):
+        """Write the index as .npy files, replacing directory atomically."""
+        tmp = f"{directory}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for field in ("cells", "starts", "coords", "name_offsets", "names"):
+            np.save(os.path.join(tmp, f"{field}.npy"), getattr(self, f"_{field}"))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"cell_deg": self.cell_deg, "landmarks": len(self)}, f)
+        old = f"{directory}.old{os.getpid()}"
+        try:
+            if os.path.exists(directory):
+                os.replace(directory, old)
+            os.replace(tmp, directory)
+        except OSError:
+            # Another process rebuilt the same index first; keep its copy
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def open(cls, directory: str) -> "LandmarkIndex":
+        """Memory-map a saved index; pages are read on first touch."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {
+            field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")
+            for field in ("cells", "starts", "coords", "name_offsets", "names")
+        }
+        return cls(meta["cell_deg"], **arrays)
+
+    def name(self, i: int) -> str:
+        return bytes(self._names[self._name_offsets[i] : self._name_offsets[i + 1]]).decode("utf-8")
+
+    def _ring(self, row: int, col: int, k: int) -> np.ndarray:
+        """Point indices in the cells exactly k rings around (row, col); ring 1 includes the centre."""
+        if k == 1:
+            span = np.arange(-1, 2, dtype=np.int64)
+            keys = (row + np.repeat(span, 3)) * _COLUMNS + col + np.tile(span, 3)
+        else:
+            span = np.arange(-k, k + 1, dtype=np.int64)
+            inner = span[1:-1]
+            rows = np.concatenate((np.full(2 * k + 1, row - k), np.full(2 * k + 1, row + k), row + inner, row + inner))
+            cols = np.concatenate((col + span, col + span, np.full(2 * k - 1, col - k), np.full(2 * k - 1, col + k)))
+            keys = rows * _COLUMNS + cols
+        found = np.searchsorted(self._cells, keys)
+        inside = found < len(self._cells)
+        found, keys = found[inside], keys[inside]
+        found = found[self._cells[found] == keys]
+        if not len(found):
+            return found
+        return np.concatenate([np.arange(self._starts[c], self._starts[c + 1]) for c in found])
+
+    def nearest(self, lat: float, lon: float, max_km: float = LANDMARK_MAX_DISTANCE_KM) -> Optional[Tuple[str, float]]:
+        """(name, distance in km) of the closest landmark within max_km, or None."""
+        started = time.perf_counter()
+        self.lookups += 1
+        row, col = math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+        # Anything k rings out is at least k cells away; longitude degrees shrink toward the poles
+        ring_km = self.cell_deg * _KM_PER_DEG * max(0.01, math.cos(math.radians(min(89.0, abs(lat) + 1))))
+        best, best_km = -1, math.inf
+        for k in range(1, int(max_km / ring_km) + 2):
+            points = self._ring(row, col, k)
+            if len(points):
+                coords = np.radians(self._coords[points])
+                p1 = math.radians(lat)
+                a = (np.sin((coords[:, 0] - p1) / 2) ** 2
+                     + math.cos(p1) * np.cos(coords[:, 0]) * np.sin((coords[:, 1] - math.radians(lon)) / 2) ** 2)
+                km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+                i = int(np.argmin(km))
+                if km[i] < best_km:
+                    best, best_km = int(points[i]), float(km[i])
+            if best_km <= k * ring_km:
+                break
+        result = (self.name(best), best_km) if best >= 0 and best_km <= max_km else None
+        if result is None:
+            self.misses += 1
+        self.lookup_latency.record(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "landmarks": len(self),
+            "cells": len(self._cells),
+            "cell_deg": self.cell_deg,
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "latency": self.lookup_latency.snapshot(),
+        }
+
+
+def load_landmarks(path: str) -> Iterable[Tuple[str, float, float]]:
+    """(name, lat, lon) rows from a landmark TSV."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            name, lat, lon = line.rstrip("\n").split("\t")[:3]
+            yield name.strip(), float(lat), float(lon)
+
+
+def load_landmark_index(data_path: str = LANDMARK_DATA, index_dir: str = LANDMARK_INDEX_DIR,
+                        cell_deg: float = LANDMARK_CELL_DEG) -> LandmarkIndex:
+    """Open the saved index, rebuilding it first if the dataset changed."""
+    index_dir = index_dir or os.path.splitext(data_path)[0] + ".idx"
+    meta_path = os.path.join(index_dir, "meta.json")
+    try:
+        fresh = os.path.getmtime(meta_path) >= os.path.getmtime(data_path)
+        with open(meta_path) as f:
+            fresh = fresh and json.load(f)["cell_deg"] == cell_deg
+    except (OSError, ValueError, KeyError):
+        fresh = False
+    if not fresh:
+        started = time.perf_counter()
+        index = LandmarkIndex.build(load_landmarks(data_path), cell_deg)
+        index.save(index_dir)
+        logger.info(f"🗺️ Built landmark index: {len(index)} landmarks in {time.perf_counter() - started:.1f}s")
+    return LandmarkIndex.open(index_dir)
+
+
+_index: Optional[LandmarkIndex] = None
+
+
+def get_landmark_index() -> Optional[LandmarkIndex]:
+    """Shared index, opened (or built) on first use; None if the dataset is unreadable."""
+    global _index
+    if _index is None:
+        try:
+            _index = load_landmark_index()
+            logger.info(f"🗺️ Landmark index ready: {len(_index)} landmarks")
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Landmark index unavailable ({LANDMARK_DATA}): {e}")
+            return None
+    return _index
+
+
+def landmark_stats() -> Dict[str, Any]:
+    if _index is None:
+        return {"loaded": False}
+    return {"loaded": True, **_index.stats()}
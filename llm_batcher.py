@@ -0,0 +1,91 @@
+"""
+Micro-batching of concurrent requests to a batch-capable backend.
+Callers submit one item and await its result. An item arriving while nothing
+is in flight is sent at once; items arriving while a call is in flight are
+held for a short window (or until the batch is full), sent together in one
+call, and the per-item results fanned back out to the waiting coroutines. A
+streaming backend can hand out results early through the resolve callback.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+LLM_BATCHING = os.getenv("LLM_BATCHING", "false").lower() == "true"
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "16"))
+LLM_BATCH_WAIT_MS = float(os.getenv("LLM_BATCH_WAIT_MS", "25"))
+
+
+class MicroBatcher:
+    """Sends a submission at once when idle; under load collects up to max_wait seconds or max_batch items per batch."""
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[Any], Callable[[int, Any], None]], Awaitable[Sequence[Any]]],
+        max_batch: int = LLM_BATCH_SIZE,
+        max_wait: float = LLM_BATCH_WAIT_MS / 1000,
+    ):
+        self.send_batch = send_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue item for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        # A lone request should not pay the batching window
+        if len(self._pending) >= self.max_batch or not self._in_flight:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        task = asyncio.ensure_future(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]):
+        def resolve(index: int, result: Any):
+            future = batch[index][1]
+            if not future.done():
+                future.set_result(result)
+
+        try:
+            results = await self.send_batch([item for item, _ in batch], resolve)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+        }
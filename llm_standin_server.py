@@ -0,0 +1,177 @@
+"""
+Local stand-in for the chat-completions API, for offline load tests and CI.
+Speaks the same wire format as OpenAI's /v1/chat/completions (plain JSON and
+SSE streaming) and answers the ride-extraction prompts with the rule-based
+parser. Latency, jitter, per-token delay, slow replicas and errors are
+injected on request.
+
+Run it and point the app at it:
+    python llm_standin_server.py --port 8900 --latency-ms 300 --error-rate 0.02
+    EXTRACTION_BACKEND=standin LLM_STANDIN_URL=http://127.0.0.1:8900/v1 uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from ride_detector import parse_ride_request
+
+STANDIN_LATENCY_MS = float(os.getenv("STANDIN_LATENCY_MS", "200"))
+STANDIN_JITTER_MS = float(os.getenv("STANDIN_JITTER_MS", "50"))
+STANDIN_TOKEN_MS = float(os.getenv("STANDIN_TOKEN_MS", "10"))
+# Share of requests answered with a 500 / 429, or never answered
+STANDIN_ERROR_RATE = float(os.getenv("STANDIN_ERROR_RATE", "0"))
+STANDIN_RATE_LIMIT_RATE = float(os.getenv("STANDIN_RATE_LIMIT_RATE", "0"))
+STANDIN_HANG_RATE = float(os.getenv("STANDIN_HANG_RATE", "0"))
+# Share of requests stuck behind a slow replica (tail latency)
+STANDIN_SLOW_RATE = float(os.getenv("STANDIN_SLOW_RATE", "0"))
+STANDIN_SLOW_MS = float(os.getenv("STANDIN_SLOW_MS", "5000"))
+
+_SINGLE = re.compile(r'User text: "(.*)"', re.DOTALL)
+_NUMBERED = re.compile(r'^(\d+)\. "(.*)"$', re.MULTILINE)
+# ~4 characters per token
+_CHARS_PER_TOKEN = 4
+
+
+def _verdict(text: str) -> str:
+    is_ride, start, end = parse_ride_request(text)
+    if not is_ride:
+        return "NO|NOT_FOUND|NOT_FOUND"
+    return f"YES|{start or 'NOT_FOUND'}|{end or 'NOT_FOUND'}"
+
+
+def answer_prompt(prompt: str) -> str:
+    """Answer a single or numbered-batch extraction prompt."""
+    items = _NUMBERED.findall(prompt)
+    if items:
+        return "\n".join(f"{n}|{_verdict(text)}" for n, text in items)
+    match = _SINGLE.search(prompt)
+    return _verdict(match.group(1) if match else prompt)
+
+
+def create_standin_app(
+    latency_ms: float = STANDIN_LATENCY_MS,
+    jitter_ms: float = STANDIN_JITTER_MS,
+    token_ms: float = STANDIN_TOKEN_MS,
+    error_rate: float = STANDIN_ERROR_RATE,
+    rate_limit_rate: float = STANDIN_RATE_LIMIT_RATE,
+    hang_rate: float = STANDIN_HANG_RATE,
+    slow_rate: float = STANDIN_SLOW_RATE,
+    slow_ms: float = STANDIN_SLOW_MS,
+    seed: int = None,
+) -> FastAPI:
+    standin = FastAPI(title="LLM stand-in")
+    rng = random.Random(seed)
+    counters = {"requests": 0, "errors": 0, "rate_limited": 0, "hung": 0, "slow": 0, "completion_tokens": 0}
+
+    def error(status: int, message: str, kind: str) -> JSONResponse:
+        return JSONResponse(status_code=status, content={"error": {"message": message, "type": kind}})
+
+    def chunk(completion_id: str, delta: Dict[str, Any], finish_reason=None, usage=None) -> str:
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "standin",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            "usage": usage,
+        }) + "\n\n"
+
+    @standin.get("/health")
+    async def health():
+        return {"status": "healthy", **counters}
+
+    @standin.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        roll = rng.random()
+        if roll < hang_rate:
+            counters["hung"] += 1
+            await asyncio.sleep(3600)
+        if roll < hang_rate + error_rate:
+            counters["errors"] += 1
+            return error(500, "Injected server error", "server_error")
+        if roll < hang_rate + error_rate + rate_limit_rate:
+            counters["rate_limited"] += 1
+            return error(429, "Injected rate limit", "rate_limit_error")
+
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        content = answer_prompt(prompt)
+        tokens = [content[i : i + _CHARS_PER_TOKEN] for i in range(0, len(content), _CHARS_PER_TOKEN)]
+        usage = {
+            "prompt_tokens": len(prompt) // _CHARS_PER_TOKEN,
+            "completion_tokens": len(tokens),
+            "total_tokens": len(prompt) // _CHARS_PER_TOKEN + len(tokens),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        delay_ms = latency_ms + rng.uniform(-jitter_ms, jitter_ms)
+        if rng.random() < slow_rate:
+            counters["slow"] += 1
+            delay_ms = slow_ms
+        await asyncio.sleep(max(0.0, delay_ms) / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_ms * len(tokens) / 1000)
+            counters["completion_tokens"] += len(tokens)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "standin",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            }
+
+        async def events():
+            yield chunk(completion_id, {"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(token_ms / 1000)
+                counters["completion_tokens"] += 1
+                yield chunk(completion_id, {"content": token})
+            yield chunk(completion_id, {}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(completion_id, None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return standin
+
+
+app = create_standin_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=STANDIN_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=STANDIN_JITTER_MS)
+    parser.add_argument("--token-ms", type=float, default=STANDIN_TOKEN_MS)
+    parser.add_argument("--error-rate", type=float, default=STANDIN_ERROR_RATE)
+    parser.add_argument("--rate-limit-rate", type=float, default=STANDIN_RATE_LIMIT_RATE)
+    parser.add_argument("--hang-rate", type=float, default=STANDIN_HANG_RATE)
+    parser.add_argument("--slow-rate", type=float, default=STANDIN_SLOW_RATE)
+    parser.add_argument("--slow-ms", type=float, default=STANDIN_SLOW_MS)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_standin_app(args.latency_ms, args.jitter_ms, args.token_ms, args.error_rate,
+                           args.rate_limit_rate, args.hang_rate, args.slow_rate, args.slow_ms, args.seed),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
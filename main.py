@@ -5,7 +5,7 @@ import json
 from typing import Optional
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import logging
@@ -15,11 +15,30 @@ load_dotenv()
 
 from auth_manager import auth_manager, active_browsers
 from uber_automation import uber_automation
+from browser_pool import browser_pool
 from ride_detector import detect_trigger_and_destinations, get_pickup_location_from_ip
+from extraction_backends import backend_stats, close_backend
+from silence_scheduler import SilenceScheduler
+from conversation_bucket import ConversationBucket
+from utterance_detector import EndOfUtteranceDetector
+from batch_ingest import BatchRecordError, iter_batch_records, parse_batch_record
+from shard_router import SHARD_INDEX, owns_uid
+from admission import Overloaded, admission
+from segment_dedup import SegmentDeduplicator
+from pickup_prefetch import PickupPrefetcher
+from intent_cache import intent_cache
+from ride_classifier import classifier_stats, get_classifier
+from gazetteer import canonicalize_location, gazetteer_stats, get_gazetteer
+from landmark_index import get_landmark_index, landmark_stats
+from ip_locator import close_ip_locator, get_ip_locator, ip_locator_stats
+from booking_log import booking_log_stats, close_booking_log, get_booking_log, open_booking_log
 from simple_storage import (
     load_user_data,
     update_user_status,
     load_session,
+    close_storage,
+    find_users,
+    storage_stats,
 )
 
 # Setup logging
@@ -28,6 +47,12 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Omi Uber App", version="1.0.0")
 
+# Only set when running behind shard_router's dispatcher on a private interface
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+# Required as X-Admin-Token on /admin endpoints when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # Rate limiting to prevent bombarding Uber
 last_booking_time = {}
 MIN_BOOKING_INTERVAL = 30  # Minimum 15 seconds between bookings per user
@@ -36,10 +61,20 @@ MIN_BOOKING_INTERVAL = 30  # Minimum 15 seconds between bookings per user
 active_bookings = {}  # {uid: bool}
 
 # Segment buckets for collecting voice data
-segment_buckets = {}  # {uid: [segments]}
-segment_last_arrival = {}  # {uid: timestamp of last segment}
-bucket_timers = {}  # {uid: asyncio.Task}
-BUCKET_WAIT_TIME = 5  # Wait 5 seconds from last segment before processing
+segment_buckets = {}  # {uid: ConversationBucket}
+BUCKET_WAIT_TIME = float(os.getenv("BUCKET_WAIT_TIME", "5"))  # Wait 5 seconds from last segment before processing
+
+# One deadline heap drives every bucket's silence window
+silence_scheduler = SilenceScheduler(lambda uid: _process_bucket_delayed(uid), BUCKET_WAIT_TIME)
+
+# Shortens the window for complete requests and learns per-user pauses
+utterance_detector = EndOfUtteranceDetector(BUCKET_WAIT_TIME)
+
+# Drops segments Omi resends after a reconnect
+segment_dedup = SegmentDeduplicator()
+
+# Resolves the pickup while the LLM is still extracting the intent
+pickup_prefetch = PickupPrefetcher(get_pickup_location_from_ip)
 
 # Models
 class VoiceSegment(BaseModel):
@@ -682,6 +717,10 @@ async def _process_booking(uid: str, segments: list, background_tasks: Backgroun
         active_bookings[uid] = False
         return
     
+    # Known places go to Uber's search box spelled the way it knows them
+    start_location = canonicalize_location(start_location)
+    end_location = canonicalize_location(end_location)
+    
     # Validate session
     user_data = load_user_data(uid)
     if not user_data.get("uber_authenticated"):
@@ -715,52 +754,56 @@ async def _process_booking(uid: str, segments: list, background_tasks: Backgroun
 
 async def _process_bucket_delayed(uid: str):
     """
-    Keep checking if 5 seconds have passed since last segment.
-    Only process when 5 seconds of silence detected.
+    Flush callback fired by the silence scheduler.
+    Runs once the bucket's silence window has passed since the last segment:
+    5 seconds by default, shorter for complete requests or quick talkers.
     """
-    logger.info(f"⏳ Monitoring bucket for {uid}")
-    
-    while True:
-        await asyncio.sleep(0.5)  # Check every 500ms
-        
-        # If bucket was cleared, we're done
-        if uid not in segment_buckets:
-            logger.info(f"✅ Bucket for {uid} already processed")
-            return
-        
-        # Check if 5 seconds have passed since last segment
-        last_arrival = segment_last_arrival.get(uid, time.time())
-        time_since_last = time.time() - last_arrival
-        
-        if time_since_last >= BUCKET_WAIT_TIME:
-            # 5 seconds of silence detected, process now
-            logger.info(f"✅ 5 seconds of silence detected for {uid}")
-            break
-    
-    # Get segments before clearing
-    if uid not in segment_buckets:
+    # Take segments and device metadata before clearing
+    bucket = segment_buckets.pop(uid, None)
+    if bucket is None:
         return
     
-    segments = segment_buckets[uid]
+    waited = time.time() - bucket.last_arrival
+    utterance_detector.record_flush(uid, bucket.text(), waited)
+    logger.info(f"✅ {waited:.1f} seconds of silence detected for {uid}")
+    
+    segments = bucket.snapshot()
+    phone_ip, gps_lat, gps_lon = bucket.phone_ip, bucket.gps_lat, bucket.gps_lon
     logger.info(f"🔄 Processing bucket for {uid} with {len(segments)} segment(s)")
     
     # Clear bucket and timer
-    del segment_buckets[uid]
-    if uid in segment_last_arrival:
-        del segment_last_arrival[uid]
-    if uid in bucket_timers:
-        del bucket_timers[uid]
+    bucket.clear()
     logger.info(f"🗑️ Cleared bucket for {uid}")
     
     # Join all segment texts
     combined_text = " ".join([seg.get("text", "") if isinstance(seg, dict) else seg.text for seg in segments])
     logger.info(f"✅ Joined text: '{combined_text}'")
     
+    # Start on the pickup alongside the LLM call, once the local classifier has let the text
+    # through; it is only needed if the user names just a destination
+    pickup_tasks = []
+    
+    def start_pickup():
+        pickup_tasks.append(pickup_prefetch.start(phone_ip, gps_lat, gps_lon))
+    
     # Detect trigger phrase and extract locations (using LLM, no strict patterns)
-    is_trigger, start_location, end_location = await detect_trigger_and_destinations(segments)
+    extraction_started = time.perf_counter()
+    try:
+        async with admission.llm.slot():
+            is_trigger, start_location, end_location = await detect_trigger_and_destinations(
+                segments, on_candidate=start_pickup
+            )
+    except Overloaded as e:
+        logger.warning(f"🚦 Shedding extraction for {uid}: {e}")
+        for task in pickup_tasks:
+            pickup_prefetch.discard(task)
+        return
+    pickup_prefetch.record_extraction(time.perf_counter() - extraction_started)
+    pickup_task = pickup_tasks[0] if pickup_tasks else None
     
     if not is_trigger:
         logger.info(f"❌ LLM determined this is not a ride booking request for {uid}")
+        pickup_prefetch.discard(pickup_task)
         return
     
     logger.info(f"✅ LLM validation passed for {uid}: {start_location} → {end_location}")
@@ -768,31 +811,31 @@ async def _process_bucket_delayed(uid: str):
     # If only destination provided, get pickup from user's current location
     if not start_location and end_location:
         logger.info(f"📍 Only destination provided, getting pickup from user's location...")
-        # Get GPS coordinates from stored bucket data
-        gps_lat = segment_buckets.get(f"{uid}_gps_lat")
-        gps_lon = segment_buckets.get(f"{uid}_gps_lon")
-        
+        # GPS coordinates and IP were taken from the bucket at flush time
         if gps_lat and gps_lon:
             logger.info(f"📍 Using GPS coordinates: ({gps_lat}, {gps_lon})")
         else:
-            logger.info(f"📍 No GPS provided, using San Francisco fallback")
+            logger.info(f"📍 No GPS provided, using IP {phone_ip} or the San Francisco fallback")
         
-        logger.info(f"🔄 Starting geolocation process...")
-        logger.info(f"   1️⃣ Getting landmark...")
-        start_location = await get_pickup_location_from_ip(None, gps_lat, gps_lon)
+        start_location = await pickup_prefetch.take(pickup_task, phone_ip, gps_lat, gps_lon)
         if start_location:
-            logger.info(f"✅ Got pickup location: {start_location}")
             logger.info(f"📍 Pickup location determined: {start_location}")
             logger.info(f"🎯 Final booking route: {start_location} → {end_location}")
         else:
             logger.warning(f"⚠️ Could not get pickup location")
             logger.warning(f"⚠️ Skipping booking - no pickup location available")
             return
+    else:
+        pickup_prefetch.discard(pickup_task)
     
     if not start_location or not end_location:
         logger.warning(f"⚠️ Could not extract locations for {uid}")
         return
     
+    # Known places go to Uber's search box spelled the way it knows them
+    start_location = canonicalize_location(start_location)
+    end_location = canonicalize_location(end_location)
+    
     # Validate session
     user_data = load_user_data(uid)
     if not user_data.get("uber_authenticated"):
@@ -814,9 +857,16 @@ async def _process_bucket_delayed(uid: str):
     logger.info(f"🚗 Starting booking immediately for {uid}: {start_location} → {end_location}")
     
     # Book ride directly (no background task)
-    success, message, driver, eta = await uber_automation.book_ride(
-        uid, start_location, end_location, auto_request=True
-    )
+    try:
+        async with admission.booking.slot():
+            success, message, driver, eta = await uber_automation.book_ride(
+                uid, start_location, end_location, auto_request=True
+            )
+    except Overloaded as e:
+        logger.warning(f"🚦 Shedding booking for {uid}: {e}")
+        active_bookings[uid] = False
+        last_booking_time.pop(uid, None)
+        return
     
     # Check if login button was found (indicates authentication issue)
     if "login button" in message.lower() or "not authenticated" in message.lower():
@@ -830,17 +880,85 @@ async def _process_bucket_delayed(uid: str):
     logger.info(f"🔓 Marking booking as inactive for {uid}")
 
 
+def _add_to_bucket(uid: str, segments: list, phone_ip: Optional[str], gps_lat: Optional[float], gps_lon: Optional[float]):
+    """
+    Push segments into a user's bucket and (re)arm its silence window.
+    Shared by the single and batch webhooks.
+    Raises Overloaded instead of opening a new bucket when the pipeline is full.
+    Returns (bucket, segments_added, wait_time); wait_time is None when every
+    segment was a repeat and the silence window was left alone.
+    """
+    # Shed before dedup remembers the segments, so a retry after 429 is not a "repeat"
+    bucket = segment_buckets.get(uid)
+    if bucket is None:
+        admission.check_new_bucket(len(segment_buckets))
+    
+    # Repeats must not extend the window or reach the LLM a second time
+    segments = segment_dedup.filter(uid, segments)
+    if not segments:
+        if bucket is None:
+            segment_dedup.note_call_saved()
+        return bucket, 0, None
+    
+    # Initialize bucket if needed
+    if bucket is None:
+        bucket = segment_buckets[uid] = ConversationBucket(uid)
+    
+    # Keep the latest phone IP and GPS fix for geolocation
+    bucket.update_location(phone_ip, gps_lat, gps_lon)
+    
+    # Add segments to bucket (last arrival time is updated for the sliding window)
+    previous_arrival = bucket.last_arrival
+    added = bucket.add(segments)
+    if previous_arrival is not None:
+        utterance_detector.observe_gap(uid, bucket.last_arrival - previous_arrival)
+    
+    # Push the silence deadline out, or pull it in if the request is already complete
+    wait_time = utterance_detector.wait_time(uid, bucket.text())
+    bucket.timer = silence_scheduler.touch(uid, wait_time)
+    return bucket, added, wait_time
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    """Phone's IP address, honouring the shard dispatcher's X-Forwarded-For."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+def _shed(e: Overloaded) -> JSONResponse:
+    """429 reply telling the device when to retry."""
+    logger.warning(f"🚦 Shedding webhook: {e}")
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+        content={"message": f"⏳ Busy, retry in {e.retry_after}s", "booked": False, "retry_after": e.retry_after},
+    )
+
+
+def _misrouted(uid: str) -> JSONResponse:
+    """Reply for a uid whose state lives on another shard worker."""
+    logger.warning(f"🧩 uid={uid} does not belong to shard {SHARD_INDEX}")
+    return JSONResponse(
+        status_code=421,
+        content={"message": f"❌ uid {uid} is owned by another shard", "booked": False},
+    )
+
+
 @app.post("/webhook")
 async def webhook(request: Request):
     """
     Receive voice transcripts from Omi.
-    Collect segments for 5 seconds, then process if trigger detected.
-    Always uses default_user.
+    Collect segments until the silence window closes, then process if trigger detected.
+    The uid comes from the ?uid= query string (as Omi sends it) or the payload,
+    falling back to default_user.
     Extracts phone's IP address from request for geolocation.
     """
     try:
         # Extract phone's IP address from request
-        phone_ip = request.client.host if request.client else None
+        phone_ip = _client_ip(request)
         logger.info(f"📱 Webhook received from IP: {phone_ip}")
         
         # Handle both Pydantic model and raw JSON/streaming data
@@ -851,8 +969,10 @@ async def webhook(request: Request):
             if isinstance(body, bytes):
                 body = json.loads(body.decode())
         
-        # Always use default_user
-        uid = "default_user"
+        # Same resolution as the shard dispatcher, so a numeric uid hashes to the same shard
+        uid = str(request.query_params.get("uid") or body.get("uid") or "default_user")
+        if not owns_uid(uid):
+            return _misrouted(uid)
         segments = body.get("segments", [])
         
         # Optional: Extract GPS coordinates if provided in webhook
@@ -884,31 +1004,25 @@ async def webhook(request: Request):
             speaker = seg.get("speaker", "") if isinstance(seg, dict) else seg.speaker
             logger.info(f"  Segment {i}: speaker='{speaker}', text='{text}'")
         
-        # Initialize bucket if needed
         if uid not in segment_buckets:
-            segment_buckets[uid] = []
             logger.info(f"🆕 Creating new bucket for {uid}")
-            # Store phone IP for geolocation
-            segment_buckets[f"{uid}_phone_ip"] = phone_ip
-            # Store GPS coordinates if provided
-            segment_buckets[f"{uid}_gps_lat"] = gps_lat
-            segment_buckets[f"{uid}_gps_lon"] = gps_lon
-            # Start monitoring task on first segment
-            task = asyncio.create_task(_process_bucket_delayed(uid))
-            bucket_timers[uid] = task
-            logger.info(f"🔄 Started monitoring task for {uid}")
-        
-        # Add segments to bucket
-        segment_buckets[uid].extend(segments)
-        logger.info(f"✅ Added {len(segments)} segment(s) to bucket")
-        logger.info(f"📊 Bucket now has {len(segment_buckets[uid])} total segment(s)")
-        
-        # Update last arrival time (sliding window)
-        segment_last_arrival[uid] = time.time()
-        logger.info(f"⏱️ Last segment at {segment_last_arrival[uid]}, waiting {BUCKET_WAIT_TIME}s from now...")
+        try:
+            bucket, added, wait_time = _add_to_bucket(uid, segments, phone_ip, gps_lat, gps_lon)
+        except Overloaded as e:
+            return _shed(e)
+        if wait_time is None:
+            logger.info(f"🔁 Ignoring {len(segments)} duplicate segment(s) for {uid}")
+            return {
+                "message": "🔁 Duplicate segment(s) ignored",
+                "booked": False,
+                "duplicate": True,
+            }
+        logger.info(f"✅ Added {added} segment(s) to bucket")
+        logger.info(f"📊 Bucket now has {len(bucket)} total segment(s)")
+        logger.info(f"⏱️ Last segment at {bucket.last_arrival}, waiting {wait_time:.1f}s from now...")
         
         return {
-            "message": f"📝 Received {len(segments)} segment(s). Processing in {BUCKET_WAIT_TIME}s...",
+            "message": f"📝 Received {len(segments)} segment(s). Processing in {wait_time:.1f}s...",
             "booked": False,
             "batching": True,
         }
@@ -921,6 +1035,53 @@ async def webhook(request: Request):
         }
 
 
+@app.post("/webhook/batch")
+async def webhook_batch(request: Request):
+    """
+    Receive transcripts for many devices in one request.
+    Body is NDJSON (one {uid, segments, gps} record per line) or a single JSON
+    array of records; records are parsed incrementally as the body streams in.
+    """
+    phone_ip = _client_ip(request)
+    records = accepted = segments_added = duplicates = 0
+    errors = []
+    
+    if admission.llm.saturated():
+        return _shed(admission.llm.reject())
+    
+    async for record in iter_batch_records(request.stream()):
+        records += 1
+        try:
+            if isinstance(record, BatchRecordError):
+                raise record
+            uid, segments, gps_lat, gps_lon = parse_batch_record(record)
+            uid = uid or "default_user"
+            if not segments:
+                raise BatchRecordError("Missing segments")
+            if not owns_uid(uid):
+                raise BatchRecordError(f"uid {uid} is owned by another shard")
+            _, added, _ = _add_to_bucket(uid, segments, phone_ip, gps_lat, gps_lon)
+            accepted += 1
+            segments_added += added
+            duplicates += len(segments) - added
+        except (BatchRecordError, Overloaded) as e:
+            if len(errors) < 20:
+                errors.append({"record": records, "error": str(e)})
+    
+    logger.info(f"📦 Batch webhook from {phone_ip}: {accepted}/{records} record(s), {segments_added} segment(s)")
+    return {
+        "message": f"📝 Received {segments_added} segment(s) across {accepted} record(s)",
+        "records": records,
+        "accepted": accepted,
+        "rejected": records - accepted,
+        "segments": segments_added,
+        "duplicates": duplicates,
+        "errors": errors,
+        "booked": False,
+        "batching": True,
+    }
+
+
 async def _book_ride_background(uid: str, start_location: str, end_location: str):
     """Background task to book ride."""
     try:
@@ -932,22 +1093,100 @@ async def _book_ride_background(uid: str, start_location: str, end_location: str
         logger.info(f"   - Environment variable: '{auto_request_env}'")
         logger.info(f"   - Parsed value: {auto_request}")
         logger.info(f"   - Auto-request enabled: {'✅ YES' if auto_request else '❌ NO'}")
-        success, message, driver_name, eta = await uber_automation.book_ride(
-            uid, start_location, end_location, auto_request=auto_request
-        )
+        async with admission.booking.slot():
+            success, message, driver_name, eta = await uber_automation.book_ride(
+                uid, start_location, end_location, auto_request=auto_request
+            )
         logger.info(f"Booking result for {uid}: success={success}, message={message}, driver={driver_name}, eta={eta}")
-        
-        # Record booking if successful
-        if success:
-            from simple_storage import record_booking
-            record_booking(uid, f"{start_location} → {end_location}", driver_name, eta)
-            logger.info(f"Booking recorded for {uid}")
-        else:
+
+        # book_ride records a completed booking itself
+        if not success:
             logger.warning(f"Booking failed for {uid}: {message}")
+    except Overloaded as e:
+        logger.warning(f"🚦 Shedding booking for {uid}: {e}")
     except Exception as e:
         logger.error(f"Error booking ride: {e}", exc_info=True)
 
 
+# ============================================================================
+# ADMIN
+# ============================================================================
+
+
+@app.get("/admin/users")
+async def admin_users(request: Request, auth_status: Optional[str] = None, authenticated: Optional[bool] = None):
+    """
+    Uids by auth_status and/or uber_authenticated, e.g. ?auth_status=failed for
+    a re-auth sweep. Answered from the storage index; no user record is read.
+    """
+    if ADMIN_TOKEN and request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    started = time.perf_counter()
+    uids = find_users(auth_status, authenticated)
+    return {
+        "auth_status": auth_status,
+        "authenticated": authenticated,
+        "count": len(uids),
+        "uids": uids,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+@app.get("/admin/bookings")
+async def admin_bookings(request: Request, uid: Optional[str] = None, limit: int = 10,
+                         since: Optional[float] = None, until: Optional[float] = None):
+    """
+    Booking history from the booking log: a user's last `limit` bookings
+    (newest first), or with since/until (epoch seconds) the bookings in that
+    range (oldest first), for one uid or everyone.
+    """
+    if ADMIN_TOKEN and request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    if uid is None and since is None and until is None:
+        raise HTTPException(status_code=400, detail="uid or a since/until range required")
+    started = time.perf_counter()
+    log = get_booking_log()
+    if since is None and until is None:
+        bookings = log.last(uid, limit)
+    else:
+        bookings = log.between(since or 0.0, until if until is not None else float("inf"), uid)
+    return {
+        "uid": uid,
+        "count": len(bookings),
+        "bookings": bookings,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline counters and latency percentiles for monitoring."""
+    return {
+        "buckets": {
+            "active": len(segment_buckets),
+            **silence_scheduler.stats(),
+        },
+        "end_of_utterance": utterance_detector.stats(),
+        "admission": admission.stats(),
+        "dedup": segment_dedup.stats(),
+        "extraction": backend_stats(),
+        "intent_cache": intent_cache.stats(),
+        "ride_classifier": classifier_stats(),
+        "gazetteer": gazetteer_stats(),
+        "landmarks": landmark_stats(),
+        "ip_locator": ip_locator_stats(),
+        "pickup_prefetch": pickup_prefetch.stats(),
+        "storage": storage_stats(),
+        "bookings": booking_log_stats(),
+        "browser_pool": browser_pool.stats(),
+    }
+
+
 # ============================================================================
 # STARTUP & SHUTDOWN
 # ============================================================================
@@ -958,20 +1197,42 @@ async def startup_event():
     """Initialize app on startup."""
     logger.info("Omi Uber App starting up...")
     # Ensure storage directories exist
-    from simple_storage import ensure_dirs
+    from simple_storage import ensure_dirs, open_storage
     ensure_dirs()
+    # Loads (or on first run builds) the user auth index off the loop
+    await asyncio.to_thread(open_storage)
+    # Rebuilds the booking index from segment sidecars and applies retention
+    await asyncio.to_thread(open_booking_log)
+    # Train the ride pre-classifier now rather than on the first flush
+    get_classifier()
+    get_gazetteer()
+    # Memory-maps the prebuilt index (builds it if the dataset changed)
+    get_landmark_index()
+    get_ip_locator()
+    # Park booking pages for the most recent riders and keep them fresh
+    browser_pool.start_warmer(get_booking_log().recent_uids(browser_pool.warm_contexts))
+    # Close contexts past BROWSER_CONTEXT_MAX_AGE and the browsers they leave empty
+    browser_pool.start_reaper()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown."""
     logger.info("Omi Uber App shutting down...")
+    silence_scheduler.close()
+    await close_backend()
+    await close_ip_locator()
+    intent_cache.close()
     # Close any active browsers
     for uid in list(active_browsers.keys()):
         try:
             await auth_manager._cleanup_browser(uid)
         except Exception as e:
             logger.error(f"Error cleaning up browser for {uid}: {e}")
+    await browser_pool.shutdown()
+    # Buffered user record updates go to disk before exit
+    await asyncio.to_thread(close_storage)
+    close_booking_log()
 
 
 if __name__ == "__main__":
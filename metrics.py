@@ -0,0 +1,46 @@
+"""
+Lightweight in-process metrics shared by the pipeline components.
+Latencies are recorded in seconds and reported in milliseconds.
+"""
+
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+
+def _nearest_rank(ordered: List[float], q: float) -> float:
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class LatencyStats:
+    """Rolling window of latency samples with percentile summaries."""
+
+    def __init__(self, window: int = 2048):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        """Add one sample."""
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile (0-100) over the rolling window, in seconds."""
+        if not self._samples:
+            return None
+        return _nearest_rank(sorted(self._samples), q)
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Count, mean and p50/p95/max in milliseconds."""
+        if not self._samples:
+            return {"count": self.count, "mean_ms": None, "p50_ms": None, "p95_ms": None, "max_ms": None}
+        ordered = sorted(self._samples)
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(_nearest_rank(ordered, 50) * 1000, 3),
+            "p95_ms": round(_nearest_rank(ordered, 95) * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3),
+        }
@@ -0,0 +1,92 @@
+"""
+Speculative pickup resolution for bucket flushes.
+Most ride requests name only a destination, so the pickup (GPS or IP ->
+nearest landmark) is started as soon as the bucket flushes and runs while
+the LLM extracts the intent. The answer is used when extraction comes back
+without a start location and thrown away when it is not a ride or the user
+said where to be picked up. Stage timings show how much of the pickup time
+was hidden behind extraction.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+PICKUP_PREFETCH = os.getenv("PICKUP_PREFETCH", "true").lower() == "true"
+
+# (phone_ip, gps_lat, gps_lon) -> pickup landmark
+Resolver = Callable[[Optional[str], Optional[float], Optional[float]], Awaitable[Optional[str]]]
+
+
+class PickupPrefetcher:
+    """Starts pickup resolution alongside extraction and times both stages."""
+
+    def __init__(self, resolve: Resolver, enabled: bool = PICKUP_PREFETCH):
+        self.resolve = resolve
+        self.enabled = enabled
+        self.extraction_latency = LatencyStats()
+        self.pickup_latency = LatencyStats()
+        # Time the flush spent blocked on the pickup after extraction returned
+        self.pickup_wait = LatencyStats()
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        self.hidden_seconds = 0.0
+
+    async def _timed(self, ip: Optional[str], lat: Optional[float], lon: Optional[float]) -> Tuple[Optional[str], float]:
+        started = time.perf_counter()
+        try:
+            return await self.resolve(ip, lat, lon), time.perf_counter() - started
+        except Exception as e:
+            logger.error(f"❌ Pickup resolution failed: {e}")
+            return None, time.perf_counter() - started
+        finally:
+            self.pickup_latency.record(time.perf_counter() - started)
+
+    def start(self, ip: Optional[str], lat: Optional[float], lon: Optional[float]) -> Optional[asyncio.Task]:
+        """Begin resolving the pickup in the background (None when disabled)."""
+        if not self.enabled:
+            return None
+        self.started += 1
+        return asyncio.create_task(self._timed(ip, lat, lon))
+
+    def record_extraction(self, seconds: float):
+        self.extraction_latency.record(seconds)
+
+    async def take(self, task: Optional[asyncio.Task], ip: Optional[str], lat: Optional[float],
+                   lon: Optional[float]) -> Optional[str]:
+        """The speculative pickup, or one resolved now if none was started."""
+        started = time.perf_counter()
+        if task is None:
+            pickup, _ = await self._timed(ip, lat, lon)
+        else:
+            pickup, took = await task
+            self.used += 1
+            self.hidden_seconds += max(0.0, took - (time.perf_counter() - started))
+        self.pickup_wait.record(time.perf_counter() - started)
+        return pickup
+
+    def discard(self, task: Optional[asyncio.Task]):
+        """Drop a speculative pickup that the extraction made unnecessary."""
+        if task is None:
+            return
+        self.discarded += 1
+        task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "used": self.used,
+            "discarded": self.discarded,
+            "hidden_ms_total": round(self.hidden_seconds * 1000, 3),
+            "extraction": self.extraction_latency.snapshot(),
+            "pickup": self.pickup_latency.snapshot(),
+            "pickup_wait": self.pickup_wait.snapshot(),
+        }
@@ -0,0 +1,163 @@
+"""
+Local first-stage classifier for ride requests.
+Almost everything Omi streams is ordinary conversation, so each flushed
+bucket is scored by a tiny logistic model over hashed words plus a few
+hand-written ride features. Only likely ride requests are forwarded to the LLM.
+
+The model trains in milliseconds from a labeled TSV (label<TAB>text per line)
+the first time it is needed.
+"""
+
+import logging
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ride_detector import TRIGGER_PATTERN
+
+logger = logging.getLogger(__name__)
+
+RIDE_CLASSIFIER_ENABLED = os.getenv("RIDE_CLASSIFIER_ENABLED", "true").lower() == "true"
+RIDE_CLASSIFIER_DATA = os.getenv(
+    "RIDE_CLASSIFIER_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ride_intents.tsv")
+)
+# Kept low on purpose: a missed ride costs more than an extra LLM call
+RIDE_CLASSIFIER_THRESHOLD = float(os.getenv("RIDE_CLASSIFIER_THRESHOLD", "0.25"))
+
+# Hashed unigram + bigram buckets
+_HASH_DIM = 4096
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+_RIDE_NOUN = re.compile(r"\b(uber|lyft|ride|rides|taxi|cab|car|lift)\b")
+_RIDE_VERB = re.compile(r"\b(book|get|call|order|request|need|grab|hail|want|take|give|find)\b")
+_DESTINATION = re.compile(r"\b(to|from)\s+(the\s+)?\w+")
+_TAKE_ME = re.compile(r"\b(take|get)\s+me\s+(to|home)\b")
+_PAST_OR_OTHER = re.compile(r"\b(took|was|were|yesterday|last|eats|stock|app|rating|drives|driver)\b")
+_QUESTION = re.compile(r"\b(how much|how far|is it|what time)\b")
+
+_HAND_FEATURES = (
+    lambda t: bool(TRIGGER_PATTERN.search(t)),
+    lambda t: bool(_RIDE_NOUN.search(t)),
+    lambda t: bool(_RIDE_VERB.search(t)),
+    lambda t: bool(_DESTINATION.search(t)),
+    lambda t: bool(_TAKE_ME.search(t)),
+    lambda t: bool(_PAST_OR_OTHER.search(t)),
+    lambda t: bool(_QUESTION.search(t)),
+)
+_DIM = _HASH_DIM + len(_HAND_FEATURES)
+
+
+def _bucket(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) % _HASH_DIM
+
+
+def featurize(text: str) -> np.ndarray:
+    """L2-normalized hashed bag of words and bigrams plus ride features."""
+    text = (text or "").lower()
+    tokens = _TOKEN.findall(text)
+    x = np.zeros(_DIM, dtype=np.float32)
+    for token in tokens:
+        x[_bucket(token)] = 1.0
+    for first, second in zip(tokens, tokens[1:]):
+        x[_bucket(f"{first} {second}")] = 1.0
+    for i, feature in enumerate(_HAND_FEATURES):
+        if feature(text):
+            x[_HASH_DIM + i] = 1.0
+    norm = np.linalg.norm(x)
+    return x / norm if norm else x
+
+
+def load_labeled(path: str) -> Tuple[List[str], np.ndarray]:
+    """Read label<TAB>text lines; '#' lines are comments."""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, _, text = line.rstrip("\n").partition("\t")
+            texts.append(text)
+            labels.append(float(label))
+    return texts, np.array(labels, dtype=np.float32)
+
+
+class RideClassifier:
+    """Logistic regression over featurize(), trained with batch gradient descent."""
+
+    def __init__(self, threshold: float = RIDE_CLASSIFIER_THRESHOLD):
+        self.threshold = threshold
+        self.weights = np.zeros(_DIM, dtype=np.float32)
+        self.bias = 0.0
+        self.scored = 0
+        self.forwarded = 0
+        self.rejected = 0
+
+    def fit(self, texts: Sequence[str], labels: np.ndarray, epochs: int = 400, lr: float = 2.0, l2: float = 1e-4):
+        X = np.stack([featurize(t) for t in texts])
+        y = labels.astype(np.float32)
+        # Balance the classes so the rarer ride examples are not drowned out
+        pos = max(1.0, float(y.sum()))
+        neg = max(1.0, float(len(y) - y.sum()))
+        sample_weight = np.where(y == 1, len(y) / (2 * pos), len(y) / (2 * neg)).astype(np.float32)
+        w = np.zeros(X.shape[1], dtype=np.float32)
+        b = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(X @ w + b)))
+            err = (p - y) * sample_weight
+            w -= lr * (X.T @ err / len(y) + l2 * w)
+            b -= lr * float(err.mean())
+        self.weights, self.bias = w, b
+        return self
+
+    def score(self, text: str) -> float:
+        """Probability that text is a ride request."""
+        z = float(featurize(text) @ self.weights + self.bias)
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def is_candidate(self, text: str) -> bool:
+        """Whether text should go on to the LLM. Explicit trigger phrases always do."""
+        self.scored += 1
+        lowered = (text or "").lower()
+        if TRIGGER_PATTERN.search(lowered) or _TAKE_ME.search(lowered) or self.score(text) >= self.threshold:
+            self.forwarded += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "scored": self.scored,
+            "forwarded": self.forwarded,
+            "rejected": self.rejected,
+            "llm_calls_avoided": round(self.rejected / self.scored, 4) if self.scored else None,
+        }
+
+
+_classifier: Optional[RideClassifier] = None
+
+
+def get_classifier() -> Optional[RideClassifier]:
+    """Shared classifier, trained from RIDE_CLASSIFIER_DATA on first use; None if disabled."""
+    global _classifier
+    if _classifier is None and RIDE_CLASSIFIER_ENABLED:
+        try:
+            texts, labels = load_labeled(RIDE_CLASSIFIER_DATA)
+            _classifier = RideClassifier().fit(texts, labels)
+            logger.info(f"🧮 Ride classifier trained on {len(texts)} examples")
+        except OSError as e:
+            logger.error(f"❌ Ride classifier disabled, cannot read {RIDE_CLASSIFIER_DATA}: {e}")
+            return None
+        except ValueError as e:
+            # Bad labels or no examples: every text goes to the extraction backend instead
+            logger.error(f"❌ Ride classifier disabled, malformed {RIDE_CLASSIFIER_DATA}: {e}")
+            return None
+    return _classifier
+
+
+def classifier_stats() -> Dict[str, Any]:
+    if _classifier is None:
+        return {"enabled": RIDE_CLASSIFIER_ENABLED, "trained": False}
+    return {"enabled": True, "trained": True, **_classifier.stats()}
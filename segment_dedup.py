@@ -0,0 +1,144 @@
+"""
+Per-user de-duplication of transcript segments at ingestion.
+Omi resends identical or overlapping segments when it reconnects; without
+filtering they are appended to the bucket and sent to the LLM again.
+Each user keeps a bounded LRU of content hashes plus the tail of the last
+accepted text, so exact repeats are dropped and partial repeats trimmed.
+Entries expire after DEDUP_TTL seconds so a user deliberately repeating a
+request later is not silenced.
+"""
+
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Content hashes remembered per user
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "256"))
+DEDUP_MAX_USERS = int(os.getenv("DEDUP_MAX_USERS", "100000"))
+# Resends arrive within seconds of the original
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "60"))
+# Shortest word overlap with the previous segment that is treated as a resend
+DEDUP_MIN_OVERLAP_WORDS = int(os.getenv("DEDUP_MIN_OVERLAP_WORDS", "3"))
+
+# Words of the last accepted text kept for overlap trimming
+_TAIL_WORDS = 32
+# Rough OpenAI tokenizer ratio for English text
+_CHARS_PER_TOKEN = 4
+
+_NON_WORD = re.compile(r"[^\w\s']+")
+
+
+def _normalize_words(text: str) -> List[str]:
+    return _NON_WORD.sub(" ", text.lower()).split()
+
+
+def _digest(words: List[str]) -> bytes:
+    return hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=8).digest()
+
+
+class _UserWindow:
+    __slots__ = ("hashes", "tail", "tail_at")
+
+    def __init__(self):
+        self.hashes: "OrderedDict[bytes, float]" = OrderedDict()
+        self.tail: List[str] = []
+        self.tail_at = 0.0
+
+
+class SegmentDeduplicator:
+    """Drops repeated segments and trims overlapping resends, per user."""
+
+    def __init__(self, window: int = DEDUP_WINDOW, max_users: int = DEDUP_MAX_USERS, ttl: float = DEDUP_TTL):
+        self.window = window
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users: "OrderedDict[str, _UserWindow]" = OrderedDict()
+        self.segments_seen = 0
+        self.segments_dropped = 0
+        self.segments_trimmed = 0
+        self.chars_saved = 0
+        self.llm_calls_saved = 0
+
+    def _window(self, uid: str) -> _UserWindow:
+        user = self._users.get(uid)
+        if user is None:
+            user = self._users[uid] = _UserWindow()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(uid)
+        return user
+
+    def _overlap(self, tail: List[str], words: List[str]) -> int:
+        """Longest prefix of words that repeats the end of the previous text."""
+        for k in range(min(len(tail), len(words)), DEDUP_MIN_OVERLAP_WORDS - 1, -1):
+            if tail[-k:] == words[:k]:
+                return k
+        return 0
+
+    def filter(self, uid: str, segments: List[Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return the segments worth keeping, with overlapping prefixes trimmed."""
+        now = time.time() if now is None else now
+        user = self._window(uid)
+        if now - user.tail_at > self.ttl:
+            user.tail = []
+        kept = []
+        for seg in segments:
+            self.segments_seen += 1
+            text = seg.get("text", "")
+            words = _normalize_words(text)
+            if not words:
+                self.segments_dropped += 1
+                self.chars_saved += len(text)
+                continue
+
+            digest = _digest(words)
+            seen_at = user.hashes.get(digest)
+            if seen_at is not None and now - seen_at <= self.ttl:
+                self.segments_dropped += 1
+                self.chars_saved += len(text)
+                continue
+
+            overlap = self._overlap(user.tail, words)
+            if overlap == len(words):
+                self.segments_dropped += 1
+                self.chars_saved += len(text)
+                continue
+            if overlap:
+                raw_words = text.split()
+                # Normalization can merge or drop tokens; only trim when they still line up
+                if len(raw_words) == len(words):
+                    trimmed = " ".join(raw_words[overlap:])
+                    self.chars_saved += len(text) - len(trimmed)
+                    self.segments_trimmed += 1
+                    seg = {**seg, "text": trimmed}
+
+            user.hashes[digest] = now
+            user.hashes.move_to_end(digest)
+            if len(user.hashes) > self.window:
+                user.hashes.popitem(last=False)
+            user.tail = (user.tail + words[overlap:])[-_TAIL_WORDS:]
+            user.tail_at = now
+            kept.append(seg)
+        return kept
+
+    def note_call_saved(self):
+        """A request made only of repeats would otherwise have opened a bucket."""
+        self.llm_calls_saved += 1
+
+    def forget(self, uid: str):
+        """Drop everything remembered for uid."""
+        self._users.pop(uid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_users": len(self._users),
+            "segments_seen": self.segments_seen,
+            "segments_dropped": self.segments_dropped,
+            "segments_trimmed": self.segments_trimmed,
+            "tokens_saved": self.chars_saved // _CHARS_PER_TOKEN,
+            "llm_calls_saved": self.llm_calls_saved,
+        }
@@ -0,0 +1,362 @@
+"""
+Consistent-hash sharding of per-uid state across worker processes.
+Bucket, rate-limit and active-booking state lives in each worker's memory,
+so every request for a uid must land on the same worker. A small stateless
+dispatcher hashes the uid onto a ring of workers and forwards the request.
+
+Run a sharded stack (dispatcher on $PORT, workers on the following ports):
+    python shard_router.py --workers 4
+Or run the dispatcher alone in front of existing workers:
+    SHARD_WORKER_URLS=http://10.0.0.2:8001,http://10.0.0.3:8001 uvicorn shard_router:app
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from batch_ingest import BatchRecordError, iter_batch_records
+
+logger = logging.getLogger(__name__)
+
+# Identity of this worker within the sharded stack (unset = not sharded)
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_REPLICAS = int(os.getenv("SHARD_REPLICAS", "128"))
+
+# Response headers worth passing back from a worker
+_FORWARD_HEADERS = ("content-type", "retry-after", "location")
+# Per-process storage directories; each worker gets its own shard-N subdirectory
+_SHARDED_DIRS = {"USERS_DIR": "users", "SESSIONS_DIR": "sessions", "BOOKING_LOG_DIR": "bookings"}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to shard indexes, with virtual nodes."""
+
+    def __init__(self, shard_count: int, replicas: int = SHARD_REPLICAS):
+        self.shard_count = shard_count
+        points = sorted(
+            (_hash(f"shard-{shard}#{replica}"), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        """Shard index that owns key."""
+        if self.shard_count <= 1:
+            return 0
+        i = bisect.bisect(self._hashes, _hash(key))
+        return self._shards[i % len(self._shards)]
+
+
+local_ring = HashRing(SHARD_COUNT)
+
+
+def owns_uid(uid: str) -> bool:
+    """Whether this worker process is the owner of uid's in-memory state."""
+    return SHARD_COUNT <= 1 or local_ring.shard_for(uid) == SHARD_INDEX
+
+
+def uid_from_request(query_uid: Optional[str], body: bytes) -> str:
+    """uid from the query string, else from a JSON body, else default_user."""
+    if query_uid:
+        return query_uid
+    if body:
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict) and data.get("uid"):
+                return str(data["uid"])
+        except (ValueError, UnicodeDecodeError):
+            pass
+    return "default_user"
+
+
+# ============================================================================
+# DISPATCHER
+# ============================================================================
+
+
+def create_dispatcher(worker_urls: Sequence[str], transport: Optional[httpx.AsyncBaseTransport] = None) -> FastAPI:
+    """
+    Stateless front app forwarding each request to the worker owning its uid.
+    Admin queries that span every user are sent to all workers and merged.
+    """
+    workers = [url.rstrip("/") for url in worker_urls]
+    ring = HashRing(len(workers))
+    dispatcher = FastAPI(title="Omi Uber Shard Dispatcher")
+    state: Dict[str, httpx.AsyncClient] = {}
+
+    def http() -> httpx.AsyncClient:
+        if "client" not in state:
+            state["client"] = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_connections=256, max_keepalive_connections=64),
+                transport=transport,
+            )
+        return state["client"]
+
+    def forward_headers(request: Request) -> Dict[str, str]:
+        headers = {"x-forwarded-for": request.client.host if request.client else ""}
+        for name in ("content-type", "x-admin-token"):
+            if name in request.headers:
+                headers[name] = request.headers[name]
+        return headers
+
+    def to_response(upstream: httpx.Response) -> Response:
+        headers = {k: v for k, v in upstream.headers.items() if k.lower() in _FORWARD_HEADERS}
+        return Response(content=upstream.content, status_code=upstream.status_code, headers=headers)
+
+    @dispatcher.on_event("shutdown")
+    async def close_client():
+        if "client" in state:
+            await state.pop("client").aclose()
+
+    @dispatcher.get("/shards")
+    async def shards():
+        """Worker list and health as seen from the dispatcher."""
+        async def probe(url: str) -> bool:
+            try:
+                return (await http().get(f"{url}/health", timeout=2.0)).status_code == 200
+            except httpx.HTTPError:
+                return False
+
+        healthy = await asyncio.gather(*(probe(url) for url in workers))
+        return {"workers": [{"shard": i, "url": url, "healthy": ok} for i, (url, ok) in enumerate(zip(workers, healthy))]}
+
+    @dispatcher.post("/webhook/batch")
+    async def webhook_batch(request: Request):
+        """Split a batch by owning shard and forward the parts concurrently."""
+        parts: Dict[int, List[str]] = defaultdict(list)
+        rejected = 0
+        errors = []
+        async for record in iter_batch_records(request.stream()):
+            if isinstance(record, BatchRecordError) or not isinstance(record, dict):
+                rejected += 1
+                if len(errors) < 20:
+                    errors.append({"error": str(record) if isinstance(record, BatchRecordError) else "Record is not a JSON object"})
+                continue
+            uid = str(record.get("uid") or "default_user")
+            parts[ring.shard_for(uid)].append(json.dumps(record))
+
+        async def send(shard: int, lines: List[str]) -> dict:
+            """The worker's batch summary; a refused or failed part counts all its lines as rejected."""
+            try:
+                upstream = await http().post(
+                    f"{workers[shard]}/webhook/batch",
+                    content="\n".join(lines),
+                    headers={**forward_headers(request), "content-type": "application/x-ndjson"},
+                )
+            except httpx.HTTPError as e:
+                logger.error(f"Shard forwarding to {workers[shard]} failed: {e}")
+                return {"rejected": len(lines), "failed": True,
+                        "errors": [{"shard": shard, "error": "Shard unavailable"}]}
+            if upstream.status_code == 200:
+                return upstream.json()
+            retry_after = upstream.headers.get("retry-after")
+            return {
+                "rejected": len(lines),
+                "failed": upstream.status_code != 429,
+                "retry_after": int(retry_after) if retry_after and retry_after.isdigit() else None,
+                "errors": [{"shard": shard, "error": f"Shard answered {upstream.status_code}"}],
+            }
+
+        results = await asyncio.gather(*(send(shard, lines) for shard, lines in parts.items()))
+        if results and all(r.get("failed") for r in results):
+            return JSONResponse({"message": "❌ Shard unavailable", "booked": False}, status_code=502)
+        accepted = sum(r.get("accepted", 0) for r in results)
+        rejected += sum(r.get("rejected", 0) for r in results)
+        segments = sum(r.get("segments", 0) for r in results)
+        duplicates = sum(r.get("duplicates", 0) for r in results)
+        for r in results:
+            errors.extend(r.get("errors", [])[: max(0, 20 - len(errors))])
+        # A busy shard's records were refused whole: tell the device when to resend them
+        retry_after = max((r["retry_after"] for r in results if r.get("retry_after")), default=None)
+        summary = {
+            "message": f"📝 Received {segments} segment(s) across {accepted} record(s)",
+            "records": accepted + rejected,
+            "accepted": accepted,
+            "rejected": rejected,
+            "segments": segments,
+            "duplicates": duplicates,
+            "errors": errors,
+            "shards": len(parts),
+            "booked": False,
+            "batching": True,
+        }
+        if retry_after is None:
+            return summary
+        summary["retry_after"] = retry_after
+        status_code = 429 if accepted == 0 else 200
+        return JSONResponse(summary, status_code=status_code, headers={"Retry-After": str(retry_after)})
+
+    async def fan_out(request: Request):
+        """The request's GET answered by every worker: (JSON bodies, None) or (None, error response)."""
+        query = f"?{request.url.query}" if request.url.query else ""
+        try:
+            responses = await asyncio.gather(*(
+                http().get(f"{url}{request.url.path}{query}", headers=forward_headers(request)) for url in workers
+            ))
+        except httpx.HTTPError as e:
+            logger.error(f"Shard fan-out for {request.url.path} failed: {e}")
+            return None, JSONResponse({"message": "❌ Shard unavailable"}, status_code=502)
+        for upstream in responses:
+            if upstream.status_code != 200:
+                return None, to_response(upstream)
+        return [upstream.json() for upstream in responses], None
+
+    @dispatcher.get("/admin/users")
+    async def admin_users(request: Request):
+        """Each worker indexes only its own users, so ask them all and merge the uids."""
+        results, error = await fan_out(request)
+        if error is not None:
+            return error
+        # Workers on a shared SQLite store all see every user
+        uids = sorted({uid for result in results for uid in result["uids"]})
+        return {
+            **results[0],
+            "count": len(uids),
+            "uids": uids,
+            "took_ms": max(result["took_ms"] for result in results),
+            "shards": len(results),
+        }
+
+    @dispatcher.get("/admin/bookings")
+    async def admin_bookings(request: Request):
+        """One user's bookings from its owner; a time range for everyone from all workers, merged by time."""
+        if request.query_params.get("uid"):
+            return await forward("admin/bookings", request)
+        results, error = await fan_out(request)
+        if error is not None:
+            return error
+        bookings = sorted((booking for result in results for booking in result["bookings"]), key=lambda b: b["ts"])
+        return {
+            **results[0],
+            "count": len(bookings),
+            "bookings": bookings,
+            "took_ms": max(result["took_ms"] for result in results),
+            "shards": len(results),
+        }
+
+    @dispatcher.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def forward(path: str, request: Request):
+        """Forward any other request to the worker that owns its uid."""
+        body = await request.body()
+        uid = uid_from_request(request.query_params.get("uid"), body)
+        url = f"{workers[ring.shard_for(uid)]}/{path}"
+        if request.url.query:
+            url = f"{url}?{request.url.query}"
+        try:
+            upstream = await http().request(
+                request.method,
+                url,
+                content=body,
+                headers=forward_headers(request),
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Shard forwarding to {url} failed: {e}")
+            return JSONResponse({"message": "❌ Shard unavailable", "booked": False}, status_code=502)
+        return to_response(upstream)
+
+    return dispatcher
+
+
+_worker_urls = [url for url in os.getenv("SHARD_WORKER_URLS", "").split(",") if url]
+app = create_dispatcher(_worker_urls) if _worker_urls else None
+
+
+# ============================================================================
+# LAUNCHER
+# ============================================================================
+
+
+def shard_env(shard: int, workers: int, environ: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Environment for one worker. Users, sessions and the booking log are kept
+    in a shard-N directory per worker so no two processes write the same
+    files (the auth index and booking log sequence are per process). The
+    SQLite stores are shared; SQLite handles concurrent writers itself.
+    """
+    environ = dict(os.environ if environ is None else environ)
+    env = {
+        **environ,
+        "SHARD_INDEX": str(shard),
+        "SHARD_COUNT": str(workers),
+        "TRUST_FORWARDED_FOR": "true",
+    }
+    for name, default in _SHARDED_DIRS.items():
+        env[name] = os.path.join(environ.get(name, default), f"shard-{shard}")
+    return env
+
+
+def _build_indexes():
+    """Build the offline IP and landmark indexes once, before workers race to do it."""
+    from ip_locator import load_ip_db
+    from landmark_index import load_landmark_index
+
+    for load in (load_ip_db, load_landmark_index):
+        try:
+            load()
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Could not prebuild index with {load.__name__}: {e}")
+
+
+def run_sharded(workers: int, port: int, dispatchers: int = 1):
+    """Start `workers` app processes on localhost plus the dispatcher on `port`."""
+    procs = []
+    urls = []
+    _build_indexes()
+    for shard in range(workers):
+        worker_port = port + 1 + shard
+        env = shard_env(shard, workers)
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(worker_port)],
+            env=env,
+        ))
+        urls.append(f"http://127.0.0.1:{worker_port}")
+
+    # The dispatcher is stateless, so it can use uvicorn's SO_REUSEPORT workers
+    env = {**os.environ, "SHARD_WORKER_URLS": ",".join(urls)}
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "shard_router:app", "--host", "0.0.0.0", "--port", str(port),
+         "--workers", str(dispatchers)],
+        env=env,
+    ))
+    print(f"🧩 Sharded stack: dispatcher on :{port}, {workers} worker(s) on :{port + 1}-{port + workers}")
+
+    def stop(*_):
+        for proc in procs:
+            proc.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for proc in procs:
+            proc.wait()
+    except KeyboardInterrupt:
+        stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the app as uid-sharded worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dispatchers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    args = parser.parse_args()
+    run_sharded(args.workers, args.port, args.dispatchers)
@@ -0,0 +1,148 @@
+"""
+Central silence scheduler for conversation buckets.
+A single deadline heap replaces the per-uid polling tasks: one loop timer is
+armed for the earliest deadline and fires the flush callback exactly when a
+uid's silence window closes.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Loop timers may fire up to one clock tick early
+_DEADLINE_SLACK = 0.001
+
+
+class SilenceTimer:
+    """Handle for one uid's pending silence window."""
+
+    __slots__ = ("key", "deadline", "cancelled")
+
+    def __init__(self, key: str, deadline: float):
+        self.key = key
+        self.deadline = deadline
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop this timer from firing."""
+        self.cancelled = True
+
+
+class SilenceScheduler:
+    """Fires a flush callback for each key once it has been silent long enough."""
+
+    def __init__(self, callback: Callable[[str], Awaitable[None]], wait_time: float):
+        self._callback = callback
+        self.wait_time = wait_time
+        self._heap: List[Tuple[float, int, SilenceTimer]] = []
+        self._timers: Dict[str, SilenceTimer] = {}
+        self._seq = itertools.count()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._armed_at: Optional[float] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.fired = 0
+
+    def touch(self, key: str, wait_time: Optional[float] = None) -> SilenceTimer:
+        """
+        Start or extend the silence window for key.
+        Extending an existing window is O(1): the timer's deadline is moved in
+        place and its heap entry re-queues itself lazily when it surfaces.
+        """
+        loop = asyncio.get_running_loop()
+        delay = self.wait_time if wait_time is None else wait_time
+        deadline = loop.time() + delay
+
+        timer = self._timers.get(key)
+        if timer is not None and not timer.cancelled:
+            if deadline >= timer.deadline:
+                timer.deadline = deadline
+                return timer
+            # Window is being shortened, the old heap entry is too late
+            timer.cancel()
+
+        timer = SilenceTimer(key, deadline)
+        self._timers[key] = timer
+        heapq.heappush(self._heap, (deadline, next(self._seq), timer))
+        self._arm(loop)
+        return timer
+
+    def cancel(self, key: str):
+        """Drop the pending window for key without firing."""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+    def pending(self, key: str) -> bool:
+        """Whether key has a silence window that has not fired yet."""
+        timer = self._timers.get(key)
+        return timer is not None and not timer.cancelled
+
+    def _arm(self, loop: asyncio.AbstractEventLoop):
+        """Make sure the loop timer is set for the earliest deadline."""
+        if not self._heap:
+            return
+        earliest = self._heap[0][0]
+        if self._handle is not None:
+            if self._armed_at <= earliest:
+                return
+            self._handle.cancel()
+        self._armed_at = earliest
+        self._handle = loop.call_at(earliest, self._on_timer, loop)
+
+    def _on_timer(self, loop: asyncio.AbstractEventLoop):
+        """Fire every window that has closed, then re-arm for the next one."""
+        self._handle = None
+        self._armed_at = None
+        now = loop.time() + _DEADLINE_SLACK
+        heap = self._heap
+
+        while heap and heap[0][0] <= now:
+            _, _, timer = heapq.heappop(heap)
+            if timer.cancelled:
+                # Cancelled through its handle (e.g. bucket cleared)
+                if self._timers.get(timer.key) is timer:
+                    del self._timers[timer.key]
+                continue
+            if timer.deadline > now:
+                # Extended since it was queued
+                heapq.heappush(heap, (timer.deadline, next(self._seq), timer))
+                continue
+            timer.cancel()
+            if self._timers.get(timer.key) is timer:
+                del self._timers[timer.key]
+            self.fired += 1
+            task = loop.create_task(self._run(timer.key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        self._arm(loop)
+
+    async def _run(self, key: str):
+        try:
+            await self._callback(key)
+        except Exception as e:
+            logger.error(f"Error flushing bucket for {key}: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Scheduler counters for monitoring."""
+        return {
+            "pending": len(self._timers),
+            "heap_size": len(self._heap),
+            "flushing": len(self._tasks),
+            "fired": self.fired,
+        }
+
+    def close(self):
+        """Cancel the loop timer and forget every pending window."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+            self._armed_at = None
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._heap.clear()
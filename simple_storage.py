@@ -1,17 +1,44 @@
+import atexit
+import copy
+import hashlib
 import json
+import logging
 import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 
-SESSIONS_DIR = Path("sessions")
-USERS_DIR = Path("users")
+from booking_log import get_booking_log
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DIR = Path(os.getenv("SESSIONS_DIR", "sessions"))
+USERS_DIR = Path(os.getenv("USERS_DIR", "users"))
+# Hold user record updates in memory and write them from a background thread
+USER_WRITE_BEHIND = os.getenv("USER_WRITE_BEHIND", "true").lower() == "true"
+# Seconds between background writes; updates to one user in between become one write
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "0.5"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Where users and sessions live: "files" (JSON per user) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files").lower()
+STORAGE_DB_PATH = os.getenv("STORAGE_DB_PATH", "omi_uber.db")
+# Auth index log entries replayed at startup before they are folded into the snapshot
+AUTH_INDEX_COMPACT_EVERY = int(os.getenv("AUTH_INDEX_COMPACT_EVERY", "10000"))
+# Browser sessions keep only cookies and localStorage for these domains (empty keeps all)
+SESSION_DOMAINS = [d.strip().lower() for d in os.getenv("SESSION_DOMAINS", "uber.com").split(",") if d.strip()]
+SESSION_ZLIB_LEVEL = int(os.getenv("SESSION_ZLIB_LEVEL", "6"))
 
 
 def ensure_dirs():
     """Create necessary directories if they don't exist."""
-    SESSIONS_DIR.mkdir(exist_ok=True)
-    USERS_DIR.mkdir(exist_ok=True)
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    USERS_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def get_user_file(uid: str) -> Path:
@@ -23,20 +50,14 @@ def get_user_file(uid: str) -> Path:
 def get_session_file(uid: str) -> Path:
     """Get the session file path."""
     ensure_dirs()
-    return SESSIONS_DIR / f"{uid}_uber_session.json"
+    return SESSIONS_DIR / f"{uid}_uber_session.json.z"
 
 
-def load_user_data(uid: str) -> Dict[str, Any]:
-    """Load user data from file."""
-    user_file = get_user_file(uid)
-    if user_file.exists():
-        with open(user_file, "r") as f:
-            return json.load(f)
+def _new_user(uid: str) -> Dict[str, Any]:
     return {
         "uid": uid,
         "uber_authenticated": False,
         "auth_status": "not_authenticated",
-        "last_booking": None,
         "remember_device": False,
         "uber_email": None,
         "uber_password": None,
@@ -44,73 +65,586 @@ def load_user_data(uid: str) -> Dict[str, Any]:
     }
 
 
+def _minified(data: Any) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def write_bytes_atomic(path: Path, data: bytes):
+    """Write to a temp file beside path, fsync it, then rename it over path."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_json_atomic(path: Path, data: Any):
+    """Write minified JSON atomically."""
+    write_bytes_atomic(path, _minified(data))
+
+
+def _in_domains(host: str, domains: List[str]) -> bool:
+    # Entries without a host cannot be attributed to another site, so they are kept
+    host = host.lstrip(".").lower()
+    return not host or any(host == d or host.endswith("." + d) for d in domains)
+
+
+def compact_session(state: Dict[str, Any], domains: List[str] = SESSION_DOMAINS) -> Dict[str, Any]:
+    """Playwright storage_state without cookies or localStorage of other sites."""
+    if not domains:
+        return state
+    state = dict(state)
+    if "cookies" in state:
+        state["cookies"] = [c for c in state["cookies"] if _in_domains(c.get("domain", ""), domains)]
+    if "origins" in state:
+        state["origins"] = [
+            o for o in state["origins"] if _in_domains(urlsplit(o.get("origin", "")).hostname or "", domains)
+        ]
+    return state
+
+
+class SessionFormat:
+    """
+    Compact session encoding shared by the storage backends: relevant
+    domains only, minified, zlib-compressed. Remembers a digest of the last
+    state saved or loaded per user so an unchanged state is not written again.
+    """
+
+    def __init__(self, domains: Optional[List[str]] = None, level: int = SESSION_ZLIB_LEVEL):
+        self.domains = SESSION_DOMAINS if domains is None else domains
+        self.level = level
+        self._digests: Dict[str, bytes] = {}
+        self.saves = 0
+        self.unchanged = 0
+        self.loads = 0
+        self.cache_hits = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    @staticmethod
+    def _digest(raw: bytes) -> bytes:
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def encode(self, uid: str, state: Dict[str, Any]) -> Tuple[Optional[bytes], bytes]:
+        """(compressed blob, digest); the blob is None when nothing changed since the last save or load."""
+        raw = _minified(compact_session(state, self.domains))
+        digest = self._digest(raw)
+        if self._digests.get(uid) == digest:
+            self.unchanged += 1
+            return None, digest
+        blob = zlib.compress(raw, self.level)
+        self.saves += 1
+        self.raw_bytes += len(raw)
+        self.stored_bytes += len(blob)
+        return blob, digest
+
+    def saved(self, uid: str, digest: bytes):
+        self._digests[uid] = digest
+
+    def decode(self, uid: str, blob: bytes) -> Dict[str, Any]:
+        self.loads += 1
+        raw = zlib.decompress(blob)
+        self._digests[uid] = self._digest(raw)
+        return json.loads(raw)
+
+    def forget(self, uid: str):
+        self._digests.pop(uid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "saves": self.saves,
+            "unchanged_skipped": self.unchanged,
+            "loads": self.loads,
+            "cache_hits": self.cache_hits,
+            "compression_ratio": round(self.stored_bytes / self.raw_bytes, 3) if self.raw_bytes else None,
+        }
+
+
+def auth_key(record: Dict[str, Any]) -> Tuple[str, bool]:
+    """The (auth_status, uber_authenticated) pair users are indexed by."""
+    return record.get("auth_status") or "not_authenticated", bool(record.get("uber_authenticated"))
+
+
+class AuthIndex:
+    """
+    uid -> (auth_status, uber_authenticated) for the file backend, so sweeps
+    never open per-user files. Changes are appended to a log and fsynced
+    before the user records they describe are renamed into place; the log is
+    folded into a snapshot every AUTH_INDEX_COMPACT_EVERY entries. With
+    neither file present the index is rebuilt from a one-time scan.
+    """
+
+    def __init__(self, directory: Path, compact_every: int = AUTH_INDEX_COMPACT_EVERY):
+        self.snapshot_path = directory / ".auth_index.json"
+        self.log_path = directory / ".auth_index.log"
+        self.compact_every = compact_every
+        self._keys: Dict[str, Tuple[str, bool]] = {}
+        self._by_status: Dict[str, set] = {}
+        self._logged = 0
+        self._lock = threading.Lock()
+
+    def _set(self, uid: str, key: Tuple[str, bool]):
+        old = self._keys.get(uid)
+        if old == key:
+            return
+        if old is not None:
+            self._by_status[old[0]].discard(uid)
+        self._keys[uid] = key
+        self._by_status.setdefault(key[0], set()).add(uid)
+
+    def load(self, scan: Callable[[], Iterator[Tuple[str, Dict[str, Any]]]]) -> "AuthIndex":
+        if not self.snapshot_path.exists() and not self.log_path.exists():
+            started = time.perf_counter()
+            for uid, record in scan():
+                self._set(uid, auth_key(record))
+            self._compact()
+            logger.info(f"🗂️ Built auth index: {len(self._keys)} users in {time.perf_counter() - started:.1f}s")
+            return self
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r") as f:
+                for uid, (status, authenticated) in json.load(f).items():
+                    self._set(uid, (status, authenticated))
+        if self.log_path.exists():
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    try:
+                        uid, status, authenticated = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from a crash
+                    self._set(uid, (status, authenticated))
+                    self._logged += 1
+        return self
+
+    def record(self, records: Dict[str, Dict[str, Any]]):
+        """Log the new keys of records that are about to be written."""
+        with self._lock:
+            changes = {uid: auth_key(r) for uid, r in records.items() if self._keys.get(uid) != auth_key(r)}
+            if not changes:
+                return
+            with open(self.log_path, "a") as f:
+                f.writelines(json.dumps([uid, *key]) + "\n" for uid, key in changes.items())
+                f.flush()
+                os.fsync(f.fileno())
+            for uid, key in changes.items():
+                self._set(uid, key)
+            self._logged += len(changes)
+            if self._logged >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        write_json_atomic(self.snapshot_path, self._keys)
+        self.log_path.unlink(missing_ok=True)
+        self._logged = 0
+
+    def query(self, auth_status: Optional[str] = None, authenticated: Optional[bool] = None) -> List[str]:
+        with self._lock:
+            uids = self._by_status.get(auth_status, ()) if auth_status is not None else self._keys
+            return sorted(uid for uid in uids if authenticated is None or self._keys[uid][1] == authenticated)
+
+
+class FileBackend:
+    """One JSON file per user in users/ and per browser session in sessions/."""
+
+    name = "files"
+
+    def __init__(self, users_dir: Optional[Path] = None, sessions_dir: Optional[Path] = None):
+        # None follows USERS_DIR / SESSIONS_DIR
+        self.users_dir = users_dir
+        self.sessions_dir = sessions_dir
+        self._made = set()
+        self._index: Optional[AuthIndex] = None
+        self._index_lock = threading.Lock()
+        self.sessions = SessionFormat()
+        # uid -> ((mtime_ns, size), parsed session); callers must not mutate it
+        self._parsed: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+    def _dir(self, directory: Optional[Path], default: Path) -> Path:
+        directory = directory or default
+        # mkdir once per directory rather than on every access
+        if directory not in self._made:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._made.add(directory)
+        return directory
+
+    def _write(self, path: Path, data: bytes):
+        try:
+            write_bytes_atomic(path, data)
+        except FileNotFoundError:
+            # Directory removed underneath us; recreate it once
+            self._made.discard(path.parent)
+            write_bytes_atomic(self._dir(path.parent, path.parent) / path.name, data)
+
+    def _user_path(self, uid: str) -> Path:
+        return self._dir(self.users_dir, USERS_DIR) / f"{uid}.json"
+
+    def _session_path(self, uid: str, legacy: bool = False) -> Path:
+        # Legacy sessions are pretty-printed JSON; they are replaced on the next save
+        suffix = "_uber_session.json" if legacy else "_uber_session.json.z"
+        return self._dir(self.sessions_dir, SESSIONS_DIR) / f"{uid}{suffix}"
+
+    def read_user(self, uid: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._user_path(uid), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_users(self, records: Dict[str, Dict[str, Any]]):
+        # Index first: a crash can leave it ahead of a record, never behind
+        self.auth_index().record(records)
+        for uid, record in records.items():
+            self._write(self._user_path(uid), _minified(record))
+
+    def iter_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for path in sorted(self._dir(self.users_dir, USERS_DIR).glob("[!.]*.json")):
+            with open(path, "r") as f:
+                yield path.stem, json.load(f)
+
+    def prepare(self):
+        """Load (or build) the auth index ahead of the first query."""
+        self.auth_index()
+
+    def auth_index(self) -> AuthIndex:
+        with self._index_lock:
+            if self._index is None:
+                self._index = AuthIndex(self._dir(self.users_dir, USERS_DIR)).load(self.iter_users)
+            return self._index
+
+    def query_users(self, auth_status: Optional[str] = None, authenticated: Optional[bool] = None) -> List[str]:
+        return self.auth_index().query(auth_status, authenticated)
+
+    def save_session(self, uid: str, session_data: Dict[str, Any]):
+        path = self._session_path(uid)
+        if not path.exists():
+            self.sessions.forget(uid)
+        blob, digest = self.sessions.encode(uid, session_data)
+        if blob is None:
+            return
+        self._write(path, blob)
+        self.sessions.saved(uid, digest)
+        self._parsed.pop(uid, None)
+        self._session_path(uid, legacy=True).unlink(missing_ok=True)
+
+    def load_session(self, uid: str) -> Optional[Dict[str, Any]]:
+        """Parsed session, cached until the file changes; treat it as read-only."""
+        for legacy in (False, True):
+            path = self._session_path(uid, legacy)
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            version = (st.st_mtime_ns, st.st_size)
+            cached = self._parsed.get(uid)
+            if cached is not None and cached[0] == version:
+                self.sessions.cache_hits += 1
+                return cached[1]
+            if legacy:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            else:
+                data = self.sessions.decode(uid, path.read_bytes())
+            self._parsed[uid] = (version, data)
+            return data
+        return None
+
+    def delete_session(self, uid: str):
+        self._session_path(uid).unlink(missing_ok=True)
+        self._session_path(uid, legacy=True).unlink(missing_ok=True)
+        self.sessions.forget(uid)
+        self._parsed.pop(uid, None)
+
+    def iter_sessions(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        directory = self._dir(self.sessions_dir, SESSIONS_DIR)
+        uids = {p.name.split("_uber_session.json")[0] for p in directory.glob("[!.]*_uber_session.json*")}
+        for uid in sorted(uids):
+            data = self.load_session(uid)
+            if data is not None:
+                yield uid, data
+
+    def close(self):
+        pass
+
+
+_backend = None
+
+
+def get_storage_backend():
+    """Shared backend picked by STORAGE_BACKEND, opened on first use."""
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND == "sqlite":
+            from sqlite_storage import SQLiteBackend
+            _backend = SQLiteBackend(STORAGE_DB_PATH)
+        else:
+            _backend = FileBackend()
+        logger.info(f"💾 Storage backend: {_backend.name}")
+    return _backend
+
+
+class UserStore:
+    """
+    User records cached in memory with write-behind persistence.
+    Updates only change the cached record and mark it dirty; a flusher thread
+    writes each dirty record once per interval with an atomic rename, so
+    bursts of updates for one user coalesce and the event loop never touches
+    the disk. This process is assumed to be the only writer of its users.
+    """
+
+    def __init__(self, backend=None, write_behind: bool = USER_WRITE_BEHIND,
+                 flush_interval: float = USER_FLUSH_INTERVAL, max_cached: int = USER_CACHE_SIZE):
+        # None follows STORAGE_BACKEND
+        self._backend = backend
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # uid -> updates since its last write
+        self._dirty: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # One writer at a time (flusher thread or an explicit flush)
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        self.flush_latency = LatencyStats()
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        self.writes = 0
+        self.write_errors = 0
+
+    @property
+    def backend(self):
+        return self._backend or get_storage_backend()
+
+    def _cached(self, uid: str) -> Dict[str, Any]:
+        """The live cached record, read from disk on a miss (call with _lock held)."""
+        record = self._records.get(uid)
+        if record is not None:
+            self.hits += 1
+            self._records.move_to_end(uid)
+            return record
+        self.misses += 1
+        record = self.backend.read_user(uid) or _new_user(uid)
+        self._records[uid] = record
+        self._evict()
+        return record
+
+    def _evict(self):
+        # Only clean records can leave the cache; a dirty oldest record is
+        # moved to the recent end to wait for its write
+        skips = len(self._dirty)
+        while len(self._records) > self.max_cached:
+            uid, record = self._records.popitem(last=False)
+            if uid in self._dirty:
+                self._records[uid] = record
+                skips -= 1
+                if skips < 0:
+                    break
+
+    def load(self, uid: str) -> Dict[str, Any]:
+        """A copy of the user's record."""
+        with self._lock:
+            return copy.deepcopy(self._cached(uid))
+
+    def update(self, uid: str, change: Callable[[Dict[str, Any]], None]):
+        """Apply change to the user's record in place and schedule its write."""
+        with self._lock:
+            change(self._cached(uid))
+            self._mark_dirty(uid)
+        self._persist()
+
+    def save(self, uid: str, data: Dict[str, Any]):
+        """Replace the user's record and schedule its write."""
+        with self._lock:
+            self._records[uid] = copy.deepcopy(data)
+            self._records.move_to_end(uid)
+            self._mark_dirty(uid)
+            self._evict()
+        self._persist()
+
+    def query(self, auth_status: Optional[str] = None, authenticated: Optional[bool] = None) -> List[str]:
+        """Uids matching the filters, including updates not yet written."""
+        with self._lock:
+            pending = {uid: auth_key(self._records[uid]) for uid in self._dirty}
+        matches = set(self.backend.query_users(auth_status, authenticated)).difference(pending)
+        matches.update(
+            uid for uid, (status, is_authenticated) in pending.items()
+            if (auth_status is None or status == auth_status)
+            and (authenticated is None or is_authenticated == authenticated)
+        )
+        return sorted(matches)
+
+    def _mark_dirty(self, uid: str):
+        self.updates += 1
+        self._dirty[uid] = self._dirty.get(uid, 0) + 1
+
+    def _persist(self):
+        if not self.write_behind or self._closed:
+            self.flush()
+        elif self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name="user-store-flusher", daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # Logged by flush; the batch is retried next interval
+
+    def flush(self) -> int:
+        """Write every dirty record now; returns how many were written."""
+        with self._write_lock:
+            with self._lock:
+                batch = {uid: copy.deepcopy(self._records[uid]) for uid in self._dirty}
+                self._dirty.clear()
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            try:
+                self.backend.write_users(batch)
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"❌ Could not write {len(batch)} user record(s): {e}")
+                # Retried on the next flush unless updated again meanwhile
+                with self._lock:
+                    for uid in batch:
+                        self._dirty[uid] = self._dirty.get(uid, 0) + 1
+                raise
+            finally:
+                self.flush_latency.record(time.perf_counter() - started)
+            self.writes += len(batch)
+            return len(batch)
+
+    def close(self):
+        """Stop the flusher and write whatever is still dirty."""
+        self._closed = True
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached, dirty, pending = len(self._records), len(self._dirty), sum(self._dirty.values())
+        return {
+            "backend": self.backend.name,
+            "write_behind": self.write_behind,
+            "cached": cached,
+            "dirty": dirty,
+            "hits": self.hits,
+            "misses": self.misses,
+            "updates": self.updates,
+            "writes": self.writes,
+            # Updates that reached disk as part of another update's write
+            "coalesced": max(0, self.updates - pending - self.writes),
+            "write_errors": self.write_errors,
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+
+user_store = UserStore()
+# Buffered updates still reach disk when the process exits without a shutdown event
+atexit.register(user_store.flush)
+
+
+def load_user_data(uid: str) -> Dict[str, Any]:
+    """Load user data (cached)."""
+    return user_store.load(uid)
+
+
 def save_user_data(uid: str, data: Dict[str, Any]):
-    """Save user data to file."""
-    ensure_dirs()
-    user_file = get_user_file(uid)
-    with open(user_file, "w") as f:
-        json.dump(data, f, indent=2)
+    """Save user data (written behind)."""
+    user_store.save(uid, data)
+
+
+def flush_user_data() -> int:
+    """Write buffered user data now."""
+    return user_store.flush()
+
+
+def close_storage():
+    """Flush buffered user data, stop the background writer and close the backend."""
+    user_store.close()
+    if _backend is not None:
+        _backend.close()
+
+
+def open_storage():
+    """Open the backend and its indexes (blocking; run at startup)."""
+    get_storage_backend().prepare()
+
+
+def find_users(auth_status: Optional[str] = None, authenticated: Optional[bool] = None) -> List[str]:
+    """Uids with this auth_status and/or uber_authenticated, from the index."""
+    return user_store.query(auth_status, authenticated)
+
+
+def storage_stats() -> Dict[str, Any]:
+    return {**user_store.stats(), "sessions": get_storage_backend().sessions.stats()}
 
 
 def update_user_status(uid: str, auth_status: str, authenticated: bool = None):
     """Update user authentication status."""
-    data = load_user_data(uid)
-    data["auth_status"] = auth_status
-    if authenticated is not None:
-        data["uber_authenticated"] = authenticated
-    data["updated_at"] = datetime.utcnow().isoformat()
-    save_user_data(uid, data)
+    def change(data):
+        data["auth_status"] = auth_status
+        if authenticated is not None:
+            data["uber_authenticated"] = authenticated
+        data["updated_at"] = datetime.utcnow().isoformat()
+    user_store.update(uid, change)
 
 
 def save_session(uid: str, session_data: Dict[str, Any]):
-    """Save browser session to file."""
-    ensure_dirs()
-    session_file = get_session_file(uid)
-    with open(session_file, "w") as f:
-        json.dump(session_data, f, indent=2)
+    """Save browser session."""
+    get_storage_backend().save_session(uid, session_data)
 
 
 def load_session(uid: str) -> Optional[Dict[str, Any]]:
-    """Load browser session from file."""
-    session_file = get_session_file(uid)
-    if session_file.exists():
-        with open(session_file, "r") as f:
-            return json.load(f)
-    return None
+    """Load browser session."""
+    return get_storage_backend().load_session(uid)
 
 
 def delete_session(uid: str):
     """Delete user session."""
-    session_file = get_session_file(uid)
-    if session_file.exists():
-        session_file.unlink()
+    get_storage_backend().delete_session(uid)
 
 
 def record_booking(uid: str, destination: str, driver_name: str = None, eta: str = None):
-    """Record a completed booking."""
-    data = load_user_data(uid)
-    data["last_booking"] = {
+    """
+    Append a completed booking to the user's booking history.
+    Blocks on the log's write and fsync; async callers run it in a thread.
+    """
+    booking = {
         "destination": destination,
         "driver_name": driver_name,
         "eta": eta,
         "timestamp": datetime.utcnow().isoformat(),
     }
-    save_user_data(uid, data)
+    get_booking_log().append(uid, booking)
+
+
+def get_booking_history(uid: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """The user's most recent bookings, newest first."""
+    return get_booking_log().last(uid, limit)
 
 
 def set_remember_device(uid: str, remember: bool):
     """Set remember device preference."""
-    data = load_user_data(uid)
-    data["remember_device"] = remember
-    save_user_data(uid, data)
+    user_store.update(uid, lambda data: data.update(remember_device=remember))
 
 
 def save_uber_credentials(uid: str, email: str, password: str):
     """Save Uber credentials for auto re-authentication."""
-    data = load_user_data(uid)
-    data["uber_email"] = email
-    data["uber_password"] = password
-    save_user_data(uid, data)
+    user_store.update(uid, lambda data: data.update(uber_email=email, uber_password=password))
 
 
 def get_uber_credentials(uid: str) -> tuple[Optional[str], Optional[str]]:
@@ -0,0 +1,203 @@
+"""
+SQLite storage backend for users and browser sessions (STORAGE_BACKEND=sqlite).
+One database file in WAL mode replaces the users/ and sessions/ trees:
+readers never block the writer, a flush of many user records is one
+transaction, and auth_status / uber_authenticated / updated_at are indexed
+columns, so find_users never reads a record. Statements are fixed strings,
+so sqlite3's per-connection statement cache prepares each one once.
+Sessions are stored in simple_storage's compact format (zlib blobs).
+
+Migrate an existing JSON tree (safe to re-run; rows are upserted):
+    python sqlite_storage.py migrate --users users --sessions sessions --db omi_uber.db
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from simple_storage import SESSIONS_DIR, STORAGE_DB_PATH, USERS_DIR, FileBackend, SessionFormat, auth_key
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS users ("
+    "uid TEXT PRIMARY KEY, auth_status TEXT, uber_authenticated INTEGER, updated_at TEXT, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS users_auth_status ON users(auth_status, uber_authenticated)",
+    "CREATE INDEX IF NOT EXISTS users_authenticated ON users(uber_authenticated)",
+    "CREATE INDEX IF NOT EXISTS users_updated_at ON users(updated_at)",
+    "CREATE TABLE IF NOT EXISTS sessions (uid TEXT PRIMARY KEY, updated_at TEXT, data TEXT NOT NULL)",
+)
+_UPSERT_USER = (
+    "INSERT INTO users (uid, auth_status, uber_authenticated, updated_at, data) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(uid) DO UPDATE SET auth_status = excluded.auth_status, "
+    "uber_authenticated = excluded.uber_authenticated, updated_at = excluded.updated_at, data = excluded.data"
+)
+_QUERY_USERS = {
+    (False, False): "SELECT uid FROM users ORDER BY uid",
+    (True, False): "SELECT uid FROM users WHERE auth_status = ? ORDER BY uid",
+    (False, True): "SELECT uid FROM users WHERE uber_authenticated = ? ORDER BY uid",
+    (True, True): "SELECT uid FROM users WHERE auth_status = ? AND uber_authenticated = ? ORDER BY uid",
+}
+_UPSERT_SESSION = (
+    "INSERT INTO sessions (uid, updated_at, data) VALUES (?, ?, ?) "
+    "ON CONFLICT(uid) DO UPDATE SET updated_at = excluded.updated_at, data = excluded.data"
+)
+
+# Rows per transaction when migrating
+_MIGRATE_BATCH = 1000
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _user_row(uid: str, record: Dict[str, Any]) -> Tuple[str, str, int, str, str]:
+    auth_status, authenticated = auth_key(record)
+    updated_at = record.get("updated_at") or record.get("created_at") or datetime.utcnow().isoformat()
+    return uid, auth_status, int(authenticated), updated_at, _dumps(record)
+
+
+class SQLiteBackend:
+    """simple_storage backend on one WAL-mode SQLite file; one connection per thread."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.sessions = SessionFormat()
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+            if columns and "uber_authenticated" not in columns:
+                # Databases created before the column existed; backfilled from the records
+                conn.execute("ALTER TABLE users ADD COLUMN uber_authenticated INTEGER")
+                conn.execute("UPDATE users SET uber_authenticated = coalesce(json_extract(data, '$.uber_authenticated'), 0)")
+                conn.execute("DROP INDEX IF EXISTS users_auth_status")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def prepare(self):
+        """Nothing to load: the indexes live in the database."""
+
+    def read_user(self, uid: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM users WHERE uid = ?", (uid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write_users(self, records: Dict[str, Dict[str, Any]]):
+        """Upsert records in one transaction."""
+        self._write_many(_UPSERT_USER, (_user_row(uid, r) for uid, r in records.items()))
+
+    def _write_many(self, statement: str, rows: Iterable[tuple]):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(statement, rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def iter_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for uid, data in self._conn().execute("SELECT uid, data FROM users ORDER BY uid"):
+            yield uid, json.loads(data)
+
+    def query_users(self, auth_status: Optional[str] = None, authenticated: Optional[bool] = None) -> List[str]:
+        """Uids by auth_status and/or uber_authenticated, answered from the indexes."""
+        params = [p for p in (auth_status, None if authenticated is None else int(authenticated)) if p is not None]
+        sql = _QUERY_USERS[auth_status is not None, authenticated is not None]
+        return [uid for (uid,) in self._conn().execute(sql, params)]
+
+    def _decode_session(self, uid: str, data) -> Dict[str, Any]:
+        # Rows written before sessions were compressed hold JSON text
+        return self.sessions.decode(uid, data) if isinstance(data, bytes) else json.loads(data)
+
+    def save_session(self, uid: str, session_data: Dict[str, Any]):
+        blob, digest = self.sessions.encode(uid, session_data)
+        if blob is None:
+            return
+        self._conn().execute(_UPSERT_SESSION, (uid, datetime.utcnow().isoformat(), blob))
+        self.sessions.saved(uid, digest)
+
+    def load_session(self, uid: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM sessions WHERE uid = ?", (uid,)).fetchone()
+        return self._decode_session(uid, row[0]) if row else None
+
+    def delete_session(self, uid: str):
+        self._conn().execute("DELETE FROM sessions WHERE uid = ?", (uid,))
+        self.sessions.forget(uid)
+
+    def iter_sessions(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for uid, data in self._conn().execute("SELECT uid, data FROM sessions ORDER BY uid"):
+            yield uid, self._decode_session(uid, data)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate(source, target: SQLiteBackend) -> Tuple[int, int]:
+    """Copy every user and session from source (e.g. a FileBackend) into target."""
+    users = sessions = 0
+    for batch in _batched(source.iter_users(), _MIGRATE_BATCH):
+        target.write_users(dict(batch))
+        users += len(batch)
+    now = datetime.utcnow().isoformat()
+    for batch in _batched(source.iter_sessions(), _MIGRATE_BATCH):
+        target._write_many(_UPSERT_SESSION, ((uid, now, target.sessions.encode(uid, data)[0]) for uid, data in batch))
+        sessions += len(batch)
+    return users, sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite storage backend tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_cmd = commands.add_parser("migrate", help="Copy the users/ and sessions/ JSON tree into SQLite")
+    migrate_cmd.add_argument("--users", type=Path, default=USERS_DIR)
+    migrate_cmd.add_argument("--sessions", type=Path, default=SESSIONS_DIR)
+    migrate_cmd.add_argument("--db", default=STORAGE_DB_PATH)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    target = SQLiteBackend(args.db)
+    users, sessions = migrate(FileBackend(args.users, args.sessions), target)
+    target.close()
+    print(f"💾 Migrated {users} users and {sessions} sessions into {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -44,21 +44,10 @@ class UberAutomation:
             if not session_data:
                 return False, "❌ No saved session. Please authenticate first.", None, None
 
-            # Get or create persistent browser for this user
-            page = await browser_pool.get_or_create_browser(uid, session_data)
-
-            # Navigate to Uber (use desktop site, mobile is slower)
-            try:
-                await page.goto("https://www.uber.com", wait_until="domcontentloaded", timeout=30000)
-            except Exception as e:
-                print(f"Navigation error: {e}, trying reload...")
-                try:
-                    await page.reload(wait_until="domcontentloaded")
-                except:
-                    pass
-            
-            # Wait for page to stabilize
-            await asyncio.sleep(2)
+            # The user's page in the shared browser pool, already on the booking
+            # form when it was kept warm; otherwise navigated (desktop site) now
+            page, warm = await browser_pool.acquire(uid, session_data)
+            print(f"{'Warm' if warm else 'Cold'} booking page for {uid}")
 
             # Handle any security challenges
             challenge_handled = await self._handle_security_challenges(page)
@@ -407,8 +396,8 @@ class UberAutomation:
             # Extract ride details
             driver_name, eta = await self._extract_ride_details(page)
 
-            # Record booking
-            record_booking(uid, f"{start_location} → {end_location}", driver_name, eta)
+            # Record booking (the log write is fsynced, so keep it off the event loop)
+            await asyncio.to_thread(record_booking, uid, f"{start_location} → {end_location}", driver_name, eta)
 
             # Keep browser alive for next request (don't close)
             message = f"🚗 Booked from {start_location} to {end_location}!"
@@ -424,6 +413,9 @@ class UberAutomation:
         except Exception as e:
             print(f"Error booking ride: {e}")
             return False, f"❌ Error: {str(e)}", None, None
+        finally:
+            # Parks the page on the booking form again for the next request
+            browser_pool.release(uid)
 
     async def _check_login_required(self, page) -> bool:
         """Check if login is required (session expired)."""
@@ -0,0 +1,151 @@
+"""
+Streaming end-of-utterance detection for conversation buckets.
+Decides, as each segment lands, how long the silence window should be:
+complete ride requests flush almost immediately, and everything else waits
+for a window learned from that user's own pauses between segments.
+"""
+
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from metrics import LatencyStats
+from ride_detector import TRIGGER_PATTERN
+
+# Bounds for the learned per-user window
+EOU_MIN_WAIT = float(os.getenv("EOU_MIN_WAIT", "1.5"))
+EOU_MAX_WAIT = float(os.getenv("EOU_MAX_WAIT", "8"))
+# Grace period once the text already reads as a complete request
+EOU_EARLY_WAIT = float(os.getenv("EOU_EARLY_WAIT", "0.4"))
+# Window = mean gap + EOU_GAP_SIGMAS * std dev of gaps
+EOU_GAP_SIGMAS = float(os.getenv("EOU_GAP_SIGMAS", "3"))
+EOU_MIN_SAMPLES = int(os.getenv("EOU_MIN_SAMPLES", "5"))
+EOU_MAX_USERS = int(os.getenv("EOU_MAX_USERS", "100000"))
+
+# Gaps longer than this are separate conversations, not pauses mid-sentence
+_MAX_GAP = 30.0
+# Smoothing factor for the exponentially weighted gap statistics
+_ALPHA = 0.2
+
+DESTINATION_PATTERN = re.compile(r"\b(to|towards)\s+(?!(?:the|a|an|my)\s*[.!?]*\s*$)\w+", re.IGNORECASE)
+TERMINAL_PATTERN = re.compile(r"[.!?][\"')\]]*\s*$")
+
+
+class GapStats:
+    """Exponentially weighted mean/variance of one user's inter-segment gaps."""
+
+    __slots__ = ("mean", "var", "samples")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+
+    def add(self, gap: float):
+        if self.samples == 0:
+            self.mean = gap
+        else:
+            delta = gap - self.mean
+            self.mean += _ALPHA * delta
+            self.var = (1 - _ALPHA) * (self.var + _ALPHA * delta * delta)
+        self.samples += 1
+
+
+def is_complete_request(text: str) -> bool:
+    """
+    Whether the text already reads as a whole ride request:
+    a trigger phrase, a destination after it, and terminal punctuation.
+    """
+    if not text or not TERMINAL_PATTERN.search(text):
+        return False
+    trigger = TRIGGER_PATTERN.search(text)
+    if not trigger:
+        return False
+    return bool(DESTINATION_PATTERN.search(text, trigger.start()))
+
+
+class EndOfUtteranceDetector:
+    """
+    Chooses each bucket's silence window and tracks the latency it saves.
+    default_wait is the fixed window used until a user has enough gap samples.
+    """
+
+    def __init__(
+        self,
+        default_wait: float,
+        min_wait: float = EOU_MIN_WAIT,
+        max_wait: float = EOU_MAX_WAIT,
+        early_wait: float = EOU_EARLY_WAIT,
+        max_users: int = EOU_MAX_USERS,
+    ):
+        self.default_wait = default_wait
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.early_wait = early_wait
+        self.max_users = max_users
+        self._gaps: "OrderedDict[str, GapStats]" = OrderedDict()
+        self.saved = LatencyStats()
+        self.early_flushes = 0
+        self.adaptive_flushes = 0
+        self.default_flushes = 0
+
+    def observe_gap(self, uid: str, gap: float):
+        """Learn from the pause between two consecutive segments of one user."""
+        if gap < 0 or gap > _MAX_GAP:
+            return
+        stats = self._gaps.get(uid)
+        if stats is None:
+            stats = self._gaps[uid] = GapStats()
+            if len(self._gaps) > self.max_users:
+                self._gaps.popitem(last=False)
+        else:
+            self._gaps.move_to_end(uid)
+        stats.add(gap)
+
+    def silence_window(self, uid: str) -> float:
+        """Silence needed before flushing this user's bucket."""
+        stats = self._gaps.get(uid)
+        if stats is None or stats.samples < EOU_MIN_SAMPLES:
+            return self.default_wait
+        window = stats.mean + EOU_GAP_SIGMAS * stats.var ** 0.5
+        return min(self.max_wait, max(self.min_wait, window))
+
+    def wait_time(self, uid: str, text: str) -> float:
+        """Window to arm after a new segment, given the bucket's text so far."""
+        if is_complete_request(text):
+            return min(self.early_wait, self.silence_window(uid))
+        return self.silence_window(uid)
+
+    def record_flush(self, uid: str, text: str, waited: float):
+        """Record how much of the fixed default window a flush avoided."""
+        if is_complete_request(text) and waited < self.silence_window(uid):
+            self.early_flushes += 1
+        elif uid in self._gaps and self._gaps[uid].samples >= EOU_MIN_SAMPLES:
+            self.adaptive_flushes += 1
+        else:
+            self.default_flushes += 1
+        self.saved.record(max(0.0, self.default_wait - waited))
+
+    def user_stats(self, uid: str) -> Optional[Dict[str, Any]]:
+        """Learned gap statistics for one user, if any."""
+        stats = self._gaps.get(uid)
+        if stats is None:
+            return None
+        return {
+            "mean_gap": round(stats.mean, 3),
+            "std_gap": round(stats.var ** 0.5, 3),
+            "samples": stats.samples,
+            "window": round(self.silence_window(uid), 3),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Flush counters and p50/p95 of latency saved versus the default window."""
+        return {
+            "default_wait": self.default_wait,
+            "tracked_users": len(self._gaps),
+            "early_flushes": self.early_flushes,
+            "adaptive_flushes": self.adaptive_flushes,
+            "default_flushes": self.default_flushes,
+            "latency_saved": self.saved.snapshot(),
+        }